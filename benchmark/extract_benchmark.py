@@ -0,0 +1,189 @@
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+import statistics
+
+# Allows running the script directly, from the root directory of the project.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark.mock_api_server import MockAPIServer
+from common.country_index import CountryIndex
+from extract.api_client import create_session
+from extract.covid_api import CovidAPI
+from extract.data_extractor import DataExtractor
+from extract.extract import e_routine
+from extract.async_extract import async_e_routine
+from extract.weather_api import WeatherAPI
+
+class MemoryExtractor(DataExtractor):
+    def __init__(self):
+        """
+        Initializes the MemoryExtractor object, which keeps the extract logs
+        in memory instead of in the database, so that the benchmark measures
+        the extract alone and runs without a database.
+
+        Attributes:
+            api_logs (dict): The API import log records, by ID.
+            import_logs (list): The import log records.
+            logger: A logger that discards the records.
+        """
+
+        self.api_logs = {}
+        self.import_logs = []
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.logger.addHandler(logging.NullHandler())
+        self.logger.propagate = False
+
+    def fetch_import_history(self, start_date, end_date):
+        """
+        Reports an empty history, so that every file is extracted.
+        """
+
+        return {}
+
+    def insert_initial_api_import_logs(self, rows):
+        """
+        Keeps the initial API import log records and hands out their IDs.
+        """
+
+        log_ids = list(range(len(self.api_logs) + 1, len(self.api_logs) + len(rows) + 1))
+        self.api_logs.update(zip(log_ids, rows))
+        return log_ids
+
+    def update_api_import_logs(self, rows):
+        """
+        Completes the API import log records.
+        """
+
+        for row in rows:
+            self.api_logs[row[-1]] = row
+
+    def insert_import_logs(self, rows):
+        """
+        Keeps the import log records.
+        """
+
+        self.import_logs.extend(rows)
+
+    def rollback_transaction(self):
+        """
+        Reports that the extract failed, since there is no transaction to roll back.
+        """
+
+        print("The extract failed and was rolled back!")
+
+    def close_connection(self):
+        """
+        Does nothing, since there is no connection to close.
+        """
+
+def generate_countries(count):
+    """
+    Generates made-up countries, spread over the globe.
+
+    Args:
+        count (int): The number of countries.
+
+    Returns:
+        countries (CountryIndex object): Shaped like the extract.country table.
+    """
+
+    return CountryIndex([{
+        "id": i + 1,
+        "code": f"B{i:03d}",
+        "name": f"Benchmark country {i}",
+        "latitude": round(-60 + 120 * i / max(count, 1), 4),
+        "longitude": round(-180 + 360 * i / max(count, 1), 4),
+    } for i in range(count)])
+
+def percentile(values, share):
+    """
+    Computes a percentile of a list of values.
+
+    Args:
+        values (list): The values.
+        share (float): The percentile, between 0 and 1.
+
+    Returns:
+        value (float): The percentile, or 0 if there are no values.
+    """
+
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100, method="inclusive")[int(share * 100) - 1]
+
+def run_benchmark(args):
+    """
+    Runs e_routine, or async_e_routine, against the mock APIs, in a temporary
+    working directory, and reports the throughput and latency of the requests.
+    The latency is only measured with the threads engine.
+
+    Args:
+        args (argparse.Namespace): The parsed command line arguments.
+    """
+
+    mock = MockAPIServer(latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000,
+                         error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+                         retry_after=args.retry_after, empty_rate=args.empty_rate)
+    mock.start()
+
+    # Both mock APIs share a host, hence a single per-host pool for all workers.
+    latencies = []
+    session = create_session(pool_maxsize=args.weather_workers + args.covid_workers)
+    session.hooks["response"].append(
+        lambda response, *_, **__: latencies.append(response.elapsed.total_seconds())
+    )
+    settings = {"session": session, "max_retries": args.max_retries, "backoff_cap": args.retry_after}
+
+    working_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.chdir(temp_dir)
+        try:
+            weather_api = WeatherAPI(1, mock.weather_url, **settings)
+            covid_api = CovidAPI(2, mock.covid_url, **settings)
+            db = MemoryExtractor()
+
+            start = time.perf_counter()
+            routine = async_e_routine if args.extract_engine == "async" else e_routine
+            routine(weather_api, covid_api, db, generate_countries(args.countries),
+                    args.start_date, end_date=args.end_date,
+                    weather_workers=args.weather_workers, covid_workers=args.covid_workers,
+                    weather_batch_size=args.weather_batch_size)
+            wall_time = time.perf_counter() - start
+        finally:
+            os.chdir(working_dir)
+            session.close()
+            mock.stop()
+
+    request_count = mock.server.request_count
+    print(f"Engine:           {args.extract_engine}")
+    print(f"Countries:        {args.countries}")
+    print(f"Files written:    {len(db.import_logs)}")
+    print(f"HTTP requests:    {request_count}")
+    print(f"Wall time:        {wall_time:.2f} s")
+    print(f"Requests/sec:     {request_count / wall_time:.1f}")
+    if latencies:
+        print(f"Latency p50:      {percentile(latencies, 0.5) * 1000:.1f} ms")
+        print(f"Latency p95:      {percentile(latencies, 0.95) * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="-- Benchmark the extract against mock APIs --")
+    parser.add_argument("--countries", type=int, default=200)
+    parser.add_argument("--start-date", type=str, default="2022-01-01")
+    parser.add_argument("--end-date", type=str)
+    parser.add_argument("--extract-engine", choices=["threads", "async"], default="threads")
+    parser.add_argument("--weather-workers", type=int, default=4)
+    parser.add_argument("--covid-workers", type=int, default=4)
+    parser.add_argument("--weather-batch-size", type=int, default=1)
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=10)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--empty-rate", type=float, default=0.05)
+
+    run_benchmark(parser.parse_args())
@@ -0,0 +1,117 @@
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+# Allows running the script directly, from the root directory of the project.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import json_backend
+from common.utils import WEATHER_DAILY_VARIABLES, RAW_FORMATS, save_to_json, open_file
+
+def generate_weather_payload(days, variables, seed=0):
+    """
+    Generates a Weather API response shaped like the ones of Open-Meteo, with
+    one array per daily variable, on top of the time array.
+
+    Args:
+        days (int): The number of days, i.e. the length of every array.
+        variables (int): The number of daily variables. The ones consumed by the
+            transform come first, the others are made up.
+        seed (int): The seed of the random values.
+
+    Returns:
+        payload (dict): The response body.
+    """
+
+    rng = random.Random(seed)
+    names = list(WEATHER_DAILY_VARIABLES) + [f"variable_{i}" for i in range(variables)]
+    daily_units = {"time": "iso8601"}
+    daily = {"time": [f"2022-{1 + i // 28 % 12:02d}-{1 + i % 28:02d}" for i in range(days)]}
+    for name in names[:variables]:
+        daily_units[name] = "unit"
+        if name == "weather_code":
+            daily[name] = [rng.choice([0, 1, 2, 3, 45, 61, 63, 71, 80, 95]) for _ in range(days)]
+        else:
+            daily[name] = [round(rng.uniform(-30, 1030), 1) for _ in range(days)]
+
+    return {
+        "latitude": 47.0, "longitude": 28.875, "generationtime_ms": 0.123,
+        "utc_offset_seconds": 0, "timezone": "GMT", "timezone_abbreviation": "GMT",
+        "elevation": 80.0, "daily_units": daily_units, "daily": daily,
+    }
+
+def measure(function, iterations):
+    """
+    Measures the mean duration of a function call.
+
+    Args:
+        function: The function, called without arguments.
+        iterations (int): The number of calls.
+
+    Returns:
+        duration (float): The mean duration in seconds.
+    """
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - start) / iterations
+
+def run_benchmark(args):
+    """
+    Compares the available JSON backends on a generated Weather API payload:
+    decoding and encoding in memory, and reading back a raw file saved in
+    each of the RAW_FORMATS with common.utils.open_file.
+
+    Args:
+        args (argparse.Namespace): The parsed command line arguments.
+    """
+
+    payload = generate_weather_payload(args.days, args.variables)
+    content = json_backend.JSON_BACKENDS["json"].dumps(payload)
+    print(f"Payload:          {args.variables} daily variables x {args.days} days, "
+          f"{len(content) / 1024:.1f} KiB")
+
+    backends = [name for name in json_backend.JSON_BACKENDS if name in args.backends or not args.backends]
+    baseline = {}
+    working_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.chdir(temp_dir)
+        try:
+            for name in backends:
+                json_backend.use_json_backend(name)
+                backend = json_backend.get_json_backend()
+                results = {
+                    "loads": measure(lambda: backend.loads(content), args.iterations),
+                    "dumps": measure(lambda: backend.dumps(payload), args.iterations),
+                }
+                for raw_format in RAW_FORMATS:
+                    file_name = f"w_BEN_2022-01-01.{raw_format}"
+                    save_to_json(payload, "raw", file_name)
+                    file_path = os.path.join("raw", file_name)
+                    results[f"open {raw_format}"] = measure(lambda: open_file(file_path), args.iterations)
+
+                print(f"\nBackend:          {name}")
+                for operation, duration in results.items():
+                    speedup = ""
+                    if operation in baseline:
+                        speedup = f" ({baseline[operation] / duration:.1f}x)"
+                    print(f"{operation + ':':<18}{duration * 1000:.3f} ms{speedup}")
+                if not baseline:
+                    baseline = results
+        finally:
+            os.chdir(working_dir)
+            json_backend.use_json_backend()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="-- Benchmark the JSON backends on weather payloads --")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--variables", type=int, default=70)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--backends", nargs="*", default=[],
+                        help="The backends to compare, by default all available ones.")
+
+    run_benchmark(parser.parse_args())
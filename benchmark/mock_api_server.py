@@ -0,0 +1,225 @@
+import json
+import time
+import random
+import argparse
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+WEATHER_PATH = "/v1/forecast"
+COVID_PATH = "/api/reports/total"
+
+class MockAPIHandler(BaseHTTPRequestHandler):
+    """
+    Answers the requests sent to the mock server with responses shaped like
+    the ones of the Weather API (Open-Meteo) and the COVID API (covid-api.com).
+    The behaviour is driven by the settings of the server (see MockAPIServer).
+    HTTP/1.1 keeps the connections alive, like the real APIs do.
+    """
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        """
+        Silences the default logging of every request to stderr.
+        """
+
+    def do_GET(self):
+        """
+        Handles a GET request, after the configured latency. A share of the
+        requests is answered with HTTP 429 or HTTP 500, as configured.
+        """
+
+        settings = self.server.settings
+        with self.server.lock:
+            self.server.request_count += 1
+        time.sleep(max(random.gauss(settings["latency"], settings["jitter"]), 0))
+
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+        draw = random.random()
+        if draw < settings["throttle_rate"]:
+            self._send_json(429, {"message": "Too Many Attempts."},
+                            {"Retry-After": str(settings["retry_after"])})
+        elif draw < settings["throttle_rate"] + settings["error_rate"]:
+            self._send_json(500, {"message": "Server Error"})
+        elif url.path == WEATHER_PATH:
+            self._send_json(*weather_response(params))
+        elif url.path == COVID_PATH:
+            self._send_json(*covid_response(params, settings["empty_rate"]))
+        else:
+            self._send_json(404, {"message": "Not Found"})
+
+    def _send_json(self, status_code, body, headers=None):
+        """
+        Sends a JSON response.
+
+        Args:
+            status_code (int): The HTTP status code.
+            body: Anything that can be represented by JSON.
+            headers (dict): Additional headers.
+        """
+
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+def weather_response(params):
+    """
+    Builds a response of the Weather API, with made-up values for every
+    requested daily variable and date, and one result per location.
+
+    Args:
+        params (dict): The query parameters of the request.
+
+    Returns:
+        status_code (int): The HTTP status code.
+        body (dict or list): The response body.
+    """
+
+    try:
+        latitudes = [float(value) for value in params["latitude"].split(",")]
+        longitudes = [float(value) for value in params["longitude"].split(",")]
+        start = datetime.strptime(params["start_date"], "%Y-%m-%d")
+        end = datetime.strptime(params.get("end_date", params["start_date"]), "%Y-%m-%d")
+        variables = params["daily"].split(",")
+        if len(latitudes) != len(longitudes) or end < start:
+            raise ValueError
+    except (KeyError, ValueError):
+        return 400, {"error": True, "reason": "Invalid request parameters"}
+
+    dates = [(start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range((end - start).days + 1)]
+    results = []
+    for latitude, longitude in zip(latitudes, longitudes):
+        daily = {"time": dates}
+        for variable in variables:
+            if variable == "weather_code":
+                daily[variable] = [random.choice([0, 1, 2, 3, 61, 71]) for _ in dates]
+            else:
+                daily[variable] = [round(random.uniform(0, 100), 1) for _ in dates]
+        results.append({
+            "latitude": latitude,
+            "longitude": longitude,
+            "generationtime_ms": 0.5,
+            "utc_offset_seconds": 3600,
+            "timezone": params.get("timezone", "GMT"),
+            "daily_units": {variable: "" for variable in daily},
+            "daily": daily,
+        })
+
+    return 200, results if len(results) > 1 else results[0]
+
+def covid_response(params, empty_rate=0.0):
+    """
+    Builds a response of the COVID API. Like the real API, an unknown ISO code
+    is answered with HTTP 200 and an empty data array, which happens here for
+    a share of empty_rate of the requests.
+
+    Args:
+        params (dict): The query parameters of the request.
+        empty_rate (float): The share of requests answered with empty data.
+
+    Returns:
+        status_code (int): The HTTP status code.
+        body (dict): The response body.
+    """
+
+    if "iso" not in params or "date" not in params:
+        return 422, {
+            "title": "HTTP Unprocessable Entity",
+            "code": 0,
+            "message": "The given data was invalid.",
+            "error": {"iso": ["The iso field is required."]},
+        }
+
+    if random.random() < empty_rate:
+        return 200, {"data": []}
+
+    data = {"date": params["date"], "last_update": f"{params['date']} 04:20:00"}
+    for field in ("confirmed", "deaths", "recovered", "active"):
+        data[field] = random.randint(0, 100000)
+        data[field + "_diff"] = random.randint(0, 1000)
+    data["fatality_rate"] = round(data["deaths"] / max(data["confirmed"], 1), 4)
+    return 200, {"data": data}
+
+class MockAPIServer:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.05, jitter=0.01,
+                 error_rate=0.0, throttle_rate=0.0, retry_after=1, empty_rate=0.0):
+        """
+        Initializes the MockAPIServer object, a local stand-in for both APIs,
+        served from a background thread.
+
+        Args:
+            host (str): The host to bind to.
+            port (int): The port to bind to. 0 picks a free port.
+            latency (float): The mean latency of a response, in seconds.
+            jitter (float): The standard deviation of the latency, in seconds.
+            error_rate (float): The share of requests answered with HTTP 500.
+            throttle_rate (float): The share of requests answered with HTTP 429.
+            retry_after (int): The Retry-After value sent along HTTP 429.
+            empty_rate (float): The share of COVID API requests answered
+                with HTTP 200 and empty data.
+
+        Attributes:
+            server (ThreadingHTTPServer object): It also counts the
+                requests received, in server.request_count.
+            weather_url (str): The base URL of the mock Weather API.
+            covid_url (str): The base URL of the mock COVID API.
+        """
+
+        self.server = ThreadingHTTPServer((host, port), MockAPIHandler)
+        self.server.daemon_threads = True
+        self.server.request_count = 0
+        self.server.lock = threading.Lock()
+        self.server.settings = {
+            "latency": latency,
+            "jitter": jitter,
+            "error_rate": error_rate,
+            "throttle_rate": throttle_rate,
+            "retry_after": retry_after,
+            "empty_rate": empty_rate,
+        }
+        host, port = self.server.server_address[:2]
+        self.weather_url = f"http://{host}:{port}{WEATHER_PATH}"
+        self.covid_url = f"http://{host}:{port}{COVID_PATH}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        """
+        Starts serving requests in the background.
+        """
+
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops serving requests.
+        """
+
+        self.server.shutdown()
+        self.server.server_close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="-- Mock Weather and COVID APIs --")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=10)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--empty-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    mock = MockAPIServer(port=args.port, latency=args.latency_ms / 1000,
+                         jitter=args.jitter_ms / 1000, error_rate=args.error_rate,
+                         throttle_rate=args.throttle_rate, empty_rate=args.empty_rate)
+    print(f"Weather API: {mock.weather_url}")
+    print(f"COVID API: {mock.covid_url}")
+    mock.server.serve_forever()
@@ -0,0 +1,263 @@
+import os
+import json
+import gzip
+import lzma
+from common import json_backend
+
+# The storage formats of the raw bundles, by file extension, mapped to the
+# functions compressing and decompressing a single record. Every record is
+# compressed on its own, as a separate gzip member or xz stream, so that it can
+# be read back from its byte offset without decompressing the records before it.
+BUNDLE_FORMATS = {
+    "ndjson": (None, None),
+    "ndjson.gz": (gzip.compress, gzip.decompress),
+    "ndjson.xz": (lzma.compress, lzma.decompress),
+}
+
+INDEX_EXTENSION = "idx"
+
+def bundle_file_name(api_type, date, end_date=None, raw_format="json"):
+    """
+    Builds the name of the bundle holding the responses of an API for a
+    given date, or range of dates, for all countries.
+
+    Args:
+        api_type (str): Either "c" (COVID) or "w" (weather).
+        date (str): A given date, or the first date of a range.
+        end_date (str): The last date of a range, if applicable.
+        raw_format (str): The storage format of the records, one of the keys
+            of common.utils.RAW_FORMATS, i.e. json, json.gz or json.xz.
+
+    Returns:
+        file_name (str): The name of the bundle, e.g. w_2022-01-01.ndjson.gz.
+    """
+
+    if end_date and end_date != date:
+        return f"{api_type}_{date}_{end_date}.nd{raw_format}"
+    return f"{api_type}_{date}.nd{raw_format}"
+
+def split_bundle_format(file_name):
+    """
+    Splits the name of a bundle into its stem and its storage format.
+
+    Args:
+        file_name (str): The name of the file.
+
+    Returns:
+        stem (str): The name of the file without the extension.
+        bundle_format (str): One of the keys of BUNDLE_FORMATS, or None
+            if the file is not a bundle.
+    """
+
+    for bundle_format in sorted(BUNDLE_FORMATS, key=len, reverse=True):
+        if file_name.endswith("." + bundle_format):
+            return file_name[:-len(bundle_format) - 1], bundle_format
+    return file_name, None
+
+def index_path(dir_name, stem):
+    """
+    Builds the path of the index of a bundle. The index is shared by the
+    bundles with the same stem, whatever their storage format.
+
+    Args:
+        dir_name (str): The directory of the bundle.
+        stem (str): The name of the bundle without the extension.
+
+    Returns:
+        path (str): The path to the index.
+    """
+
+    return os.path.join(dir_name, f"{stem}.{INDEX_EXTENSION}")
+
+def is_bundle_file(file_name):
+    """
+    Checks whether a file is a bundle or the index of a bundle.
+
+    Args:
+        file_name (str): The name of the file.
+
+    Returns:
+        bool: True if the file belongs to a bundle.
+    """
+
+    return file_name.endswith("." + INDEX_EXTENSION) or split_bundle_format(file_name)[1] is not None
+
+def read_bundle_index(path):
+    """
+    Reads the index of a bundle. The index is itself newline-delimited JSON,
+    which is only ever appended to: the extract appends one entry per record,
+    with the file, byte offset and length of the record, and the transform
+    appends the status of the records it processed. The later entries of a
+    country take precedence over the earlier ones.
+
+    Args:
+        path (str): The path to the index.
+
+    Returns:
+        entries (dict): The entry of each record, by country code, containing
+            the keys code, file, offset, length, status and row_count.
+    """
+
+    entries = {}
+    try:
+        with open(path, "r", encoding="utf-8") as infile:
+            for line in infile:
+                try:
+                    update = json.loads(line)
+                except json.JSONDecodeError:
+                    # A line cut short by a crash is ignored.
+                    continue
+                entries[update["code"]] = {**entries.get(update["code"], {}), **update}
+    except FileNotFoundError:
+        pass
+    return entries
+
+def update_bundle_index(path, updates):
+    """
+    Appends entries to the index of a bundle, with a single write.
+
+    Args:
+        path (str): The path to the index.
+        updates (list of dict): The entries, each containing at least the code key.
+    """
+
+    if not updates:
+        return
+
+    lines = "".join(json.dumps(update, separators=(",", ":")) + "\n" for update in updates)
+    with open(path, "a", encoding="utf-8") as outfile:
+        outfile.write(lines)
+
+def read_bundle_records(dir_name, entries):
+    """
+    Streams the records of a bundle, one at a time, in the order in which they
+    are stored, so that every bundle file is opened once and read forward.
+
+    Args:
+        dir_name (str): The directory of the bundle.
+        entries (list of dict): Entries of the index, as returned by read_bundle_index.
+
+    Yields:
+        entry (dict): The entry of the record.
+        data: The data of the record, or None if it cannot be read.
+    """
+
+    infile, current_file = None, None
+    try:
+        for entry in sorted(entries, key=lambda entry: (entry["file"], entry["offset"])):
+            if entry["file"] != current_file:
+                if infile is not None:
+                    infile.close()
+                current_file = entry["file"]
+                try:
+                    infile = open(os.path.join(dir_name, current_file), "rb")
+                except FileNotFoundError:
+                    infile = None
+
+            data = None
+            if infile is not None:
+                _, decompress = BUNDLE_FORMATS.get(split_bundle_format(current_file)[1], (None, None))
+                infile.seek(entry["offset"])
+                try:
+                    content = infile.read(entry["length"])
+                    data = json_backend.loads(decompress(content) if decompress else content)
+                except (EOFError, OSError, lzma.LZMAError, json_backend.JSONDecodeError):
+                    pass
+            yield entry, data
+    finally:
+        if infile is not None:
+            infile.close()
+
+def list_bundled_records(*directories):
+    """
+    Lists the records present in the bundles of the given directories,
+    leaving out the ones the transform routed to the error status.
+
+    Args:
+        *directories (str): The directories to be scanned.
+
+    Returns:
+        records (set of tuple): The (stem, code) pair of each record.
+    """
+
+    records = set()
+    for directory in directories:
+        if not os.path.isdir(directory):
+            continue
+        for entry in os.scandir(directory):
+            if entry.is_file() and entry.name.endswith("." + INDEX_EXTENSION):
+                stem = entry.name[:-len(INDEX_EXTENSION) - 1]
+                records.update((stem, code) for code, index_entry in read_bundle_index(entry.path).items()
+                               if index_entry.get("status") != "error")
+    return records
+
+class BundleWriter:
+    def __init__(self):
+        """
+        Initializes the BundleWriter object, which appends the API responses of
+        the extract to newline-delimited JSON bundles, one per API and batch date,
+        instead of saving one file per country. Each record is flushed before its
+        entry is appended to the index, so the index never points past the data.
+
+        Attributes:
+            files (dict): The open bundle files and indexes, by path.
+        """
+
+        self.files = {}
+
+    def _open(self, path, mode):
+        """
+        Opens a file for appending, once per run.
+
+        Args:
+            path (str): The path to the file.
+            mode (str): Either "ab" or "a".
+
+        Returns:
+            file: The open file.
+        """
+
+        outfile = self.files.get(path)
+        if outfile is None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            outfile = self.files[path] = open(path, mode)
+        return outfile
+
+    def append(self, dir_name, file_name, code, data):
+        """
+        Appends a record to a bundle and its entry to the index of the bundle.
+
+        Args:
+            dir_name (str): The directory of the bundle.
+            file_name (str): The name of the bundle, as built by bundle_file_name.
+            code (str): ISO code of the country the record is about.
+            data: The data of the record.
+        """
+
+        stem, bundle_format = split_bundle_format(file_name)
+        compress, _ = BUNDLE_FORMATS[bundle_format]
+
+        outfile = self._open(os.path.join(dir_name, file_name), "ab")
+        content = json_backend.dumps(data) + b"\n"
+        if compress:
+            content = compress(content)
+
+        offset = outfile.tell()
+        outfile.write(content)
+        outfile.flush()
+
+        index_file = self._open(index_path(dir_name, stem), "a")
+        index_file.write(json.dumps({
+            "code": code, "file": file_name, "offset": offset,
+            "length": len(content), "status": "raw", "row_count": None,
+        }, separators=(",", ":")) + "\n")
+        index_file.flush()
+
+    def close(self):
+        """
+        Closes the open bundle files.
+        """
+
+        for outfile in self.files.values():
+            outfile.close()
+        self.files = {}
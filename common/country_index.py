@@ -0,0 +1,52 @@
+class CountryIndex:
+    def __init__(self, records):
+        """
+        Initializes the CountryIndex object, the countries of the extract.country
+        table held as plain records, with a hash index from the ISO code to the ID.
+        It is built once per run and replaces the filtering of a DataFrame for
+        every file or API call.
+
+        Args:
+            records (list of dict): The records of the extract.country table,
+                with at least the id and code keys.
+
+        Attributes:
+            records (list of dict): The records of the extract.country table.
+            ids (dict): The ID of each country, by ISO code.
+        """
+
+        self.records = list(records)
+        self.ids = {record["code"]: int(record["id"]) for record in self.records}
+
+    @classmethod
+    def from_dataframe(cls, countries):
+        """
+        Builds the index of a DataFrame shaped like the extract.country table.
+
+        Args:
+            countries (DataFrame): DataFrame created based on the extract.country table.
+
+        Returns:
+            index (CountryIndex object)
+        """
+
+        return cls(countries.to_dict("records"))
+
+    def get_id(self, code):
+        """
+        Looks up the ID of a country.
+
+        Args:
+            code (str): ISO code of the country.
+
+        Returns:
+            country_id (int): The ID of the country, or None if it is unknown.
+        """
+
+        return self.ids.get(code)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __len__(self):
+        return len(self.records)
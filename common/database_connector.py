@@ -1,11 +1,135 @@
+import os
 import re
-from psycopg2 import connect, Error
+import threading
+from contextlib import contextmanager
+from psycopg2 import Error
+from psycopg2.pool import ThreadedConnectionPool, PoolError
 from pandas import DataFrame
 from common.logger import ETLLogger
+from common.country_index import CountryIndex
+
+class BlockingConnectionPool(ThreadedConnectionPool):
+    def __init__(self, min_size, max_size, timeout=30, **db_config):
+        """
+        Initializes the BlockingConnectionPool object, a thread-safe pool of
+        connections which, once max_size connections are checked out, waits
+        for one to be put back instead of failing at once.
+
+        Args:
+            min_size (int): The number of idle connections kept open.
+            max_size (int): The maximum number of open connections.
+            timeout (float): The number of seconds to wait for a connection.
+            **db_config (dict): PostgreSQL database connection parameters.
+
+        Attributes:
+            timeout (float): The number of seconds to wait for a connection.
+        """
+
+        super().__init__(min_size, max_size, **db_config)
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_size)
+
+    def getconn(self, key=None):
+        """
+        Checks out a connection, opening a new one if none is idle.
+
+        Raises:
+            PoolError: If no connection is put back within the timeout.
+        """
+
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolError(f"No connection was available within {self.timeout} seconds.")
+        try:
+            return super().getconn(key)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, key=None, close=False):
+        """
+        Puts back a connection, which is closed if close is True, or if
+        min_size connections are already idle.
+        """
+
+        try:
+            super().putconn(conn, key, close)
+        finally:
+            self._slots.release()
+
+# The sizes of the pools, as set by configure_connection_pool.
+_pool_settings = {"min_size": 1, "max_size": 10, "timeout": 30}
+
+# The pools of the current process, by connection parameters.
+_pools = {}
+_pools_pid = None
+_pools_lock = threading.Lock()
+
+def configure_connection_pool(min_size=1, max_size=10, timeout=30):
+    """
+    Sets the sizes of the connection pools created afterwards in the
+    current process, i.e. before the first query.
+
+    Args:
+        min_size (int): The number of idle connections kept open.
+        max_size (int): The maximum number of open connections.
+        timeout (float): The number of seconds to wait for a connection.
+    """
+
+    _pool_settings.update(min_size=min_size, max_size=max_size, timeout=timeout)
+
+def get_connection_pool(**db_config):
+    """
+    Returns the connection pool of the current process for the given connection
+    parameters, which is created on first use. A process forked from another
+    one creates pools of its own, instead of sharing the connections.
+
+    Args:
+        **db_config (dict): PostgreSQL database connection parameters.
+
+    Returns:
+        pool (BlockingConnectionPool object)
+    """
+
+    global _pools_pid
+    key = tuple(sorted(db_config.items()))
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            _pools.clear()
+            _pools_pid = os.getpid()
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = BlockingConnectionPool(**_pool_settings, **db_config)
+        return pool
+
+def is_healthy(connection):
+    """
+    Checks whether a pooled connection can still be used, e.g. after the
+    server closed it, with a round trip to the server.
+
+    Args:
+        connection: A connection to the database.
+
+    Returns:
+        healthy (bool)
+    """
+
+    if connection.closed:
+        return False
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1;")
+        connection.rollback()
+        return True
+    except Error:
+        return False
+
 class DatabaseConnector:
     def __init__(self, **db_config):
         """
-        Initialize the DatabaseConnector object.
+        Initialize the DatabaseConnector object. The connection is checked out
+        from the connection pool of the process on first use, and put back by
+        close_connection, so that the objects of every stage, worker thread or
+        dashboard session share the open connections.
 
         Args:
             **db_config (dict): PostgreSQL database connection parameters.
@@ -17,19 +141,116 @@ class DatabaseConnector:
                     port (int): The port number.
 
         Attributes:
-            connection: A live connection to the database.
+            db_config (dict): The connection parameters, e.g. for opening
+                another connection from a background thread.
+            connection: A live connection to the database, checked out
+                from the pool on first access.
             cursor: A cursor object associated with the connection.
+            in_transaction (bool): Whether the queries are part of a transaction
+                opened by transaction(), instead of being committed one by one.
             logger: A logger instance with the proper
                 parametrization done by a ETLLogger object.
         """
 
-        self.connection = connect(**db_config)
-        self.cursor = self.connection.cursor()
+        self.db_config = db_config
+        self._pool = None
+        self._connection = None
+        self._cursor = None
+        self.in_transaction = False
 
         etl_logger = ETLLogger(self.__class__.__name__)
         self.logger = etl_logger.get_logger()
+
+    def _check_out(self):
+        """
+        Checks out a healthy connection from the pool, discarding the
+        broken ones, and opens its cursor.
+        """
+
+        self._pool = get_connection_pool(**self.db_config)
+        connection = self._pool.getconn()
+        while not is_healthy(connection):
+            self.logger.warning("Discarding a broken pooled connection!")
+            self._pool.putconn(connection, close=True)
+            connection = self._pool.getconn()
+
+        self._connection = connection
+        self._cursor = connection.cursor()
         self.logger.info("Connection to the database was established!")
 
+    @property
+    def connection(self):
+        """
+        Returns:
+            connection: The connection checked out by this object.
+        """
+
+        if self._connection is None:
+            self._check_out()
+        return self._connection
+
+    @property
+    def cursor(self):
+        """
+        Returns:
+            cursor: The cursor of the connection checked out by this object.
+        """
+
+        if self._connection is None:
+            self._check_out()
+        return self._cursor
+
+    @contextmanager
+    def transaction(self):
+        """
+        Groups the queries executed within the context into a single transaction,
+        committed once at the end, instead of committing every query. Within the
+        transaction, a failing query raises its error instead of rolling back,
+        so that the caller can isolate it with savepoint(). Should the context
+        raise, the entire transaction is rolled back and the error is re-raised.
+        """
+
+        self.in_transaction = True
+        try:
+            yield
+            self.connection.commit()
+        except Exception:
+            self.rollback_transaction()
+            raise
+        finally:
+            self.in_transaction = False
+
+    @contextmanager
+    def savepoint(self, name="etl_savepoint"):
+        """
+        Isolates the queries executed within the context, so that an error
+        only rolls them back, and not the entire transaction. The error is
+        re-raised. Outside of a transaction, it does nothing.
+
+        Args:
+            name (str): The name of the savepoint.
+        """
+
+        if not self.in_transaction:
+            yield
+            return
+
+        self.cursor.execute(f"SAVEPOINT {name};")
+        try:
+            yield
+        except Exception:
+            self.cursor.execute(f"ROLLBACK TO SAVEPOINT {name};")
+            raise
+        self.cursor.execute(f"RELEASE SAVEPOINT {name};")
+
+    def commit(self):
+        """
+        Commits the query just executed, unless it is part of a transaction.
+        """
+
+        if not self.in_transaction:
+            self.connection.commit()
+
     def execute_query(self, query, values=None):
         """
         Executes a query and commits it to the database.
@@ -43,8 +264,10 @@ class DatabaseConnector:
 
         try:
             self.cursor.execute(query, values)
-            self.connection.commit()
+            self.commit()
         except Error:
+            if self.in_transaction:
+                raise
             self.rollback_transaction()
 
     def fetch_rows(self, query, values=None):
@@ -69,6 +292,8 @@ class DatabaseConnector:
             rows = self.cursor.fetchall()
             return rows
         except Error:
+            if self.in_transaction:
+                raise
             self.rollback_transaction()
 
     def add_country(self, values:tuple):
@@ -106,6 +331,22 @@ class DatabaseConnector:
         countries = DataFrame(countries, columns=columns)
         return countries
 
+    def fetch_country_index(self):
+        """
+        Extracts all the countries in the extract.country table, without
+        going through pandas, and indexes them by ISO code.
+
+        Returns:
+            countries (CountryIndex object)
+        """
+
+        query = """
+            SELECT * FROM extract.country;
+        """
+        rows = self.fetch_rows(query) or []
+        columns = [desc[0] for desc in self.cursor.description]
+        return CountryIndex(dict(zip(columns, row)) for row in rows)
+
     def execute_query_and_return_id(self, query, values:tuple):
         """
         Executes a query, returns the ID of the inserted record
@@ -124,9 +365,11 @@ class DatabaseConnector:
         try:
             self.cursor.execute(query, values)
             inserted_id = self.cursor.fetchone()[0]
-            self.connection.commit()
+            self.commit()
             return inserted_id
         except Error:
+            if self.in_transaction:
+                raise
             self.rollback_transaction()
 
     def truncate_table(self, table_name):
@@ -151,13 +394,20 @@ class DatabaseConnector:
         """
 
         self.logger.warning("Rolling back the transaction!")
-        self.connection.rollback()
+        if self._connection is not None:
+            self._connection.rollback()
 
     def close_connection(self):
         """
-        Closes the cursor and connection.
+        Closes the cursor and puts the connection back into the pool, where
+        any pending transaction is rolled back. The next query checks out a
+        connection again.
         """
 
+        if self._connection is None:
+            return
+
         self.logger.info("Closing current connection!")
-        self.cursor.close()
-        self.connection.close()
+        self._cursor.close()
+        self._pool.putconn(self._connection)
+        self._pool = self._connection = self._cursor = None
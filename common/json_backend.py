@@ -0,0 +1,121 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# The errors raised by every backend when decoding invalid JSON, e.g. the
+# ones of orjson and requests, which both subclass it.
+JSONDecodeError = json.JSONDecodeError
+
+class JSONBackend:
+    def __init__(self, name, loads, dumps):
+        """
+        Initializes the JSONBackend object, a pair of functions
+        encoding and decoding JSON.
+
+        Args:
+            name (str): The name of the backend.
+            loads: Decodes JSON, given as bytes or str. Raises a
+                subclass of JSONDecodeError for invalid JSON.
+            dumps: Encodes data into compact UTF-8 encoded JSON bytes.
+
+        Attributes:
+            name (str): The name of the backend.
+            loads: Decodes JSON.
+            dumps: Encodes JSON.
+        """
+
+        self.name = name
+        self.loads = loads
+        self.dumps = dumps
+
+def _dumps(data):
+    """
+    Encodes data with the standard library, as compact JSON bytes.
+
+    Args:
+        data: The data.
+
+    Returns:
+        content (bytes): The UTF-8 encoded JSON.
+    """
+
+    return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+# The available backends, by name. The fastest one is used by default.
+JSON_BACKENDS = {"json": JSONBackend("json", json.loads, _dumps)}
+if orjson is not None:
+    JSON_BACKENDS["orjson"] = JSONBackend("orjson", orjson.loads, orjson.dumps)
+
+_backend = JSON_BACKENDS["orjson"] if orjson is not None else JSON_BACKENDS["json"]
+
+def register_json_backend(name, loads, dumps):
+    """
+    Makes a backend available to use_json_backend, e.g. a wrapper around
+    another third-party decoder.
+
+    Args:
+        name (str): The name of the backend.
+        loads: Decodes JSON, as in JSONBackend.
+        dumps: Encodes JSON, as in JSONBackend.
+    """
+
+    JSON_BACKENDS[name] = JSONBackend(name, loads, dumps)
+
+def use_json_backend(name="auto"):
+    """
+    Selects the backend used by loads and dumps in the current process.
+
+    Args:
+        name (str): One of the keys of JSON_BACKENDS, or "auto"
+            for the fastest installed one.
+
+    Raises:
+        ValueError: If the backend is not available.
+    """
+
+    global _backend
+    if name == "auto":
+        name = "orjson" if "orjson" in JSON_BACKENDS else "json"
+    if name not in JSON_BACKENDS:
+        raise ValueError(f"The JSON backend {name} is not available!")
+    _backend = JSON_BACKENDS[name]
+
+def get_json_backend():
+    """
+    Returns:
+        backend (JSONBackend object): The backend used in the current process.
+    """
+
+    return _backend
+
+def loads(content):
+    """
+    Decodes JSON with the current backend.
+
+    Args:
+        content (bytes or str): The JSON.
+
+    Returns:
+        data: The decoded data.
+
+    Raises:
+        JSONDecodeError: If the JSON is invalid.
+    """
+
+    return _backend.loads(content)
+
+def dumps(data):
+    """
+    Encodes data with the current backend.
+
+    Args:
+        data: The data.
+
+    Returns:
+        content (bytes): The compact UTF-8 encoded JSON.
+    """
+
+    return _backend.dumps(data)
@@ -24,8 +24,14 @@ class ETLLogger:
             1) Creates the logs directory, if it does not already exist.
             2) Links to a log file.
             3) Links to a formatter.
+        A logger of the same name already has its file handler, e.g. when
+        several database objects of the same class are created, in which
+        case nothing is added, so that every line is only logged once.
         """
 
+        if any(isinstance(handler, logging.FileHandler) for handler in self.logger.handlers):
+            return
+
         os.makedirs("logs", exist_ok=True)
         log_filename = f"logs/{datetime.now().strftime('%Y-%m-%d')}.log"
         file_handler = logging.FileHandler(log_filename)
@@ -0,0 +1,181 @@
+import os
+import json
+from contextlib import contextmanager
+from common.utils import split_raw_format
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+MANIFEST_DIRNAME = "data/manifest"
+
+def manifest_path(dir_name):
+    """
+    Builds the path of the manifest of a raw directory, e.g.
+    data/manifest/weather_data.ndjson for data/raw/weather_data.
+
+    Args:
+        dir_name (str): The raw directory.
+
+    Returns:
+        path (str): The path to the manifest.
+    """
+
+    return os.path.join(MANIFEST_DIRNAME, os.path.basename(os.path.normpath(dir_name)) + ".ndjson")
+
+@contextmanager
+def manifest_lock(dir_name):
+    """
+    Holds the lock of the manifest of a raw directory, so that an entry is
+    never appended to a manifest while it is being claimed or released, e.g.
+    by an extract and a transform running at the same time, in different
+    processes or threads. Without fcntl, e.g. on Windows, it does nothing.
+
+    Args:
+        dir_name (str): The raw directory.
+    """
+
+    os.makedirs(MANIFEST_DIRNAME, exist_ok=True)
+    with open(manifest_path(dir_name) + ".lock", "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+def read_manifest(path):
+    """
+    Reads a manifest, which is newline-delimited JSON with one entry per raw
+    file. A file saved in several storage formats in turn is only listed once,
+    in its latest format, since the extract only keeps the latest one.
+
+    Args:
+        path (str): The path to the manifest.
+
+    Returns:
+        file_names (list): The names of the files, in the order they were
+            first listed, or None if there is no manifest.
+    """
+
+    file_names = {}
+    try:
+        with open(path, "r", encoding="utf-8") as infile:
+            for line in infile:
+                try:
+                    file_name = json.loads(line)["file"]
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    # A line cut short by a crash is ignored.
+                    continue
+                file_names[split_raw_format(file_name)[0]] = file_name
+    except FileNotFoundError:
+        return None
+    return list(file_names.values())
+
+def append_to_manifest(path, file_names):
+    """
+    Appends entries to a manifest, with a single write.
+
+    Args:
+        path (str): The path to the manifest.
+        file_names (list): The names of the files.
+    """
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    lines = "".join(json.dumps({"file": file_name}, separators=(",", ":")) + "\n"
+                    for file_name in file_names)
+    with open(path, "a", encoding="utf-8") as outfile:
+        outfile.write(lines)
+
+def claim_manifest(dir_name):
+    """
+    Takes over the manifest of a raw directory, by renaming it, so that the
+    files it lists are processed once: the files extracted afterwards are
+    listed in a new manifest. The files left unprocessed are handed back
+    with release_manifest. A manifest claimed by an interrupted run is
+    claimed again.
+
+    Args:
+        dir_name (str): The raw directory.
+
+    Returns:
+        files (list): The complete names of the files, or None if the
+            directory has no manifest yet.
+    """
+
+    path = manifest_path(dir_name)
+    claimed_path = path + ".claimed"
+
+    with manifest_lock(dir_name):
+        if os.path.exists(claimed_path):
+            file_names = read_manifest(path)
+            if file_names is not None:
+                append_to_manifest(claimed_path, file_names)
+                os.remove(path)
+        else:
+            try:
+                os.replace(path, claimed_path)
+            except FileNotFoundError:
+                return None
+
+        return [os.path.join(dir_name, file_name) for file_name in read_manifest(claimed_path)]
+
+def release_manifest(dir_name, files):
+    """
+    Hands back the files of a claimed manifest that are still in the raw
+    directory, by listing them in the manifest again, and discards the
+    claimed manifest.
+
+    Args:
+        dir_name (str): The raw directory.
+        files (list): The complete names of the files left unprocessed.
+    """
+
+    path = manifest_path(dir_name)
+    with manifest_lock(dir_name):
+        append_to_manifest(path, [os.path.basename(file) for file in files])
+        try:
+            os.remove(path + ".claimed")
+        except FileNotFoundError:
+            pass
+
+class ManifestWriter:
+    def __init__(self):
+        """
+        Initializes the ManifestWriter object, which lists the raw files saved by
+        the extract in the manifest of their directory, so that the transform
+        does not have to scan the raw directories. The entries are buffered, and
+        appended under the lock of each manifest by flush, a single write per
+        directory, so that an entry never ends up in a manifest that a transform
+        has claimed in the meantime.
+
+        Attributes:
+            entries (dict): The buffered file names, by raw directory.
+            recorded (set): The (directory, file name) pairs listed during the run.
+        """
+
+        self.entries = {}
+        self.recorded = set()
+
+    def record(self, dir_name, file_name):
+        """
+        Buffers the listing of a raw file in the manifest of its directory,
+        once per run.
+
+        Args:
+            dir_name (str): The raw directory.
+            file_name (str): The name of the file.
+        """
+
+        if (dir_name, file_name) in self.recorded:
+            return
+        self.recorded.add((dir_name, file_name))
+        self.entries.setdefault(dir_name, []).append(file_name)
+
+    def flush(self):
+        """
+        Appends the buffered entries to the manifests.
+        """
+
+        entries, self.entries = self.entries, {}
+        for dir_name, file_names in entries.items():
+            with manifest_lock(dir_name):
+                append_to_manifest(manifest_path(dir_name), file_names)
@@ -1,8 +1,34 @@
 import os
-from datetime import datetime
-import json
+from datetime import datetime, timedelta
+from common import json_backend
+import gzip
+import lzma
+import errno
 import shutil
-import csv
+from common.weather_codes import get_weather_code_registry
+
+# The daily variables of the Weather API consumed by the transform, mapped to
+# the columns of the transform.weather_data_import table they populate. The
+# "time" array is always part of a daily response and needs no request.
+WEATHER_DAILY_VARIABLES = {
+    "weather_code": "weather_code",
+    "temperature_2m_mean": "mean_temperature",
+    "surface_pressure_mean": "mean_surface_pressure",
+    "precipitation_sum": "precipitation_sum",
+    "relative_humidity_2m_mean": "relative_humidity",
+    "wind_speed_10m_mean": "wind_speed",
+}
+
+# The storage formats of the raw files, by file extension, mapped to the function
+# opening such a file. The JSON is written compactly, without indentation.
+RAW_FORMATS = {
+    "json": open,
+    "json.gz": gzip.open,
+    "json.xz": lzma.open,
+}
+
+# The directories already created by the current process, see ensure_directory.
+_created_directories = set()
 
 def today():
     """
@@ -28,9 +54,49 @@ def timestamp():
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
     return timestamp
 
+def date_range(start_date, end_date):
+    """
+    Lists all dates between two given dates, both included.
+
+    Args:
+        start_date (str): The first date in the YYYY-MM-DD format.
+        end_date (str): The last date in the YYYY-MM-DD format.
+
+    Returns:
+        dates (list): String representations of the dates
+            in the YYYY-MM-DD format.
+    """
+
+    start = datetime.strptime(start_date, "%Y-%m-%d")
+    end = datetime.strptime(end_date, "%Y-%m-%d")
+    dates = [(start + timedelta(days=i)).strftime("%Y-%m-%d")
+             for i in range((end - start).days + 1)]
+    return dates
+
+def split_raw_format(file_name):
+    """
+    Splits the name of a raw file into its stem and its storage format.
+
+    Args:
+        file_name (str): The name of the file.
+
+    Returns:
+        stem (str): The name of the file without the extension.
+        raw_format (str): One of the keys of RAW_FORMATS, or None if
+            the extension is not a known storage format.
+    """
+
+    # The longest extensions are tried first, so that .json.gz is not taken for .gz.
+    for raw_format in sorted(RAW_FORMATS, key=len, reverse=True):
+        if file_name.endswith("." + raw_format):
+            return file_name[:-len(raw_format) - 1], raw_format
+    return file_name, None
+
 def save_to_json(data, import_dir_name, import_file_name):
     """
-    Saves data into a .json file.
+    Saves data into a .json file, compressed according to the
+    extension of the file name (see RAW_FORMATS). A copy of the file
+    in another format is removed, so that it is not processed twice.
 
     Intended args:
         data (dict): The data.
@@ -39,16 +105,27 @@ def save_to_json(data, import_dir_name, import_file_name):
         import_file_name (str): The name of the file.
     """
 
-    if not os.path.exists(import_dir_name):
-        os.makedirs(import_dir_name)
+    ensure_directory(import_dir_name)
+
+    stem, raw_format = split_raw_format(import_file_name)
+    opener = RAW_FORMATS.get(raw_format, open)
 
     file_path = os.path.join(import_dir_name, import_file_name)
-    with open(file_path, "w", encoding="utf-8") as outfile:
-        json.dump(data, outfile, indent=4)
+    with opener(file_path, "wb") as outfile:
+        outfile.write(json_backend.dumps(data))
+
+    for other_format in RAW_FORMATS:
+        if other_format != raw_format:
+            try:
+                os.remove(os.path.join(import_dir_name, f"{stem}.{other_format}"))
+            except FileNotFoundError:
+                pass
 
 def get_row_count(import_dir_name, import_file_name, status_code, api_type):
     """
-    Counts the number of rows in a .json file.
+    Counts the number of rows in a .json file, in any of the RAW_FORMATS,
+    with get_data_row_count. The extract counts the rows of the responses
+    in memory instead, so that the saved files are not read back.
 
     Args:
         import_dir_name (str): The name of the directory.
@@ -57,30 +134,50 @@ def get_row_count(import_dir_name, import_file_name, status_code, api_type):
         api_type (str): Either "c" (COVID) or "w" (weather).
 
     Returns:
-        1: If the file exists and is associated with a 200
-            HTTP response code.
-        0: If the file does not exist or is associated with a
-            HTTP response code different than 200. Additionally,
-            for the chosen COVID API, for an invalid ISO code, the 
-            response returns a 200 status code, surprisingly. The 
-            response body does not contain any legible information.
-            Therefore, the function returns 0 in this case.
+        row_count (int): As returned by get_data_row_count, or 0
+            if the file does not exist.
     """
 
     file_path = os.path.join(import_dir_name, import_file_name)
 
     if not os.path.exists(file_path):
         return 0
-    
-    if status_code != 200:
+
+    return get_data_row_count(open_file(file_path), status_code, api_type)
+
+def get_data_row_count(data, status_code, api_type):
+    """
+    Counts the number of rows the transform will get out of the data of
+    a response held in memory.
+
+    Args:
+        data: The response body.
+        status_code (int): The HTTP status code.
+        api_type (str): Either "c" (COVID) or "w" (weather).
+
+    Returns:
+        row_count (int):
+            For the Weather API, the number of days of the response, as a
+                response for a range of dates holds one row per day.
+            For the COVID API, 1, unless the data is empty. For an invalid
+                ISO code, the chosen COVID API surprisingly returns a 200 status
+                code, with a response body that does not contain any legible
+                information.
+            0 if the response is associated with a HTTP status code
+                different than 200.
+    """
+
+    if status_code != 200 or not isinstance(data, dict):
         return 0
-    
-    if api_type == "c":
-        data = open_file(file_path)
-        if not data.get("data"):
-            return 0 
-    return 1
-    
+
+    if api_type == "w":
+        daily = data.get("daily")
+        if not isinstance(daily, dict) or not isinstance(daily.get("time"), list):
+            return 0
+        return len(daily["time"])
+
+    return 1 if data.get("data") else 0
+
 def list_all_files_from_directory(directory):
     """
     Lists all files in a given directory.
@@ -123,7 +220,11 @@ def check_expected_format(filename):
     """
     Checks whether the file follows the expected naming convention,
     (i.e covid/weather_data_countrycode_batchdate), which includes
-    a valid batch date and a potential country_code.
+    a valid batch date and a potential country_code. Files holding a
+    date range carry the last date as a suffix
+    (i.e weather_data_countrycode_batchdate_enddate), in which case
+    the first date is the batch date. The extension has to be one of
+    the RAW_FORMATS.
 
     Args:
         filename (str): The name of the file
@@ -133,6 +234,9 @@ def check_expected_format(filename):
         batch_date (str): The batch date.
     """
 
+    if split_raw_format(filename)[1] is None:
+        return None
+
     country_code, batch_date = get_file_details(filename)
     try:
         if all([country_code, batch_date]):
@@ -143,7 +247,8 @@ def check_expected_format(filename):
 
 def open_file(filename):
     """
-    Extracts the data from a .json file.
+    Extracts the data from a .json file, decompressed according to
+    the extension of the file name (see RAW_FORMATS).
 
     Args:
         filename (str): The name of the file.
@@ -152,16 +257,35 @@ def open_file(filename):
         data: The data contained in the file.
     """
 
+    _, raw_format = split_raw_format(filename)
+    opener = RAW_FORMATS.get(raw_format, open)
+
     try:
-        with open(filename, "r", encoding="utf-8") as infile:
-            data = json.load(infile)
+        with opener(filename, "rb") as infile:
+            data = json_backend.loads(infile.read())
             return data
-    except (FileNotFoundError, json.JSONDecodeError):
+    except (OSError, EOFError, lzma.LZMAError, json_backend.JSONDecodeError):
         return None
 
+def ensure_directory(dir_name):
+    """
+    Creates a directory, unless the current process already did, so that
+    the directory is only looked up once per run.
+
+    Args:
+        dir_name (str): The name of the directory.
+    """
+
+    if dir_name not in _created_directories:
+        os.makedirs(dir_name, exist_ok=True)
+        _created_directories.add(dir_name)
+
 def move_file(file, dir_name, file_name):
     """
     Moves a file from a source directory to a target directory.
+    The file is moved as is, so a compressed file stays compressed
+    and keeps its extension. Within a filesystem, the file is renamed
+    atomically, replacing any file of the same name in the target directory.
 
     Args:
         file (str): The full path to the file.
@@ -170,15 +294,26 @@ def move_file(file, dir_name, file_name):
             directory.
     """
 
-    if not os.path.exists(dir_name):
-        os.makedirs(dir_name)
+    ensure_directory(dir_name)
 
     file_path = os.path.join(dir_name, file_name)
-    shutil.move(file, file_path)
+    try:
+        os.replace(file, file_path)
+    except FileNotFoundError:
+        # The target directory was removed since it was created.
+        if os.path.isdir(dir_name):
+            raise
+        os.makedirs(dir_name)
+        os.replace(file, file_path)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(file, file_path)
 
 def get_weather_description(weather_code, csv_file_path="weather_description/wmo_code_4677.csv"):
     """
     Fetches the corresponding weather description to a WMO 4677 weather code.
+    The .csv file is only read once per process (see common.weather_codes).
 
     Args:
         weather_code (int): A WMO 4677 weather code.
@@ -189,12 +324,4 @@ def get_weather_description(weather_code, csv_file_path="weather_description/wmo
         description (str): The corresponding weather description.
     """
 
-    try:
-        with open(csv_file_path, mode="r", encoding="utf-8") as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                if row["Weather Code"] == weather_code:
-                    description = row["Description"]
-                    return description
-    except (FileNotFoundError, KeyError):
-        return None
+    return get_weather_code_registry(csv_file_path).describe(weather_code)
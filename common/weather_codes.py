@@ -0,0 +1,125 @@
+import csv
+from functools import lru_cache
+
+WMO_CODES_CSV = "weather_description/wmo_code_4677.csv"
+
+def normalize_weather_code(weather_code):
+    """
+    Normalizes a WMO 4677 weather code to the string form used as key,
+    so that 3, 3.0 and "3" all designate the same code.
+
+    Args:
+        weather_code: A weather code, as an int, float or str.
+
+    Returns:
+        weather_code (str): The normalized weather code.
+    """
+
+    if isinstance(weather_code, float) and weather_code.is_integer():
+        weather_code = int(weather_code)
+    return str(weather_code).strip()
+
+class WeatherCodeRegistry:
+    def __init__(self, descriptions=None):
+        """
+        Initializes the WeatherCodeRegistry object, an in-memory mapping of the
+        WMO 4677 weather codes to their descriptions. It is meant to be loaded
+        once per run, instead of scanning the .csv file for every lookup.
+
+        Args:
+            descriptions (dict): Initial descriptions, by weather code.
+
+        Attributes:
+            descriptions (dict): The descriptions, by normalized weather code.
+        """
+
+        self.descriptions = {normalize_weather_code(code): description
+                             for code, description in (descriptions or {}).items()}
+
+    def load_csv(self, csv_file_path=WMO_CODES_CSV):
+        """
+        Loads the descriptions of a .csv file, which take precedence over
+        the known ones. A missing or malformed file is ignored.
+
+        Args:
+            csv_file_path (str): The path to a .csv file that contains two columns:
+                Weather Code | Description
+
+        Returns:
+            self (WeatherCodeRegistry object), for chaining.
+        """
+
+        try:
+            with open(csv_file_path, mode="r", encoding="utf-8") as file:
+                for row in csv.DictReader(file):
+                    self.descriptions[normalize_weather_code(row["Weather Code"])] = row["Description"]
+        except (FileNotFoundError, KeyError):
+            pass
+        return self
+
+    def seed(self, rows):
+        """
+        Adds descriptions that are not known yet, e.g. the ones of
+        the load.dim_weather_code table.
+
+        Args:
+            rows (list of tuple): (weather_code, description) tuples.
+
+        Returns:
+            self (WeatherCodeRegistry object), for chaining.
+        """
+
+        for weather_code, description in rows or []:
+            self.descriptions.setdefault(normalize_weather_code(weather_code), description)
+        return self
+
+    def describe(self, weather_code, default=None):
+        """
+        Fetches the description of a weather code.
+
+        Args:
+            weather_code: A WMO 4677 weather code.
+            default: The value returned for an unknown code.
+
+        Returns:
+            description (str): The corresponding weather description.
+        """
+
+        return self.descriptions.get(normalize_weather_code(weather_code), default)
+
+    def describe_many(self, weather_codes, default=None):
+        """
+        Fetches the descriptions of several weather codes at once. A pandas
+        Series is looked up with a single vectorized map.
+
+        Args:
+            weather_codes (list or Series): WMO 4677 weather codes.
+            default: The value returned for an unknown code.
+
+        Returns:
+            descriptions (list or Series): The corresponding weather descriptions,
+                of the same type as weather_codes.
+        """
+
+        if hasattr(weather_codes, "map"):
+            descriptions = weather_codes.map(normalize_weather_code).map(self.descriptions)
+            return descriptions if default is None else descriptions.fillna(default)
+
+        descriptions = self.descriptions
+        return [descriptions.get(normalize_weather_code(weather_code), default)
+                for weather_code in weather_codes]
+
+@lru_cache(maxsize=None)
+def get_weather_code_registry(csv_file_path=WMO_CODES_CSV):
+    """
+    Loads the registry of a .csv file once per process.
+
+    Args:
+        csv_file_path (str): The path to a .csv file that contains two columns:
+            Weather Code | Description
+
+    Returns:
+        registry (WeatherCodeRegistry object)
+    """
+
+    return WeatherCodeRegistry().load_csv(csv_file_path)
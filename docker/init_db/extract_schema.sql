@@ -24,7 +24,9 @@ CREATE TABLE extract.import_log (
 CREATE TABLE extract.api_info (
     id SERIAL PRIMARY KEY,
     api_name VARCHAR(100) NOT NULL,
-    api_base_url VARCHAR(255) NOT NULL
+    api_base_url VARCHAR(255) NOT NULL,
+    requests_per_second DECIMAL(8,3), -- (NULL for no rate limit)
+    burst INT
 );
 
 CREATE TABLE extract.api_import_log (
@@ -39,9 +41,9 @@ CREATE TABLE extract.api_import_log (
     FOREIGN KEY (api_id) REFERENCES extract.api_info(id)
 );
 
-INSERT INTO extract.api_info (api_name, api_base_url)
-VALUES ('Weather API', 'https://historical-forecast-api.open-meteo.com/v1/forecast'),
-	   ('COVID API', 'https://covid-api.com/api/reports/total');
+INSERT INTO extract.api_info (api_name, api_base_url, requests_per_second, burst)
+VALUES ('Weather API', 'https://historical-forecast-api.open-meteo.com/v1/forecast', 8, 10),
+	   ('COVID API', 'https://covid-api.com/api/reports/total', 5, 5);
 
 -- Sample countries for testing.
 INSERT INTO extract.country (code, name, latitude, longitude)
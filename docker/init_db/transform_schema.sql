@@ -11,6 +11,16 @@ CREATE TABLE transform.transform_log(
     status VARCHAR(50) NOT NULL
 );
 
+-- Every transform run stages its rows under a batch, which the load consumes
+-- once: pending (transformed), loading, consumed (loaded) and pruned.
+CREATE TABLE transform.staging_batch(
+    id SERIAL PRIMARY KEY,
+    status VARCHAR(50) NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    claimed_at TIMESTAMP,
+    consumed_at TIMESTAMP
+);
+
 CREATE TABLE transform.weather_data_import(
     id SERIAL PRIMARY KEY,
     country_id INT NOT NULL,
@@ -22,9 +32,13 @@ CREATE TABLE transform.weather_data_import(
     precipitation_sum DECIMAL(5,2) NOT NULL,
     relative_humidity DECIMAL(5,2) NOT NULL,
     wind_speed DECIMAL(5,2) NOT NULL,
-    FOREIGN KEY (country_id) REFERENCES extract.country(id)
+    batch_id INT NOT NULL,
+    FOREIGN KEY (country_id) REFERENCES extract.country(id),
+    FOREIGN KEY (batch_id) REFERENCES transform.staging_batch(id)
 );
 
+CREATE INDEX ON transform.weather_data_import (batch_id);
+
 CREATE TABLE transform.covid_data_import(
     id SERIAL PRIMARY KEY,
     country_id INT NOT NULL,
@@ -32,5 +46,9 @@ CREATE TABLE transform.covid_data_import(
     confirmed_cases INT NOT NULL,
     deaths INT NOT NULL,
     recovered INT NOT NULL,
-    FOREIGN KEY (country_id) REFERENCES extract.country(id)
-);
\ No newline at end of file
+    batch_id INT NOT NULL,
+    FOREIGN KEY (country_id) REFERENCES extract.country(id),
+    FOREIGN KEY (batch_id) REFERENCES transform.staging_batch(id)
+);
+
+CREATE INDEX ON transform.covid_data_import (batch_id);
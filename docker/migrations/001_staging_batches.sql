@@ -0,0 +1,50 @@
+-- Upgrades a database created before the staging batches, i.e. with the previous
+-- transform_schema.sql. The script can be run more than once. The rows already
+-- staged are gathered under a single pending batch, which the next load merges.
+
+CREATE TABLE IF NOT EXISTS transform.staging_batch(
+    id SERIAL PRIMARY KEY,
+    status VARCHAR(50) NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    claimed_at TIMESTAMP,
+    consumed_at TIMESTAMP
+);
+
+-- The batches claimed by a running load, added after the table itself.
+ALTER TABLE transform.staging_batch ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMP;
+
+ALTER TABLE transform.weather_data_import ADD COLUMN IF NOT EXISTS batch_id INT;
+ALTER TABLE transform.covid_data_import ADD COLUMN IF NOT EXISTS batch_id INT;
+
+DO $$
+DECLARE
+    legacy_batch_id INT;
+BEGIN
+    IF EXISTS (SELECT 1 FROM transform.weather_data_import WHERE batch_id IS NULL)
+       OR EXISTS (SELECT 1 FROM transform.covid_data_import WHERE batch_id IS NULL) THEN
+        INSERT INTO transform.staging_batch (status)
+        VALUES ('pending')
+        RETURNING id INTO legacy_batch_id;
+
+        UPDATE transform.weather_data_import SET batch_id = legacy_batch_id WHERE batch_id IS NULL;
+        UPDATE transform.covid_data_import SET batch_id = legacy_batch_id WHERE batch_id IS NULL;
+    END IF;
+
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'weather_data_import_batch_id_fkey') THEN
+        ALTER TABLE transform.weather_data_import
+            ADD CONSTRAINT weather_data_import_batch_id_fkey
+            FOREIGN KEY (batch_id) REFERENCES transform.staging_batch(id);
+    END IF;
+
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'covid_data_import_batch_id_fkey') THEN
+        ALTER TABLE transform.covid_data_import
+            ADD CONSTRAINT covid_data_import_batch_id_fkey
+            FOREIGN KEY (batch_id) REFERENCES transform.staging_batch(id);
+    END IF;
+END $$;
+
+ALTER TABLE transform.weather_data_import ALTER COLUMN batch_id SET NOT NULL;
+ALTER TABLE transform.covid_data_import ALTER COLUMN batch_id SET NOT NULL;
+
+CREATE INDEX IF NOT EXISTS weather_data_import_batch_id_idx ON transform.weather_data_import (batch_id);
+CREATE INDEX IF NOT EXISTS covid_data_import_batch_id_idx ON transform.covid_data_import (batch_id);
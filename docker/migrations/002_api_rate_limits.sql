@@ -0,0 +1,14 @@
+-- Upgrades a database created before the API rate limits, i.e. with the previous
+-- extract_schema.sql. The script can be run more than once. The limits of the two
+-- seeded APIs are only set if they are not set yet.
+
+ALTER TABLE extract.api_info ADD COLUMN IF NOT EXISTS requests_per_second DECIMAL(8,3);
+ALTER TABLE extract.api_info ADD COLUMN IF NOT EXISTS burst INT;
+
+UPDATE extract.api_info
+SET requests_per_second = 8, burst = 10
+WHERE api_name = 'Weather API' AND requests_per_second IS NULL AND burst IS NULL;
+
+UPDATE extract.api_info
+SET requests_per_second = 5, burst = 5
+WHERE api_name = 'COVID API' AND requests_per_second IS NULL AND burst IS NULL;
@@ -4,16 +4,27 @@ from datetime import datetime
 from dotenv import load_dotenv
 from extract.weather_api import WeatherAPI
 from extract.covid_api import CovidAPI
+from extract.api_client import create_session
+from extract.response_cache import ResponseCache
+from extract.rate_limiter import TokenBucket
 from extract.extract import e_routine
+from extract.async_extract import async_e_routine
 from extract.data_extractor import DataExtractor
 from transform.transform import t_routine
 from transform.data_transformer import DataTransformer
 from load.load import l_routine
 from load.data_loader import DataLoader
+from pipeline.stream import s_routine
+from common.utils import RAW_FORMATS
+from common.json_backend import JSON_BACKENDS, use_json_backend
+from common.database_connector import configure_connection_pool
 
 def initialize_database_objects(**db_config):
     """
     Initializes a DataExtractor, DataTransformer and DataLoader object.
+    None of them connects to the database up front: each one checks out a
+    connection from the pool of the process on its first query, so that the
+    stages that are not run do not hold a connection.
 
     Args:
         **db_config (dict): PostgreSQL database connection parameters.
@@ -30,6 +41,38 @@ def initialize_database_objects(**db_config):
     l_db = DataLoader(**db_config)
     return e_db, t_db, l_db
 
+def initialize_rate_limiter(api_info, logger=None):
+    """
+    Initializes the TokenBucket object of an API, based on its
+    record in the extract.api_info table.
+
+    Args:
+        api_info (DataFrame): The extract.api_info record of the API.
+        logger: Warns that the table lacks the rate limit columns, e.g. if
+            docker/migrations/002_api_rate_limits.sql was not applied.
+
+    Returns:
+        rate_limiter (TokenBucket object): None if the API has no
+            requests_per_second limit.
+    """
+
+    if "requests_per_second" not in api_info or "burst" not in api_info:
+        message = ("The extract.api_info table has no requests_per_second and burst columns, "
+                   "the API requests are not rate limited. Apply "
+                   "docker/migrations/002_api_rate_limits.sql to the database.")
+        print(message)
+        if logger is not None:
+            logger.warning(message)
+        return None
+
+    rate = api_info["requests_per_second"].values[0]
+    if rate is None or rate != rate or rate <= 0:
+        return None
+
+    burst = api_info["burst"].values[0]
+    burst = 1 if burst is None or burst != burst else burst
+    return TokenBucket(float(rate), int(burst))
+
 def add_countries(e_db:DataExtractor):
     """
     Asks the user if a new country is to be added.
@@ -88,6 +131,15 @@ def main():
     must be extracted, by providing --date. If the format is invalid or
     the date is not provided, the date is defaulted to the given date of
     execution of the script but in 2022.
+    Alternatively, a range of dates can be backfilled in a single run, by
+    providing --start-date and --end-date.
+    The number of concurrent API requests of the extract can be tuned
+    per API by providing --weather-workers and --covid-workers, and the
+    requests can be sent by a thread pool or by asyncio, by providing
+    --extract-engine (threads or async).
+    With --stream, the three modules overlap instead of running one after
+    the other, the responses flowing from the extract to the transform and
+    the staging batches from the transform to the load through bounded queues.
     Depending on the choices of the parser, the function will execute
     the corresponding actions.
     """
@@ -104,8 +156,230 @@ def main():
         type=str,
         help="Specify the date in the YYYY-MM-DD format: "
     )
+    parser.add_argument(
+        "--start-date",
+        type=str,
+        help="Specify the first date of a backfill range in the YYYY-MM-DD format: "
+    )
+    parser.add_argument(
+        "--end-date",
+        type=str,
+        help="Specify the last date of a backfill range in the YYYY-MM-DD format: "
+    )
+    parser.add_argument(
+        "--force-extract",
+        action="store_true",
+        help="Extract every country and date again, including the files that "
+             "were already extracted successfully."
+    )
+    parser.add_argument(
+        "--weather-workers",
+        type=int,
+        default=4,
+        help="Maximum number of Weather API requests in flight during the extract."
+    )
+    parser.add_argument(
+        "--covid-workers",
+        type=int,
+        default=4,
+        help="Maximum number of COVID API requests in flight during the extract."
+    )
+    parser.add_argument(
+        "--extract-engine",
+        choices=["threads", "async"],
+        default="threads",
+        help="Send the API requests from a pool of worker threads, or from a single "
+             "thread with asyncio, which scales to hundreds of requests in flight."
+    )
+    parser.add_argument(
+        "--extract-queue-size",
+        type=int,
+        default=100,
+        help="Maximum number of async API responses waiting to be written, or of "
+             "streamed files waiting to be transformed, before the requests are held back."
+    )
+    parser.add_argument(
+        "--weather-batch-size",
+        type=int,
+        default=1,
+        help="Number of countries fetched with a single Weather API request."
+    )
+    parser.add_argument(
+        "--weather-variables",
+        type=str,
+        default="",
+        help="Comma-separated daily Weather API variables to extract on top of "
+             "the ones used by the transform (e.g. temperature_2m_max,rain_sum)."
+    )
+    parser.add_argument(
+        "--raw-format",
+        choices=list(RAW_FORMATS),
+        default="json",
+        help="Storage format of the extracted raw files: compact JSON, or JSON "
+             "compressed with gzip (json.gz) or LZMA (json.xz)."
+    )
+    parser.add_argument(
+        "--raw-layout",
+        choices=["files", "bundles"],
+        default="files",
+        help="Save every extracted response as a separate raw file, or append the "
+             "responses to one NDJSON bundle per API and date, with an index of "
+             "byte offsets per country."
+    )
+    parser.add_argument(
+        "--log-batch-size",
+        type=int,
+        default=100,
+        help="Number of extract log records written to the database per statement."
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Send every API request, instead of serving known responses from the cache."
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default="data/cache",
+        help="Directory of the on-disk API response cache."
+    )
+    parser.add_argument(
+        "--cache-max-mb",
+        type=int,
+        default=512,
+        help="Maximum size of the API response cache in MB."
+    )
+    parser.add_argument(
+        "--weather-cache-ttl",
+        type=float,
+        default=3600,
+        help="Seconds a cached Weather API response for a recent date stays valid. "
+             "Responses for past dates never expire."
+    )
+    parser.add_argument(
+        "--covid-cache-ttl",
+        type=float,
+        default=3600,
+        help="Seconds a cached COVID API response for a recent date stays valid. "
+             "Responses for past dates never expire."
+    )
+    parser.add_argument(
+        "--transform-workers",
+        type=int,
+        default=1,
+        help="Number of processes parsing the raw files during the transform."
+    )
+    parser.add_argument(
+        "--seed-weather-codes",
+        action="store_true",
+        help="Complete the weather descriptions of the .csv file with the ones "
+             "already known to the load.dim_weather_code table."
+    )
+    parser.add_argument(
+        "--staging-chunk-size",
+        type=int,
+        default=1000,
+        help="Number of rows written to the transform staging tables per statement."
+    )
+    parser.add_argument(
+        "--staging-method",
+        choices=["copy", "values"],
+        default="copy",
+        help="Write the transform staging rows with COPY FROM STDIN, or with multi-row inserts."
+    )
+    parser.add_argument(
+        "--transform-chunk-size",
+        type=int,
+        default=0,
+        help="Number of raw files transformed per database transaction, with a savepoint "
+             "per file. 0 commits every statement on its own."
+    )
+    parser.add_argument(
+        "--staging-mode",
+        choices=["truncate", "incremental"],
+        default="truncate",
+        help="Empty the transform staging tables on every transform, or keep the batches "
+             "staged by previous transforms until the load consumes them."
+    )
+    parser.add_argument(
+        "--rescan-raw",
+        action="store_true",
+        help="Scan the raw directories for files missing from the manifests "
+             "of the extract, e.g. files copied there by hand."
+    )
+    parser.add_argument(
+        "--json-backend",
+        choices=["auto"] + list(JSON_BACKENDS),
+        default="auto",
+        help="Library encoding and decoding the API responses and raw files. "
+             "auto picks orjson if it is installed, and the standard json module otherwise."
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Run the entire ETL as a streaming pipeline: the responses are transformed as "
+             "they are extracted, and the staging batches are loaded as they are completed."
+    )
+    parser.add_argument(
+        "--stream-batch-files",
+        type=int,
+        default=500,
+        help="Number of files per staging batch handed to the load by the streaming pipeline."
+    )
+    parser.add_argument(
+        "--stream-flush-interval",
+        type=float,
+        default=5,
+        help="Seconds without any extracted file after which the streaming pipeline "
+             "hands the current staging batch to the load anyway."
+    )
+    parser.add_argument(
+        "--db-pool-min",
+        type=int,
+        default=1,
+        help="Number of idle database connections kept open by the connection pool."
+    )
+    parser.add_argument(
+        "--db-pool-max",
+        type=int,
+        default=10,
+        help="Maximum number of database connections shared by the stages and their "
+             "threads. Further connections wait for one to be put back."
+    )
+    parser.add_argument(
+        "--max-retries",
+        type=int,
+        default=3,
+        help="Number of times a failed or throttled API request is retried."
+    )
+    parser.add_argument(
+        "--http-pool-size",
+        type=int,
+        help="Maximum number of keep-alive connections per API host. Defaults to "
+             "the largest number of workers, or to their total with the async engine."
+    )
+    parser.add_argument(
+        "--connect-timeout",
+        type=float,
+        default=5,
+        help="Timeout in seconds for establishing a connection to an API."
+    )
+    parser.add_argument(
+        "--read-timeout",
+        type=float,
+        default=10,
+        help="Timeout in seconds for reading an API response."
+    )
     args = parser.parse_args()
 
+    if args.stream and (args.process != "all" or args.extract_engine != "threads"
+                        or args.raw_layout != "files"):
+        parser.error("--stream requires --process all, --extract-engine threads "
+                     "and --raw-layout files.")
+
+    use_json_backend(args.json_backend)
+    configure_connection_pool(args.db_pool_min, args.db_pool_max)
+
     batch_date = datetime.now().strftime("%Y-%m-%d")
 
     try:
@@ -116,6 +390,20 @@ def main():
     except ValueError:
         print("Invalid date format. Use YYYY-MM-DD. Defaults to today's date but in 2022!")
 
+    # A backfill range takes precedence over a single date.
+    end_date = None
+    if args.start_date and args.end_date:
+        try:
+            start_date = datetime.strptime(args.start_date, "%Y-%m-%d").strftime("%Y-%m-%d")
+            end_date = datetime.strptime(args.end_date, "%Y-%m-%d").strftime("%Y-%m-%d")
+            if end_date < start_date:
+                raise ValueError
+            date = start_date
+        except ValueError:
+            end_date = None
+            print(f"Invalid date range. Use YYYY-MM-DD, with a start date before the end date. "
+                  f"Defaults to {date}!")
+
     # Load the PostgreSQL database connection parameters from a .env file,
     # located in the root directory of the project.
     load_dotenv('database.env')
@@ -144,36 +432,90 @@ def main():
         # Fetches the information about the APIs.
         api_info = e_db.fetch_api_information()
 
+        # A single keep-alive connection pool, shared by both APIs for the whole run.
+        pool_size = args.http_pool_size or max(args.weather_workers, args.covid_workers)
+        session = create_session(pool_maxsize=pool_size)
+        timeout = (args.connect_timeout, args.read_timeout)
+
+        # An on-disk cache of the API responses, shared by both APIs.
+        cache = None
+        if not args.no_cache:
+            cache = ResponseCache(args.cache_dir, args.cache_max_mb * 1024 * 1024)
+
         # Initialize the respective weather API object.
         weather_api_info = api_info[api_info["api_name"] == "Weather API"]
         weather_api = WeatherAPI(
             api_id=weather_api_info["id"].values[0],
-            base_url=weather_api_info["api_base_url"].values[0]
+            base_url=weather_api_info["api_base_url"].values[0],
+            session=session,
+            timeout=timeout,
+            cache=cache,
+            cache_ttl=args.weather_cache_ttl,
+            rate_limiter=initialize_rate_limiter(weather_api_info, e_db.logger),
+            max_retries=args.max_retries,
+            extra_daily_variables=[variable.strip() for variable in args.weather_variables.split(",")
+                                   if variable.strip()]
         )
 
         # Initialize the respective COVID-19 API object.
         covid_api_info = api_info[api_info["api_name"] == "COVID API"]
         covid_api = CovidAPI(
             api_id=covid_api_info["id"].values[0],
-            base_url=covid_api_info["api_base_url"].values[0]
+            base_url=covid_api_info["api_base_url"].values[0],
+            session=session,
+            timeout=timeout,
+            cache=cache,
+            cache_ttl=args.covid_cache_ttl,
+            rate_limiter=initialize_rate_limiter(covid_api_info, e_db.logger),
+            max_retries=args.max_retries
         )
 
         # Fetch the countries that are going to be used for data extraction.
-        countries = e_db.fetch_countries()
+        countries = e_db.fetch_country_index()
 
-        # The extract process of the ETL.
-        e_routine(weather_api, covid_api, e_db, countries, date)
-        print("Extract process completed.")
+        # The extract process of the ETL, along with the transform and the load
+        # when streaming.
+        if args.stream:
+            s_routine(weather_api, covid_api, e_db, t_db, countries, date, end_date=end_date,
+                      weather_workers=args.weather_workers, covid_workers=args.covid_workers,
+                      weather_batch_size=args.weather_batch_size, force=args.force_extract,
+                      log_batch_size=args.log_batch_size, raw_format=args.raw_format,
+                      queue_size=args.extract_queue_size, batch_files=args.stream_batch_files,
+                      flush_interval=args.stream_flush_interval,
+                      staging_chunk_size=args.staging_chunk_size,
+                      staging_method=args.staging_method, staging_mode=args.staging_mode,
+                      seed_weather_codes=args.seed_weather_codes)
+        elif args.extract_engine == "async":
+            async_e_routine(weather_api, covid_api, e_db, countries, date, end_date=end_date,
+                            weather_workers=args.weather_workers, covid_workers=args.covid_workers,
+                            weather_batch_size=args.weather_batch_size, force=args.force_extract,
+                            log_batch_size=args.log_batch_size, queue_size=args.extract_queue_size,
+                            connection_limit=args.http_pool_size, raw_format=args.raw_format,
+                            raw_layout=args.raw_layout)
+        else:
+            e_routine(weather_api, covid_api, e_db, countries, date, end_date=end_date,
+                      weather_workers=args.weather_workers, covid_workers=args.covid_workers,
+                      weather_batch_size=args.weather_batch_size, force=args.force_extract,
+                      log_batch_size=args.log_batch_size, raw_format=args.raw_format,
+                      raw_layout=args.raw_layout)
+        session.close()
+        if cache is not None:
+            cache.log_statistics()
+        print("Streaming process completed." if args.stream else "Extract process completed.")
 
-    if args.process in ("transform", "all"):
+    if args.process in ("transform", "all") and not args.stream:
         print("Starting transform process...")
-        countries = t_db.fetch_countries()
+        countries = t_db.fetch_country_index()
 
          # The transform process of the ETL.
-        t_routine(countries, t_db)
+        t_routine(countries, t_db, staging_chunk_size=args.staging_chunk_size,
+                  staging_method=args.staging_method, transform_workers=args.transform_workers,
+                  seed_weather_codes=args.seed_weather_codes,
+                  transform_chunk_size=args.transform_chunk_size,
+                  staging_mode=args.staging_mode, rescan_raw=args.rescan_raw)
         print("Transform process completed.")
 
-    if args.process in ("load", "all"):
+    if args.process in ("load", "all") and not args.stream:
         print("Starting load process...")
 
          # The load process of the ETL.
@@ -0,0 +1,305 @@
+import time
+import random
+import asyncio
+from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from common.logger import ETLLogger
+from extract.response_cache import CachedResponse
+
+# HTTP status codes worth retrying, since they signal a transient condition.
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+def create_session(pool_connections=10, pool_maxsize=10, pool_block=True):
+    """
+    Creates a requests session backed by a keep-alive connection pool.
+    The session is meant to be created once per run and shared by all
+    API objects, so that the TCP and TLS handshakes are done once per
+    pooled connection instead of once per request.
+
+    Args:
+        pool_connections (int): The number of hosts for which a pool is kept.
+        pool_maxsize (int): The maximum number of connections kept per host.
+        pool_block (bool): Whether a request should wait for a free connection
+            once pool_maxsize connections to a host are in use, instead of
+            opening a throwaway one.
+
+    Returns:
+        session (requests.Session object)
+    """
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections,
+                          pool_maxsize=pool_maxsize, pool_block=pool_block)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def create_async_session(limit=100, limit_per_host=10):
+    """
+    Creates an aiohttp session backed by a keep-alive connection pool, the
+    asynchronous counterpart of create_session. It has to be created, used
+    and closed within the same running event loop.
+
+    Args:
+        limit (int): The maximum number of connections in total.
+        limit_per_host (int): The maximum number of connections per host.
+
+    Returns:
+        session (aiohttp.ClientSession object)
+    """
+
+    connector = aiohttp.TCPConnector(limit=limit, limit_per_host=limit_per_host)
+    return aiohttp.ClientSession(connector=connector)
+
+class APIClient:
+    def __init__(self, api_id, base_url, session=None, timeout=(5, 10),
+                 cache=None, cache_ttl=3600, settled_days=7, rate_limiter=None,
+                 max_retries=3, backoff_base=0.5, backoff_cap=30):
+        """
+        Initializes the APIClient object.
+
+        Args:
+            api_id (int): The ID of the API.
+            base_url (str): The base URL to the API.
+            session (requests.Session object): A shared session, as created by
+                create_session. If not provided, a session is created for the
+                object alone.
+            timeout (tuple): The connect and read timeouts, in seconds.
+            cache (ResponseCache object): A shared response cache. If not provided,
+                every request goes to the API.
+            cache_ttl (float): The number of seconds a cached response for a
+                recent date stays valid.
+            settled_days (int): The number of days after which the data for a
+                date is considered final, so that its responses never expire.
+            rate_limiter (TokenBucket object): Paces the requests to the API.
+                If not provided, the requests are not paced.
+            max_retries (int): The number of times a failed request is retried.
+            backoff_base (float): The delay in seconds before the first retry.
+            backoff_cap (float): The maximum delay in seconds between retries.
+
+        Attributes:
+            api_id (int): The ID of the API.
+            base_url (str): The base URL to the API.
+            session (requests.Session object): The session used for the requests.
+            timeout (tuple): The connect and read timeouts, in seconds.
+            cache (ResponseCache object): The response cache, if any.
+            cache_ttl (float): The time to live of recent responses, in seconds.
+            settled_days (int): The age in days of final data.
+            rate_limiter (TokenBucket object): The rate limiter, if any.
+            max_retries (int): The number of times a failed request is retried.
+            backoff_base (float): The delay in seconds before the first retry.
+            backoff_cap (float): The maximum delay in seconds between retries.
+            logger: A logger instance with the proper
+                parametrization done by a ETLLogger object.
+        """
+
+        self.base_url = base_url
+        self.api_id = api_id
+        self.session = session or create_session()
+        self.timeout = timeout
+        self.cache = cache
+        self.cache_ttl = cache_ttl
+        self.settled_days = settled_days
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+
+        etl_logger = ETLLogger(self.__class__.__name__)
+        self.logger = etl_logger.get_logger()
+
+    def get_cache_ttl(self, date):
+        """
+        Determines how long the response for a given date stays valid in the cache.
+
+        Args:
+            date (str): The (last) date the request is about.
+
+        Returns:
+            ttl (float): The time to live in seconds, or None if the data for the
+                date is final and the response never expires.
+        """
+
+        try:
+            settled = datetime.strptime(date, "%Y-%m-%d") < datetime.now() - timedelta(days=self.settled_days)
+        except (TypeError, ValueError):
+            settled = False
+        return None if settled else self.cache_ttl
+
+    def get_backoff(self, attempt, retry_after=None):
+        """
+        Computes the delay before retrying a request. The API's Retry-After
+        header is honored when present, otherwise the delay grows exponentially
+        with the attempt, with full jitter so that concurrent retries spread out.
+
+        Args:
+            attempt (int): The number of attempts made so far, minus one.
+            retry_after (str): The value of the Retry-After header, if any,
+                either a number of seconds or an HTTP date.
+
+        Returns:
+            delay (float): The number of seconds to wait.
+        """
+
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_cap)
+            except ValueError:
+                pass
+            try:
+                retry_at = parsedate_to_datetime(retry_after)
+                return min(max(retry_at.timestamp() - time.time(), 0), self.backoff_cap)
+            except (TypeError, ValueError):
+                pass
+
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def send(self, url):
+        """
+        Sends a GET request through the pooled session, paced by the rate
+        limiter. Connection errors, timeouts and the responses listed in
+        RETRY_STATUS_CODES are retried up to max_retries times.
+
+        Args:
+            url (str): The complete endpoint.
+
+        Returns:
+            response (requests.Response object): The last response received.
+
+        Raises:
+            requests.exceptions.RequestException: If the last attempt fails.
+        """
+
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.get_backoff(attempt)
+                self.logger.warning(f"Request failed: {e}. Retrying in {delay:.2f} seconds.")
+                time.sleep(delay)
+                continue
+
+            if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                return response
+
+            delay = self.get_backoff(attempt, response.headers.get("Retry-After"))
+            if response.status_code == 429 and self.rate_limiter is not None:
+                self.rate_limiter.pause(delay)
+            self.logger.warning(f"Received status code {response.status_code}. "
+                                f"Retrying in {delay:.2f} seconds.")
+            response.close()
+            time.sleep(delay)
+
+    def fetch(self, url, date=None):
+        """
+        Sends a GET request, as described in send, unless a valid
+        response for the same endpoint is found in the cache.
+
+        Args:
+            url (str): The complete endpoint.
+            date (str): The (last) date the request is about, which
+                determines how long the response is cached.
+
+        Returns:
+            response (requests.Response or CachedResponse object)
+
+        Raises:
+            requests.exceptions.RequestException: If the request fails.
+        """
+
+        if self.cache is not None:
+            cached_response = self.cache.get(url)
+            if cached_response is not None:
+                return cached_response
+
+        response = self.send(url)
+
+        if self.cache is not None:
+            self.cache.put(url, response, self.get_cache_ttl(date))
+        return response
+
+    async def send_async(self, session, url):
+        """
+        The asynchronous counterpart of send, which waits for the rate limiter
+        and the retry delays without blocking the event loop.
+
+        Args:
+            session (aiohttp.ClientSession object): As created by create_async_session.
+            url (str): The complete endpoint.
+
+        Returns:
+            response (CachedResponse object): The last response received, already read.
+
+        Raises:
+            aiohttp.ClientError, asyncio.TimeoutError: If the last attempt fails.
+        """
+
+        connect_timeout, read_timeout = self.timeout if isinstance(self.timeout, tuple) \
+            else (self.timeout, self.timeout)
+        timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter is not None:
+                wait = self.rate_limiter.reserve()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+
+            try:
+                async with session.get(url, timeout=timeout) as raw_response:
+                    content = await raw_response.read()
+                    response = CachedResponse(raw_response.status,
+                                              content.decode("utf-8", errors="replace"),
+                                              dict(raw_response.headers), from_cache=False)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.get_backoff(attempt)
+                self.logger.warning(f"Request failed: {e!r}. Retrying in {delay:.2f} seconds.")
+                await asyncio.sleep(delay)
+                continue
+
+            if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                return response
+
+            delay = self.get_backoff(attempt, response.headers.get("Retry-After"))
+            if response.status_code == 429 and self.rate_limiter is not None:
+                self.rate_limiter.pause(delay)
+            self.logger.warning(f"Received status code {response.status_code}. "
+                                f"Retrying in {delay:.2f} seconds.")
+            await asyncio.sleep(delay)
+
+    async def fetch_async(self, session, url, date=None):
+        """
+        The asynchronous counterpart of fetch.
+
+        Args:
+            session (aiohttp.ClientSession object): As created by create_async_session.
+            url (str): The complete endpoint.
+            date (str): The (last) date the request is about, which
+                determines how long the response is cached.
+
+        Returns:
+            response (CachedResponse object)
+
+        Raises:
+            aiohttp.ClientError, asyncio.TimeoutError: If the request fails.
+        """
+
+        if self.cache is not None:
+            cached_response = self.cache.get(url)
+            if cached_response is not None:
+                return cached_response
+
+        response = await self.send_async(session, url)
+
+        if self.cache is not None:
+            self.cache.put(url, response, self.get_cache_ttl(date))
+        return response
@@ -0,0 +1,195 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from extract.api_client import create_async_session
+from extract.data_extractor import DataExtractor
+from extract.log_writer import ExtractLogWriter
+from extract.covid_api import CovidAPI
+from extract.weather_api import WeatherAPI
+from extract.extract import plan_jobs, record_results
+from common.bundle import BundleWriter
+from common.manifest import ManifestWriter
+
+async def fetch_weather_async(session, w_api:WeatherAPI, countries, date, end_date=None):
+    """
+    The asynchronous counterpart of fetch_weather.
+
+    Args:
+        session (aiohttp.ClientSession object): As created by create_async_session.
+        w_api (WeatherAPI object)
+        countries (list of dict): Records from the extract.country table.
+        date (str): A given date for extraction, or the first date of a range.
+        end_date (str): The last date of a range, if applicable.
+
+    Returns:
+        results (list of tuple): As returned by fetch_weather.
+    """
+
+    latitudes = [country["latitude"] for country in countries]
+    longitudes = [country["longitude"] for country in countries]
+    response, start_time = await w_api.send_request_async(session, latitudes, longitudes,
+                                                          date, end_date)
+    end_time, code_resp, error_message, resp_body = w_api.get_response(response)
+    return [(start_time, end_time, code, message, body) for code, message, body
+            in w_api.split_response(resp_body, len(countries), code_resp, error_message)]
+
+async def fetch_covid_async(session, c_api:CovidAPI, country, date):
+    """
+    The asynchronous counterpart of fetch_covid.
+
+    Args:
+        session (aiohttp.ClientSession object): As created by create_async_session.
+        c_api (CovidAPI object)
+        country (dict): A record from the extract.country table.
+        date (str): A given date for extraction.
+
+    Returns:
+        results (list of tuple): As returned by fetch_covid.
+    """
+
+    response, start_time = await c_api.send_request_async(session, country["code"], date)
+    end_time, code_resp, error_message, resp_body = c_api.get_response(response)
+    return [(start_time, end_time, code_resp, error_message, resp_body)]
+
+async def run_extract(w_api:WeatherAPI, c_api:CovidAPI, db:DataExtractor,
+                      log_writer:ExtractLogWriter, db_executor, countries, date,
+                      end_date=None, weather_workers=1, covid_workers=1,
+                      weather_batch_size=1, force=False, queue_size=100, connection_limit=None,
+                      raw_format="json", raw_layout="files", bundle_writer=None,
+                      manifest_writer=None):
+    """
+    Runs the API calls of the extract on the event loop. Every API gets its own
+    worker coroutines, which take the calls one at a time from a shared list, so
+    that at most weather_workers and covid_workers requests are in flight per API.
+    The results are put on a queue holding at most queue_size calls, from which
+    a single recorder coroutine hands them to record_results. Once the queue is
+    full, the workers wait before sending more requests, so the responses cannot
+    pile up in memory faster than they are written.
+    Everything touching the database or the disk runs on db_executor, a single
+    thread, so the log writes overlap with the requests in flight.
+
+    Args:
+        w_api (WeatherAPI object)
+        c_api (CovidAPI object)
+        db (DataExtractor object)
+        log_writer (ExtractLogWriter object)
+        db_executor (ThreadPoolExecutor object): An executor with a single thread.
+        countries (list of dict): Records from the extract.country table.
+        date (str): A given date for extraction, or the first date of a range.
+        end_date (str): The last date of a range, if applicable.
+        weather_workers (int): The maximum number of Weather API requests in flight.
+        covid_workers (int): The maximum number of COVID API requests in flight.
+        weather_batch_size (int): The number of countries per Weather API request.
+        force (bool): Whether files that were already extracted should be
+            extracted again.
+        queue_size (int): The maximum number of calls waiting to be recorded.
+        connection_limit (int): The maximum number of open connections.
+            Defaults to the total number of workers.
+        raw_format (str): The storage format of the raw files, one of the
+            keys of common.utils.RAW_FORMATS.
+        raw_layout (str): Either "files" or "bundles", as in e_routine.
+        bundle_writer (BundleWriter object): Required by the bundles layout.
+        manifest_writer (ManifestWriter object): Lists the saved files.
+    """
+
+    loop = asyncio.get_running_loop()
+    weather_jobs, covid_jobs, created_dates = await loop.run_in_executor(
+        db_executor, plan_jobs, w_api, c_api, db, log_writer, countries,
+        date, end_date, weather_batch_size, force, raw_layout
+    )
+
+    results = asyncio.Queue(maxsize=queue_size)
+
+    async def work(jobs, fetch):
+        for job in jobs:
+            await results.put((job, await fetch(job)))
+
+    async def record():
+        while True:
+            item = await results.get()
+            if item is None:
+                return
+            job, job_results = item
+            await loop.run_in_executor(db_executor, record_results, log_writer,
+                                       job, job_results, created_dates, raw_format, bundle_writer,
+                                       manifest_writer)
+
+    connection_limit = connection_limit or weather_workers + covid_workers
+    async with create_async_session(connection_limit, connection_limit) as session:
+        # The workers of an API share the iterator, so every call is made once.
+        weather_iter, covid_iter = iter(weather_jobs), iter(covid_jobs)
+        fetch_weather_job = lambda job: fetch_weather_async(session, w_api, job[0], job[1], job[2])
+        fetch_covid_job = lambda job: fetch_covid_async(session, c_api, job[0][0], job[1])
+
+        fetchers = asyncio.gather(
+            *[work(weather_iter, fetch_weather_job) for _ in range(weather_workers)],
+            *[work(covid_iter, fetch_covid_job) for _ in range(covid_workers)]
+        )
+        recorder = asyncio.create_task(record())
+        try:
+            # The recorder only stops early by failing, which would leave
+            # the workers waiting on a full queue.
+            done, _ = await asyncio.wait({fetchers, recorder},
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if recorder in done:
+                recorder.result()
+            await fetchers
+            await results.put(None)
+            await recorder
+        finally:
+            fetchers.cancel()
+            recorder.cancel()
+
+def async_e_routine(w_api:WeatherAPI, c_api:CovidAPI, db:DataExtractor, countries, date,
+                    end_date=None, weather_workers=1, covid_workers=1, weather_batch_size=1,
+                    force=False, log_batch_size=100, queue_size=100, connection_limit=None,
+                    raw_format="json", raw_layout="files"):
+    """
+    Attempts to complete the extract part of the ETL with asyncio, as an
+    alternative to e_routine. It plans, fetches and records the same files
+    as e_routine, but the requests are sent from a single thread, so that
+    hundreds of them can be in flight at once, e.g. during a backfill.
+    See run_extract for how the requests and the log writes are scheduled.
+
+    Args:
+        w_api (WeatherAPI object)
+        c_api (CovidAPI object)
+        db (DataExtractor object)
+        countries (CountryIndex object): The countries of the extract.country table.
+        date (str): A given date for extraction, or the first date of a range.
+        end_date (str): The last date of a range, if applicable.
+        weather_workers (int): The maximum number of Weather API requests in flight.
+        covid_workers (int): The maximum number of COVID API requests in flight.
+        weather_batch_size (int): The number of countries per Weather API request.
+        force (bool): Whether files that were already extracted should be
+            extracted again.
+        log_batch_size (int): The number of log records written per statement.
+        queue_size (int): The maximum number of calls waiting to be recorded.
+        connection_limit (int): The maximum number of open connections.
+            Defaults to the total number of workers.
+        raw_format (str): The storage format of the raw files, one of the
+            keys of common.utils.RAW_FORMATS.
+        raw_layout (str): Either "files" (one file per country) or "bundles"
+            (one bundle per API and date).
+    """
+
+    countries = countries.records
+    bundle_writer = BundleWriter() if raw_layout == "bundles" else None
+    manifest_writer = ManifestWriter()
+    log_writer = ExtractLogWriter(db, log_batch_size, manifest_writer)
+
+    # The connection of the DataExtractor is only ever used by this single thread.
+    with ThreadPoolExecutor(max_workers=1) as db_executor:
+        try:
+            asyncio.run(run_extract(w_api, c_api, db, log_writer, db_executor, countries,
+                                    date, end_date, weather_workers, covid_workers,
+                                    weather_batch_size, force, queue_size, connection_limit,
+                                    raw_format, raw_layout, bundle_writer, manifest_writer))
+            db_executor.submit(log_writer.flush).result()
+        except Exception:
+            db_executor.submit(db.rollback_transaction).result()
+            db_executor.submit(log_writer.flush).result()
+        finally:
+            if bundle_writer is not None:
+                db_executor.submit(bundle_writer.close).result()
+
+    db.close_connection()
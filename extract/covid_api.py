@@ -1,28 +1,10 @@
+import asyncio
+import aiohttp
 import requests
+from common import json_backend
 from common.utils import timestamp
-from common.logger import ETLLogger
-class CovidAPI:
-    def __init__(self, api_id, base_url):
-        """
-        Initializes the CovidAPI object.
-
-        Args:
-            api_id (int): The ID of the API.
-            base_url (str): The base URL to the API.
-
-        Attributes:
-            api_id (int): The ID of the API.
-            base_url (str): The base URL to the API.
-            logger: A logger instance with the proper
-                parametrization done by a ETLLogger object.
-        """
-
-        self.base_url = base_url
-        self.api_id = api_id
-        
-        etl_logger = ETLLogger(self.__class__.__name__)
-        self.logger = etl_logger.get_logger()
-
+from extract.api_client import APIClient
+class CovidAPI(APIClient):
     def prepare_params(self, code, date):
         """
         Prepares the query parameters required to complete
@@ -75,18 +57,44 @@ class CovidAPI:
         self.logger.info(f"Sending COVID API request for {code} and {date}.")
         start_time = timestamp()
         try:
-            response = requests.get(url, timeout=10)
+            response = self.fetch(url, date)
             return response, start_time
         except requests.exceptions.RequestException as e:
             self.logger.warning(f"Request failed: {e}")
             return None, start_time
 
+    async def send_request_async(self, session, code, date):
+        """
+        The asynchronous counterpart of send_request.
+
+        Args:
+            session (aiohttp.ClientSession object): As created by create_async_session.
+            code (str): ISO code for a given country.
+            date (str): A given date.
+
+        Returns:
+            response (CachedResponse object)
+            start_time (str): Timestamp corresponding to
+                the time the API request was sent.
+        """
+
+        url = self.get_endpoint(code, date)
+
+        self.logger.info(f"Sending COVID API request for {code} and {date}.")
+        start_time = timestamp()
+        try:
+            response = await self.fetch_async(session, url, date)
+            return response, start_time
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.logger.warning(f"Request failed: {e!r}")
+            return None, start_time
+
     def get_response(self, response):
         """
         Handles the response from the API request.
 
         Args:
-            response (requests.Response object)
+            response (requests.Response object): None if the request failed.
 
         Returns:
             end_time (str): Timestamp corresponding to
@@ -103,8 +111,14 @@ class CovidAPI:
         end_time = ""
         response_body = None
 
+        if response is None:
+            end_time = timestamp()
+            error_message = "Not found"
+            self.logger.info(f"No response was received, status code: {code_response}.")
+            return end_time, code_response, error_message, response_body
+
         try:
-            json_response = response.json()
+            json_response = json_backend.loads(response.content)
             end_time = timestamp()
             code_response = response.status_code
             response_body = json_response
@@ -112,7 +126,7 @@ class CovidAPI:
             if isinstance(json_response.get("error"), dict):
                 error_message = ', '.join(f"{', '.join(value)}"
                                           for _, value in json_response["error"].items())
-        except requests.exceptions.JSONDecodeError:
+        except json_backend.JSONDecodeError:
             error_text = response.text
             end_time = timestamp()
             response_body = error_text
@@ -1,4 +1,6 @@
 import pandas as pd
+from psycopg2 import Error
+from psycopg2.extras import execute_values
 from common.database_connector import DatabaseConnector
 
 class DataExtractor(DatabaseConnector):
@@ -70,6 +72,96 @@ class DataExtractor(DatabaseConnector):
             self.execute_query(update_query, values)
             self.logger.info(f"Incomplete API import log record with ID: {log_id} has been completed.")
 
+    def insert_initial_api_import_logs(self, rows:list):
+        """
+        Inserts several initial incomplete logs in the extract.api_import_log table
+        with a single multi-row insert. Sets the start_time to the current time by default.
+
+        Args:
+            rows (list of tuple): 2-element tuples, as expected by insert_initial_api_import_log.
+
+        Returns:
+            log_ids (list): The IDs of the incomplete log records, in the order of the rows.
+        """
+
+        if not rows:
+            return []
+
+        query = """
+            INSERT INTO extract.api_import_log (country_id, api_id, start_time)
+            VALUES %s
+            RETURNING id;
+        """
+        try:
+            log_ids = execute_values(self.cursor, query, rows,
+                                     template="(%s, %s, NOW())", fetch=True)
+            self.connection.commit()
+            self.logger.info(f"{len(log_ids)} incomplete API import log records have been written.")
+            return [log_id for (log_id,) in log_ids]
+        except Error:
+            self.rollback_transaction()
+            return [None] * len(rows)
+
+    def update_api_import_logs(self, rows:list):
+        """
+        Completes several initial incomplete logs in the extract.api_import_log table
+        with a single statement.
+
+        Args:
+            rows (list of tuple): 5-element tuples, as expected by update_api_import_log.
+        """
+
+        rows = [row for row in rows if row[-1]]
+        if not rows:
+            return
+
+        query = """
+            UPDATE extract.api_import_log AS log
+            SET start_time = v.start_time::TIMESTAMP,
+            end_time = NULLIF(v.end_time, '')::TIMESTAMP,
+            code_response = v.code_response, error_message = v.error_message
+            FROM (VALUES %s) AS v (start_time, end_time, code_response, error_message, id)
+            WHERE log.id = v.id;
+        """
+        try:
+            execute_values(self.cursor, query, rows)
+            self.connection.commit()
+            self.logger.info(f"{len(rows)} incomplete API import log records have been completed.")
+        except Error:
+            self.rollback_transaction()
+
+    def insert_import_logs(self, rows:list):
+        """
+        Inserts several complete logs in the extract.import_log table with a
+        single multi-row insert.
+
+        Args:
+            rows (list of tuple): 7-element tuples containing:
+                batch_date (str): The batch date.
+                country_id (int): The country ID.
+                import_dir_name (str): The directory name of the imported file.
+                import_file_name (str): The name of the imported file.
+                file_created_date (str): The creation date of the file.
+                file_last_modified_date (str): The latest date the file was modified.
+                row_count (int): The number of rows contained in the file.
+        """
+
+        if not rows:
+            return
+
+        query = """
+            INSERT INTO extract.import_log
+            (batch_date, country_id, import_directory_name, import_file_name,
+            file_created_date, file_last_modified_date, row_count)
+            VALUES %s;
+        """
+        try:
+            execute_values(self.cursor, query, rows)
+            self.connection.commit()
+            self.logger.info(f"{len(rows)} import log records have been written.")
+        except Error:
+            self.rollback_transaction()
+
     def find_created_date(self, import_dir_name, import_file_name):
         """
         Attempts to find the creation date of a record in the extract.import_log table.
@@ -97,6 +189,35 @@ class DataExtractor(DatabaseConnector):
             file_created_date = existing_record[0][0]
             return file_created_date
 
+    def fetch_import_history(self, start_date, end_date):
+        """
+        Summarizes the extract.import_log table for a range of batch dates,
+        with a single query, so that the extract can skip the files that
+        were already extracted successfully.
+
+        Args:
+            start_date (str): The first batch date.
+            end_date (str): The last batch date.
+
+        Returns:
+            history (dict): For each (country_id, import_dir_name, import_file_name),
+                a 2-element tuple containing:
+                    file_created_date (str): The earliest creation date of the file.
+                    row_count (int): The largest row count recorded for the file.
+        """
+
+        query = """
+            SELECT country_id, import_directory_name, import_file_name,
+            MIN(file_created_date), MAX(row_count)
+            FROM extract.import_log
+            WHERE batch_date BETWEEN %s AND %s
+            GROUP BY country_id, import_directory_name, import_file_name;
+        """
+        rows = self.fetch_rows(query, (start_date, end_date)) or []
+        history = {(country_id, dir_name, file_name): (created_date, row_count)
+                   for country_id, dir_name, file_name, created_date, row_count in rows}
+        return history
+
     def insert_initial_import_log(self, values:tuple):
         """
         Inserts the initial incomplete log in the extract.import_log table.
@@ -119,7 +240,7 @@ class DataExtractor(DatabaseConnector):
         self.logger.info(f"Incomplete import log record with ID: {log_id} has been written.")
         return log_id
 
-    def update_import_log(self, values:tuple):
+    def update_import_log(self, values:tuple, find_created_date=True):
         """
         Attempts to complete an initial incomplete log in the extract.import_log table.
         If successful, it updates the row with additional information.
@@ -132,11 +253,14 @@ class DataExtractor(DatabaseConnector):
                 file_last_modified_date (str): The latest date the file was modified.
                 row_count (int): The number of rows contained in the file.
                 log_id (int): The ID of the initial incomplete log record.
+            find_created_date (bool): Whether the creation date of an earlier record
+                of the same file should replace file_created_date. Can be turned off
+                when the caller already knows it, e.g. from fetch_import_history.
         """
 
         log_id = values[-1]
         if log_id:
-            existing_created_date = self.find_created_date(values[0], values[1])
+            existing_created_date = find_created_date and self.find_created_date(values[0], values[1])
             if existing_created_date:
                 values = values[:2] + (existing_created_date,) + values[3:]
 
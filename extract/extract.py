@@ -1,71 +1,440 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from extract.data_extractor import DataExtractor
+from extract.log_writer import ExtractLogWriter
 from extract.covid_api import CovidAPI
 from extract.weather_api import WeatherAPI
-from common.utils import save_to_json, today, get_row_count
+from common.utils import (
+    save_to_json, today, get_data_row_count, date_range, split_raw_format
+)
+from common.bundle import (
+    BundleWriter, bundle_file_name, split_bundle_format, list_bundled_records, index_path
+)
+from common.manifest import ManifestWriter
 
-def e_routine(w_api:WeatherAPI, c_api:CovidAPI, db:DataExtractor, countries, date):
+W_IMP_DIRNAME = "data/raw/weather_data"
+C_IMP_DIRNAME = "data/raw/covid_data"
+W_PROCESSED_DIRNAME = "data/processed/weather_data"
+C_PROCESSED_DIRNAME = "data/processed/covid_data"
+
+def raw_file_name(api_type, code, date, end_date=None, raw_format="json"):
+    """
+    Builds the name of the raw file for a given API, country and date.
+    A file holding a range of dates is suffixed with the last date.
+
+    Args:
+        api_type (str): Either "c" (COVID) or "w" (weather).
+        code (str): ISO code for a given country.
+        date (str): A given date, or the first date of a range.
+        end_date (str): The last date of a range, if applicable.
+        raw_format (str): The storage format of the file, one of the
+            keys of common.utils.RAW_FORMATS.
+
+    Returns:
+        file_name (str): The name of the file.
+    """
+
+    if end_date and end_date != date:
+        return f"{api_type}_{code}_{date}_{end_date}.{raw_format}"
+    return f"{api_type}_{code}_{date}.{raw_format}"
+
+def list_existing_files(*directories):
+    """
+    Lists the names of the files present in the given directories,
+    without their storage format extension.
+
+    Args:
+        *directories (str): The directories to be scanned.
+
+    Returns:
+        file_stems (set): The names of the files, without the extension.
+    """
+
+    file_stems = set()
+    for directory in directories:
+        if os.path.isdir(directory):
+            file_stems.update(split_raw_format(entry.name)[0]
+                              for entry in os.scandir(directory) if entry.is_file())
+    return file_stems
+
+def plan_extract(db:DataExtractor, countries, date, end_date=None, force=False, raw_layout="files"):
+    """
+    Determines which (country, API, date) combinations still have to be extracted.
+    A file counts as extracted if the extract.import_log table records a non-zero
+    row count for it and it is still present in the raw or processed directory,
+    i.e. it was not routed to the error directory by the transform. The history
+    of the files is fetched with a single query. The files are compared without
+    their storage format extension, so that changing the format of the raw files
+    does not extract everything again. With the bundles layout, a record counts
+    as extracted if the index of its bundle holds it with a status other than error.
+
+    Args:
+        db (DataExtractor object)
+        countries (list of dict): Records from the extract.country table.
+        date (str): A given date for extraction, or the first date of a range.
+        end_date (str): The last date of a range, if applicable.
+        force (bool): Whether every combination should be extracted regardless.
+        raw_layout (str): Either "files" (one file per country) or "bundles"
+            (one bundle per API and date, see common.bundle).
+
+    Returns:
+        weather_pending (list of dict): The countries to be requested from the Weather API.
+        covid_pending (list of tuple): The (country, date) pairs to be requested
+            from the COVID API.
+        created_dates (dict): The earliest known creation date of each
+            (country_id, import_dir_name, file_stem).
+    """
+
+    bundled = raw_layout == "bundles"
+    split_format = split_bundle_format if bundled else split_raw_format
+
+    history = {}
+    for (country_id, dir_name, file_name), (created_date, row_count) in \
+            db.fetch_import_history(date, end_date or date).items():
+        key = (country_id, dir_name, split_format(file_name)[0])
+        known_created_date, known_row_count = history.get(key, (created_date, row_count))
+        history[key] = (min(created_date, known_created_date), max(row_count, known_row_count))
+    created_dates = {key: created_date for key, (created_date, _) in history.items()}
+
+    def is_extracted(country, dir_name, file_name, existing):
+        if force:
+            return False
+        file_stem = split_format(file_name)[0]
+        _, row_count = history.get((int(country["id"]), dir_name, file_stem), (None, 0))
+        existing_key = (file_stem, country["code"]) if bundled else file_stem
+        return bool(row_count) and existing_key in existing
+
+    def file_name(api_type, country, f_date, f_end_date=None):
+        if bundled:
+            return bundle_file_name(api_type, f_date, f_end_date)
+        return raw_file_name(api_type, country["code"], f_date, f_end_date)
+
+    if bundled:
+        w_existing = list_bundled_records(W_IMP_DIRNAME)
+        c_existing = list_bundled_records(C_IMP_DIRNAME)
+    else:
+        w_existing = list_existing_files(W_IMP_DIRNAME, W_PROCESSED_DIRNAME)
+        c_existing = list_existing_files(C_IMP_DIRNAME, C_PROCESSED_DIRNAME)
+
+    weather_pending = [country for country in countries
+                       if not is_extracted(country, W_IMP_DIRNAME,
+                                           file_name("w", country, date, end_date), w_existing)]
+
+    covid_pending = [(country, c_date) for c_date in date_range(date, end_date or date)
+                     for country in countries
+                     if not is_extracted(country, C_IMP_DIRNAME,
+                                         file_name("c", country, c_date), c_existing)]
+
+    return weather_pending, covid_pending, created_dates
+
+def fetch_weather(w_api:WeatherAPI, countries, date, end_date=None):
+    """
+    Sends a single Weather API request for a batch of countries and handles the
+    response, which is then split back into one result per country.
+    It does not touch the database, therefore it is safe to run in a worker thread.
+
+    Args:
+        w_api (WeatherAPI object)
+        countries (list of dict): Records from the extract.country table.
+        date (str): A given date for extraction, or the first date of a range.
+        end_date (str): The last date of a range, if applicable.
+
+    Returns:
+        results (list of tuple): For each country, a 5-element tuple containing:
+            start_time (str): Timestamp corresponding to
+                the time the API request was sent.
+            end_time (str): Timestamp corresponding to
+                the time the API response was processed.
+            code_response (int): The code response for the given request.
+            error_message (str): The error message if applicable.
+            response_body: The response body.
+    """
+
+    latitudes = [country["latitude"] for country in countries]
+    longitudes = [country["longitude"] for country in countries]
+    response, start_time = w_api.send_request(latitudes, longitudes, date, end_date)
+    end_time, code_resp, error_message, resp_body = w_api.get_response(response)
+    return [(start_time, end_time, code, message, body) for code, message, body
+            in w_api.split_response(resp_body, len(countries), code_resp, error_message)]
+
+def fetch_covid(c_api:CovidAPI, country, date):
+    """
+    Sends the COVID API request for a given country and handles the response.
+    It does not touch the database, therefore it is safe to run in a worker thread.
+
+    Args:
+        c_api (CovidAPI object)
+        country (dict): A record from the extract.country table.
+        date (str): A given date for extraction.
+
+    Returns:
+        results (list of tuple): A single 5-element tuple, as in fetch_weather.
+    """
+
+    response, start_time = c_api.send_request(country["code"], date)
+    end_time, code_resp, error_message, resp_body = c_api.get_response(response)
+    return [(start_time, end_time, code_resp, error_message, resp_body)]
+
+def persist_extraction(log_writer:ExtractLogWriter, country, date, file_name, api_type,
+                       code_resp, resp_body, file_created_date=None, bundle_writer=None,
+                       manifest_writer=None):
+    """
+    Saves a single API response and records it, namely:
+        1) The response body is saved to a .json file, compressed according
+            to the extension of the file name, or appended to a bundle.
+        2) The file, or the index of the bundle, is buffered for the manifest
+            of the raw directory, written along with the log records.
+        3) The import log record of the file is buffered, with the row count
+            of the response body in memory, rather than of the saved file.
+
+    Args:
+        log_writer (ExtractLogWriter object)
+        country (dict): A record from the extract.country table.
+        date (str): The batch date of the file.
+        file_name (str): The name of the file, as built by raw_file_name,
+            or of the bundle, as built by common.bundle.bundle_file_name.
+        api_type (str): Either "c" (COVID) or "w" (weather).
+        code_resp (int): The HTTP status code of the response.
+        resp_body (dict or list): The response body.
+        file_created_date (str): The date the file was first created, if it
+            was extracted before. Defaults to today.
+        bundle_writer (BundleWriter object): Appends the response to the
+            bundle file_name instead. If not provided, a file is saved.
+        manifest_writer (ManifestWriter object): Lists the saved file.
+    """
+
+    imp_dir_name = W_IMP_DIRNAME if api_type == "w" else C_IMP_DIRNAME
+
+    if bundle_writer is not None:
+        bundle_writer.append(imp_dir_name, file_name, country["code"], resp_body)
+        saved_file_name = os.path.basename(index_path(imp_dir_name, split_bundle_format(file_name)[0]))
+    else:
+        save_to_json(resp_body, imp_dir_name, file_name)
+        saved_file_name = file_name
+    row_count = get_data_row_count(resp_body, code_resp, api_type)
+
+    if manifest_writer is not None:
+        manifest_writer.record(imp_dir_name, saved_file_name)
+    log_writer.add_import_log((date, int(country["id"]), imp_dir_name, file_name,
+                               file_created_date or today(), today(), row_count))
+
+def record_extraction(log_writer:ExtractLogWriter, country, date, file_name, api_type,
+                      api_log_id, result, file_created_date=None, bundle_writer=None,
+                      manifest_writer=None, stream=None):
+    """
+    Completes the bookkeeping for a single API response, namely:
+        1) The completion of the API import log record is buffered.
+        2) The response is saved and recorded with persist_extraction, unless
+            it is handed to the stream, which then takes care of it.
+
+    Args:
+        log_writer (ExtractLogWriter object)
+        country (dict): A record from the extract.country table.
+        date (str): The batch date of the file.
+        file_name (str): The name of the file, as built by raw_file_name,
+            or of the bundle, as built by common.bundle.bundle_file_name.
+        api_type (str): Either "c" (COVID) or "w" (weather).
+        api_log_id (int): The ID of the initial API import log record.
+        result (tuple): One of the tuples returned by fetch_weather or fetch_covid.
+        file_created_date (str): The date the file was first created, if it
+            was extracted before. Defaults to today.
+        bundle_writer (BundleWriter object): Appends the response to the
+            bundle file_name instead. If not provided, a file is saved.
+        manifest_writer (ManifestWriter object): Lists the saved file.
+        stream: Called with the complete name of the file to be saved, the API
+            type, the response body and a function saving the file, before the
+            file is saved, e.g. to transform the response while the file is
+            saved elsewhere. The function takes an ExtractLogWriter and a
+            ManifestWriter, as persist_extraction. Responses appended to a
+            bundle are not streamed.
+    """
+
+    start_time, end_time, code_resp, error_message, resp_body = result
+    imp_dir_name = W_IMP_DIRNAME if api_type == "w" else C_IMP_DIRNAME
+
+    log_writer.finish_api_log((start_time, end_time, code_resp, error_message, api_log_id))
+
+    if stream is not None and bundle_writer is None:
+        def persist(s_log_writer, s_manifest_writer):
+            persist_extraction(s_log_writer, country, date, file_name, api_type, code_resp,
+                               resp_body, file_created_date, manifest_writer=s_manifest_writer)
+
+        stream(os.path.join(imp_dir_name, file_name), api_type, resp_body, persist)
+        return
+
+    persist_extraction(log_writer, country, date, file_name, api_type, code_resp, resp_body,
+                       file_created_date, bundle_writer, manifest_writer)
+
+def plan_jobs(w_api:WeatherAPI, c_api:CovidAPI, db:DataExtractor, log_writer:ExtractLogWriter,
+              countries, date, end_date=None, weather_batch_size=1, force=False,
+              raw_layout="files"):
+    """
+    Plans the API calls of the extract with plan_extract, groups the countries
+    into Weather API batches and creates the initial API import log records of
+    all calls at once.
+
+    Args:
+        w_api (WeatherAPI object)
+        c_api (CovidAPI object)
+        db (DataExtractor object)
+        log_writer (ExtractLogWriter object)
+        countries (list of dict): Records from the extract.country table.
+        date (str): A given date for extraction, or the first date of a range.
+        end_date (str): The last date of a range, if applicable.
+        weather_batch_size (int): The number of countries per Weather API request.
+        force (bool): Whether files that were already extracted should be
+            extracted again.
+        raw_layout (str): Either "files" or "bundles", as in plan_extract.
+
+    Returns:
+        weather_jobs (list of tuple): The Weather API calls, as expected by record_results.
+        covid_jobs (list of tuple): The COVID API calls, as expected by record_results.
+        created_dates (dict): As returned by plan_extract.
+    """
+
+    weather_pending, covid_pending, created_dates = plan_extract(db, countries, date, end_date,
+                                                                 force, raw_layout)
+    db.logger.info(f"Extract planned {len(weather_pending)} Weather API and "
+                   f"{len(covid_pending)} COVID API files.")
+
+    api_log_ids = iter(log_writer.start_api_logs(
+        [(int(country["id"]), int(w_api.api_id)) for country in weather_pending] +
+        [(int(country["id"]), int(c_api.api_id)) for country, _ in covid_pending]
+    ))
+
+    weather_jobs = []
+    for i in range(0, len(weather_pending), weather_batch_size):
+        batch = weather_pending[i:i + weather_batch_size]
+        weather_jobs.append((batch, date, end_date, "w", [next(api_log_ids) for _ in batch]))
+
+    covid_jobs = [([country], c_date, None, "c", [next(api_log_ids)])
+                  for country, c_date in covid_pending]
+
+    return weather_jobs, covid_jobs, created_dates
+
+def record_results(log_writer:ExtractLogWriter, job, results, created_dates, raw_format="json",
+                   bundle_writer=None, manifest_writer=None, stream=None):
+    """
+    Records the results of an API call, country by country, with record_extraction.
+
+    Args:
+        log_writer (ExtractLogWriter object)
+        job (tuple): A 5-element tuple containing:
+            countries (list of dict): The countries of the call.
+            date (str): The (first) date of the call.
+            end_date (str): The last date of the call, if applicable.
+            api_type (str): Either "c" (COVID) or "w" (weather).
+            api_log_ids (list): The IDs of the initial API import log records.
+        results (list of tuple): As returned by fetch_weather or fetch_covid.
+        created_dates (dict): As returned by plan_extract.
+        raw_format (str): The storage format of the files, one of the
+            keys of common.utils.RAW_FORMATS.
+        bundle_writer (BundleWriter object): Appends the responses to the
+            bundle of the call instead. If not provided, files are saved.
+        manifest_writer (ManifestWriter object): Lists the saved files.
+        stream: Receives the responses, as in record_extraction.
+    """
+
+    batch, b_date, b_end_date, api_type, api_log_ids = job
+    imp_dir_name = W_IMP_DIRNAME if api_type == "w" else C_IMP_DIRNAME
+    for country, api_log_id, result in zip(batch, api_log_ids, results):
+        if bundle_writer is not None:
+            file_name = bundle_file_name(api_type, b_date, b_end_date, raw_format)
+            file_stem = split_bundle_format(file_name)[0]
+        else:
+            file_name = raw_file_name(api_type, country["code"], b_date, b_end_date, raw_format)
+            file_stem = split_raw_format(file_name)[0]
+        file_created_date = created_dates.get((int(country["id"]), imp_dir_name, file_stem))
+        record_extraction(log_writer, country, b_date, file_name, api_type,
+                          api_log_id, result, file_created_date, bundle_writer, manifest_writer,
+                          stream)
+
+def e_routine(w_api:WeatherAPI, c_api:CovidAPI, db:DataExtractor, countries, date,
+              end_date=None, weather_workers=1, covid_workers=1, weather_batch_size=1,
+              force=False, log_batch_size=100, raw_format="json", raw_layout="files", stream=None):
     """
     Attempts to complete the extract part of the ETL.
-    For each given country and API, the process follows the scheme:
-        1) An API call is made.
-        2) An initial API import log record is created.
+    First, plan_extract determines which files are still missing or failed
+    previously, so that a re-run only touches those.
+    For each remaining country and API, the process follows the scheme:
+        1) An initial API import log record is created, for all calls at once.
+        2) An API call is submitted to the worker pool of the API.
         3) The API response is extracted.
         4) The initial API import log record is updated based on the response.
-        5) An initial import log record is created.
-        6) The response body is saved to a .json file.
-        7) THe initial import log record is updated accordingly.
+        5) The response body is saved to a .json file, in the raw_format.
+        6) An import log record is created for the file.
+    The API calls (steps 2 and 3) run concurrently, with at most weather_workers
+    and covid_workers requests in flight per API. The database bookkeeping is
+    done by the calling thread, as the responses come in, since the connection
+    of the DataExtractor is not shared between threads. The log records of steps
+    4 and 6 are buffered and written log_batch_size records at a time.
+    The Weather API accepts several locations per request, so the countries are
+    grouped in batches of weather_batch_size, with one request per batch. Every
+    country still gets its own log records and file.
+    When an end date is given, the Weather API returns the entire range with a
+    single request per batch, saved in one file per country, whereas the COVID
+    API is called for every date of the range.
+    With the bundles raw layout, the responses are appended to one bundle per
+    API and date (see common.bundle) instead of being saved as separate files.
+    The saved files are listed in the manifest of their raw directory (see
+    common.manifest), from which the transform takes the files to process.
+    With a stream, every response is handed over as soon as it comes in, before
+    its file is saved, the stream then saving and recording the file itself,
+    e.g. in the streaming pipeline (see pipeline.stream).
 
     Args:
         w_api (WeatherAPI object)
         c_api (CovidAPI object)
         db (DataExtractor object)
-        countries (DataFrame): DataFrame created based on the extract.country table.
-        date (str): A given date for extraction.
+        countries (CountryIndex object): The countries of the extract.country table.
+        date (str): A given date for extraction, or the first date of a range.
+        end_date (str): The last date of a range, if applicable.
+        weather_workers (int): The maximum number of Weather API requests in flight.
+        covid_workers (int): The maximum number of COVID API requests in flight.
+        weather_batch_size (int): The number of countries per Weather API request.
+        force (bool): Whether files that were already extracted should be
+            extracted again.
+        log_batch_size (int): The number of log records written per statement.
+        raw_format (str): The storage format of the raw files, one of the
+            keys of common.utils.RAW_FORMATS.
+        raw_layout (str): Either "files" (one file per country) or "bundles"
+            (one bundle per API and date).
+        stream: Receives the responses, as in record_extraction.
     """
 
-    W_IMP_DIRNAME = "data/raw/weather_data"
-    C_IMP_DIRNAME = "data/raw/covid_data"
-
-    file_created_date = today()
-    file_last_modified_date = today()
+    countries = countries.records
+    log_writer = None
+    bundle_writer = BundleWriter() if raw_layout == "bundles" else None
+    manifest_writer = ManifestWriter()
 
     try:
-        for _, country in countries.iterrows():
-            api_log_id = db.insert_initial_api_import_log((int(country["id"]), int(w_api.api_id)))
-
-            latitude, longitude = country["latitude"], country["longitude"]
-            response, start_time = w_api.send_request(latitude, longitude, date)
-            end_time, code_resp, error_message, resp_body = w_api.get_response(response)
-
-            api_params = (start_time, end_time, code_resp, error_message, int(api_log_id))
-            db.update_api_import_log(api_params)
-
-            w_filename = "w_" + country["code"] + "_" + date + ".json"
-            log_id = db.insert_initial_import_log((date, int(country["id"]),
-                                          W_IMP_DIRNAME, w_filename))
-            save_to_json(resp_body, W_IMP_DIRNAME, w_filename)
-            w_row_count = get_row_count(W_IMP_DIRNAME, w_filename, code_resp, "w")
-            import_params = (W_IMP_DIRNAME, w_filename, file_created_date,
-                             file_last_modified_date, w_row_count, int(log_id))
-            db.update_import_log(import_params)
-
-            api_log_id = db.insert_initial_api_import_log((int(country["id"]), int(c_api.api_id)))
-
-            response, start_time = c_api.send_request(country["code"], date)
-            end_time, code_resp, error_message, resp_body = c_api.get_response(response)
-
-            api_params = (start_time, end_time, code_resp, error_message, int(api_log_id))
-            db.update_api_import_log(api_params)
-
-            c_file_name = "c_" + country["code"] + "_" + date + ".json"
-            log_id = db.insert_initial_import_log((date, int(country["id"]),
-                                          C_IMP_DIRNAME, c_file_name))
-            save_to_json(resp_body, C_IMP_DIRNAME, c_file_name)
-            c_row_count = get_row_count(C_IMP_DIRNAME, c_file_name, code_resp, "c")
-            import_params = (C_IMP_DIRNAME, c_file_name, file_created_date,
-                             file_last_modified_date, c_row_count, log_id)
-            db.update_import_log(import_params)
+        log_writer = ExtractLogWriter(db, log_batch_size, manifest_writer)
+        weather_jobs, covid_jobs, created_dates = plan_jobs(w_api, c_api, db, log_writer, countries,
+                                                            date, end_date, weather_batch_size, force,
+                                                            raw_layout)
+
+        with ThreadPoolExecutor(max_workers=weather_workers) as w_pool, \
+             ThreadPoolExecutor(max_workers=covid_workers) as c_pool:
+            pending = {}
+            for job in weather_jobs:
+                batch, b_date, b_end_date, _, _ = job
+                pending[w_pool.submit(fetch_weather, w_api, batch, b_date, b_end_date)] = job
+
+            for job in covid_jobs:
+                batch, b_date, _, _, _ = job
+                pending[c_pool.submit(fetch_covid, c_api, batch[0], b_date)] = job
+
+            for future in as_completed(pending):
+                record_results(log_writer, pending[future], future.result(),
+                               created_dates, raw_format, bundle_writer, manifest_writer, stream)
+
+        log_writer.flush()
     except Exception:
         db.rollback_transaction()
+        if log_writer is not None:
+            log_writer.flush()
+    finally:
+        if bundle_writer is not None:
+            bundle_writer.close()
 
     db.close_connection()
@@ -0,0 +1,93 @@
+from extract.data_extractor import DataExtractor
+from common.manifest import ManifestWriter
+
+class ExtractLogWriter:
+    def __init__(self, db:DataExtractor, batch_size=100, manifest_writer:ManifestWriter=None):
+        """
+        Initializes the ExtractLogWriter object, which buffers the log records
+        of the extract and writes them with multi-row statements, instead of
+        one statement and one commit per record.
+        The initial API import log records are still written right away (see
+        start_api_logs), so that the attempts in flight are recorded in the
+        database should the run crash.
+        The manifests of the raw files are flushed along with the log records,
+        after them, so that a manifest never lists a file whose log records
+        are not written yet.
+
+        Args:
+            db (DataExtractor object)
+            batch_size (int): The number of buffered records that triggers a flush.
+            manifest_writer (ManifestWriter object): Lists the saved files.
+
+        Attributes:
+            db (DataExtractor object)
+            batch_size (int): The number of buffered records that triggers a flush.
+            api_logs (list): The buffered completions of API import log records.
+            import_logs (list): The buffered import log records.
+            manifest_writer (ManifestWriter object): Lists the saved files.
+        """
+
+        self.db = db
+        self.batch_size = batch_size
+        self.api_logs = []
+        self.import_logs = []
+        self.manifest_writer = manifest_writer
+
+    def start_api_logs(self, rows:list):
+        """
+        Writes the initial incomplete API import log records of the attempts
+        about to be made, with a single statement.
+
+        Args:
+            rows (list of tuple): (country_id, api_id) tuples.
+
+        Returns:
+            log_ids (list): The IDs of the incomplete log records, in the order of the rows.
+        """
+
+        return self.db.insert_initial_api_import_logs(rows)
+
+    def finish_api_log(self, values:tuple):
+        """
+        Buffers the completion of an API import log record.
+
+        Args:
+            values (tuple): A 5-element tuple, as expected by
+                DataExtractor.update_api_import_log.
+        """
+
+        self.api_logs.append(values)
+        self._flush_if_full()
+
+    def add_import_log(self, values:tuple):
+        """
+        Buffers a complete import log record.
+
+        Args:
+            values (tuple): A 7-element tuple, as expected by
+                DataExtractor.insert_import_logs.
+        """
+
+        self.import_logs.append(values)
+        self._flush_if_full()
+
+    def _flush_if_full(self):
+        """
+        Flushes the buffers once they hold batch_size records.
+        """
+
+        if len(self.api_logs) + len(self.import_logs) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes all buffered records to the database, then the buffered
+        entries of the manifests.
+        """
+
+        api_logs, self.api_logs = self.api_logs, []
+        import_logs, self.import_logs = self.import_logs, []
+        self.db.update_api_import_logs(api_logs)
+        self.db.insert_import_logs(import_logs)
+        if self.manifest_writer is not None:
+            self.manifest_writer.flush()
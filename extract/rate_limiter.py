@@ -0,0 +1,68 @@
+import time
+import threading
+
+class TokenBucket:
+    def __init__(self, rate, burst=1):
+        """
+        Initializes the TokenBucket object, a rate limiter shared by all
+        the threads sending requests to the same API. The bucket holds at
+        most burst tokens, it is refilled with rate tokens per second and
+        every request takes one token.
+
+        Args:
+            rate (float): The sustained number of requests per second.
+            burst (int): The number of requests that can be sent at once.
+
+        Attributes:
+            rate (float): The sustained number of requests per second.
+            burst (int): The number of requests that can be sent at once.
+            tokens (float): The tokens currently available.
+            paused_until (float): The monotonic time before which no request
+                may be sent, as asked by the API through a Retry-After header.
+        """
+
+        self.rate = float(rate)
+        self.burst = max(int(burst), 1)
+        self.tokens = float(self.burst)
+        self.paused_until = 0.0
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Takes a token, borrowing it from the future if the bucket is empty.
+
+        Returns:
+            wait (float): The number of seconds the caller has to wait before
+                sending its request.
+        """
+
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self.tokens -= 1
+
+            wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+            return max(wait, self.paused_until - now)
+
+    def acquire(self):
+        """
+        Blocks until a request may be sent.
+        """
+
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """
+        Holds back every request for a number of seconds, e.g. after the API
+        answered with HTTP 429, so that the other threads stop hitting it too.
+
+        Args:
+            seconds (float): The number of seconds to wait.
+        """
+
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
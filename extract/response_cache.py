@@ -0,0 +1,235 @@
+import os
+import time
+import hashlib
+import threading
+import requests
+from common import json_backend
+from common.logger import ETLLogger
+
+class CachedResponse:
+    def __init__(self, status_code, text, headers=None, from_cache=True):
+        """
+        Initializes the CachedResponse object, a stand-in for a
+        requests.Response object whose body has already been read,
+        either from the cache or by the asynchronous extract.
+
+        Args:
+            status_code (int): The HTTP status code of the original response.
+            text (str): The body of the original response.
+            headers (dict): The headers of the original response, if known.
+            from_cache (bool): Whether the response is served from the cache.
+
+        Attributes:
+            status_code (int): The HTTP status code of the original response.
+            text (str): The body of the original response.
+            headers (dict): The headers of the original response, if known.
+            from_cache (bool): Whether the response is served from the cache.
+        """
+
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+        self.from_cache = from_cache
+
+    @property
+    def content(self):
+        """
+        The body, encoded, the same way as requests.Response.content.
+        """
+
+        return self.text.encode("utf-8")
+
+    def json(self):
+        """
+        Decodes the body, the same way requests.Response.json does.
+
+        Returns:
+            data: The decoded body.
+
+        Raises:
+            requests.exceptions.JSONDecodeError: If the body is not valid JSON.
+        """
+
+        try:
+            return json_backend.loads(self.text)
+        except json_backend.JSONDecodeError as e:
+            raise requests.exceptions.JSONDecodeError(e.msg, e.doc, e.pos)
+
+class ResponseCache:
+    def __init__(self, cache_dir="data/cache", max_size_bytes=512 * 1024 * 1024):
+        """
+        Initializes the ResponseCache object, an on-disk cache of API responses
+        keyed by the SHA-256 hash of the complete endpoint. Each entry has its own
+        expiry, and the least recently used entries are evicted once the total
+        size of the cache exceeds max_size_bytes.
+
+        Args:
+            cache_dir (str): The directory in which the entries are stored.
+            max_size_bytes (int): The maximum total size of the entries.
+
+        Attributes:
+            cache_dir (str): The directory in which the entries are stored.
+            max_size_bytes (int): The maximum total size of the entries.
+            entries (dict): The size and last access time of each entry, by key.
+            hits (int): The number of requests served from the cache.
+            misses (int): The number of requests not served from the cache.
+            logger: A logger instance with the proper
+                parametrization done by a ETLLogger object.
+        """
+
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        etl_logger = ETLLogger(self.__class__.__name__)
+        self.logger = etl_logger.get_logger()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.entries = {}
+        for entry in os.scandir(cache_dir):
+            if entry.is_file() and entry.name.endswith(".json"):
+                stat = entry.stat()
+                self.entries[entry.name[:-5]] = (stat.st_size, stat.st_mtime)
+
+    def _key(self, url):
+        """
+        Computes the key of an endpoint.
+
+        Args:
+            url (str): The complete endpoint.
+
+        Returns:
+            key (str): The hexadecimal SHA-256 hash of the endpoint.
+        """
+
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        """
+        Builds the path of the file holding an entry.
+
+        Args:
+            key (str): The key of the entry.
+
+        Returns:
+            path (str): The path to the file.
+        """
+
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def get(self, url):
+        """
+        Looks up the response of an endpoint. An expired entry is removed.
+
+        Args:
+            url (str): The complete endpoint.
+
+        Returns:
+            response (CachedResponse object): The cached response,
+                or None if there is no valid entry.
+        """
+
+        key = self._key(url)
+        path = self._path(key)
+        entry = None
+        try:
+            with open(path, "rb") as infile:
+                entry = json_backend.loads(infile.read())
+        except (FileNotFoundError, json_backend.JSONDecodeError):
+            pass
+
+        now = time.time()
+        with self._lock:
+            if entry is None or entry["url"] != url or \
+               (entry["expires_at"] is not None and entry["expires_at"] < now):
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+
+            # The access time is updated under the lock, so that the entry
+            # cannot be evicted by a concurrent put in between.
+            try:
+                os.utime(path, (now, now))
+            except OSError:
+                self.entries.pop(key, None)
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.entries[key] = (self.entries.get(key, (0, now))[0], now)
+
+        return CachedResponse(entry["status_code"], entry["text"])
+
+    def put(self, url, response, ttl=None):
+        """
+        Stores the response of an endpoint. Only successful responses are
+        stored, since errors are worth retrying on the next run.
+
+        Args:
+            url (str): The complete endpoint.
+            response (requests.Response object)
+            ttl (float): The number of seconds the entry stays valid.
+                None means the entry never expires.
+        """
+
+        if response is None or response.status_code != 200:
+            return
+
+        now = time.time()
+        entry = {
+            "url": url,
+            "status_code": response.status_code,
+            "expires_at": None if ttl is None else now + ttl,
+            "text": response.text,
+        }
+        key = self._key(url)
+        path = self._path(key)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as outfile:
+            outfile.write(json_backend.dumps(entry))
+        os.replace(temp_path, path)
+
+        with self._lock:
+            self.entries[key] = (os.path.getsize(path), now)
+            self._evict()
+
+    def _remove(self, key):
+        """
+        Removes an entry. Expects the lock to be held.
+
+        Args:
+            key (str): The key of the entry.
+        """
+
+        self.entries.pop(key, None)
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        """
+        Removes the least recently used entries until the total size of
+        the cache is within max_size_bytes. Expects the lock to be held.
+        """
+
+        total_size = sum(size for size, _ in self.entries.values())
+        if total_size <= self.max_size_bytes:
+            return
+
+        for key, (size, _) in sorted(self.entries.items(), key=lambda item: item[1][1]):
+            self._remove(key)
+            total_size -= size
+            if total_size <= self.max_size_bytes:
+                break
+
+    def log_statistics(self):
+        """
+        Writes the number of cache hits and misses to the logs.
+        """
+
+        self.logger.info(f"Response cache: {self.hits} hits, {self.misses} misses, "
+                         f"{len(self.entries)} entries.")
@@ -1,81 +1,68 @@
+import asyncio
+import aiohttp
 import requests
-from common.utils import timestamp
-from common.logger import ETLLogger
-class WeatherAPI:
-    def __init__(self, api_id, base_url):
+from common import json_backend
+from common.utils import timestamp, WEATHER_DAILY_VARIABLES
+from extract.api_client import APIClient
+class WeatherAPI(APIClient):
+    def __init__(self, api_id, base_url, extra_daily_variables=None, **kwargs):
         """
         Initializes the WeatherAPI object.
 
         Args:
             api_id (int): The ID of the API.
             base_url (str): The base URL to the API.
+            extra_daily_variables (list): Daily variables to be requested on top
+                of the ones consumed by the transform.
+            **kwargs: The session, timeout, cache and retry settings, as
+                described in APIClient.
 
         Attributes:
-            api_id (int): The ID of the API.
-            base_url (str): The base URL to the API.
-            logger: A logger instance with the proper
-                parametrization done by a ETLLogger object.
+            daily_variables (list): The daily variables requested from the API,
+                starting with the ones listed in WEATHER_DAILY_VARIABLES.
         """
 
-        self.base_url = base_url
-        self.api_id = api_id
+        super().__init__(api_id, base_url, **kwargs)
 
-        etl_logger = ETLLogger(self.__class__.__name__)
-        self.logger = etl_logger.get_logger()
+        self.daily_variables = list(WEATHER_DAILY_VARIABLES)
+        for variable in extra_daily_variables or []:
+            if variable not in self.daily_variables:
+                self.daily_variables.append(variable)
 
-    def prepare_params(self, latitude, longitude, date):
+    def prepare_params(self, latitude, longitude, date, end_date=None):
         """
         Prepares the query parameters required to complete
             the endpoint.
 
         Args:
-            latitude (float): The latitude of a given country.
-            longitude (float): The longitude of a given country.
-            date (str): Date of interest.
+            latitude (float or list): The latitude of a given country, or
+                the latitudes of several countries for a batched request.
+            longitude (float or list): The longitude of a given country, or
+                the longitudes of several countries for a batched request.
+            date (str): Date of interest, or the first date of a range.
+            end_date (str): The last date of a range. Defaults to date.
 
         Returns:
             params (dict): A dictionary with the appropriate keys
                 required as query parameters for the API request.
         """
 
-        all_params = ["weather_code", "temperature_2m_mean", "surface_pressure_mean",
-                    "relative_humidity_2m_mean", "temperature_2m_max", "temperature_2m_min",
-                    "apparent_temperature_max", "apparent_temperature_min", "rain_sum",
-                    "showers_sum", "snowfall_sum", "precipitation_sum", "precipitation_hours",
-                    "precipitation_probability_max", "sunrise", "sunset", "daylight_duration",
-                    "uv_index_max", "sunshine_duration", "uv_index_clear_sky_max",
-                    "wind_speed_10m_max", "wind_gusts_10m_max", "wind_direction_10m_dominant",
-                    "shortwave_radiation_sum", "et0_fao_evapotranspiration",
-                    "apparent_temperature_mean", "cape_mean", "cape_max",
-                    "cape_min", "cloud_cover_mean", "cloud_cover_max", "cloud_cover_min",
-                    "dew_point_2m_mean", "dew_point_2m_max", "dew_point_2m_min",
-                    "surface_pressure_max", "surface_pressure_min", "updraft_max",
-                    "visibility_mean", "visibility_min", "visibility_max",
-                    "winddirection_10m_dominant", "wind_gusts_10m_mean",
-                    "wind_speed_10m_mean", "wind_speed_10m_min", "wind_gusts_10m_min",
-                    "soil_temperature_7_to_28cm_mean", "soil_temperature_28_to_100cm_mean",
-                    "soil_temperature_0_to_7cm_mean", "soil_temperature_0_to_100cm_mean",
-                    "soil_moisture_7_to_28cm_mean", "soil_moisture_28_to_100cm_mean",
-                    "soil_moisture_0_to_7cm_mean", "soil_moisture_0_to_10cm_mean",
-                    "soil_moisture_0_to_100cm_mean", "vapour_pressure_deficit_max",
-                    "wet_bulb_temperature_2m_min", "wet_bulb_temperature_2m_max",
-                    "wet_bulb_temperature_2m_mean", "pressure_msl_min",
-                    "pressure_msl_max", "pressure_msl_mean",
-                    "snowfall_water_equivalent_sum", "relative_humidity_2m_min",
-                    "relative_humidity_2m_max", "precipitation_probability_min",
-                    "precipitation_probability_mean", "leaf_wetness_probability_mean",
-                    "growing_degree_days_base_0_limit_50", "et0_fao_evapotranspiration_sum"]
+        if isinstance(latitude, (list, tuple)):
+            latitude = ",".join(str(value) for value in latitude)
+        if isinstance(longitude, (list, tuple)):
+            longitude = ",".join(str(value) for value in longitude)
+
         params = {
             "latitude": latitude,
             "longitude": longitude,
             "start_date": date,
-            "end_date": date,
-            "daily": ",".join(all_params),
+            "end_date": end_date or date,
+            "daily": ",".join(self.daily_variables),
             "timezone": "Europe/Berlin",
         }
         return params
 
-    def get_endpoint(self, latitude, longitude, date):
+    def get_endpoint(self, latitude, longitude, date, end_date=None):
         """
         Completes the endpoint by joining the base URL and
             the query parameters.
@@ -83,18 +70,19 @@ class WeatherAPI:
         Args:
             latitude (float): The latitude of a given country.
             longitude (float): The longitude of a given country.
-            date (str): Date of interest.
+            date (str): Date of interest, or the first date of a range.
+            end_date (str): The last date of a range. Defaults to date.
 
         Returns:
             endpoint (str): The completed endpoint.
         """
 
-        params = self.prepare_params(latitude, longitude, date)
+        params = self.prepare_params(latitude, longitude, date, end_date)
         query_string = "&".join([f"{key}={value}" for key, value in params.items()])
         endpoint = f"{self.base_url}?{query_string}"
         return endpoint
 
-    def send_request(self, latitude, longitude, date):
+    def send_request(self, latitude, longitude, date, end_date=None):
         """
         Prepares the query parameters required to complete
             the endpoint.
@@ -102,30 +90,60 @@ class WeatherAPI:
         Args:
             latitude (float): The latitude of a given country.
             longitude (float): The longitude of a given country.
-            date (str): Date of interest.
+            date (str): Date of interest, or the first date of a range.
+            end_date (str): The last date of a range. Defaults to date.
 
         Returns:
             response (requests.Response object)
             start_time (str): Timestamp corresponding to
                 the time the API request was sent.
         """
-        complete_url = self.get_endpoint(latitude, longitude, date)
+        complete_url = self.get_endpoint(latitude, longitude, date, end_date)
+        period = f"{date} to {end_date}" if end_date and end_date != date else date
 
-        self.logger.info(f"Sending Weather API request for ({latitude}, {longitude}) and {date}.")
+        self.logger.info(f"Sending Weather API request for ({latitude}, {longitude}) and {period}.")
         start_time = timestamp()
         try:
-            response = requests.get(complete_url, timeout=10)
+            response = self.fetch(complete_url, end_date or date)
             return response, start_time
         except requests.exceptions.RequestException as e:
             self.logger.warning(f"Request failed: {e}")
             return None, start_time
 
+    async def send_request_async(self, session, latitude, longitude, date, end_date=None):
+        """
+        The asynchronous counterpart of send_request.
+
+        Args:
+            session (aiohttp.ClientSession object): As created by create_async_session.
+            latitude (float): The latitude of a given country.
+            longitude (float): The longitude of a given country.
+            date (str): Date of interest, or the first date of a range.
+            end_date (str): The last date of a range. Defaults to date.
+
+        Returns:
+            response (CachedResponse object)
+            start_time (str): Timestamp corresponding to
+                the time the API request was sent.
+        """
+        complete_url = self.get_endpoint(latitude, longitude, date, end_date)
+        period = f"{date} to {end_date}" if end_date and end_date != date else date
+
+        self.logger.info(f"Sending Weather API request for ({latitude}, {longitude}) and {period}.")
+        start_time = timestamp()
+        try:
+            response = await self.fetch_async(session, complete_url, end_date or date)
+            return response, start_time
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.logger.warning(f"Request failed: {e!r}")
+            return None, start_time
+
     def get_response(self, response):
         """
         Handles the response from the API request.
 
         Args:
-            response (requests.Response object)
+            response (requests.Response object): None if the request failed.
 
         Returns:
             end_time (str): Timestamp corresponding to
@@ -142,13 +160,21 @@ class WeatherAPI:
         end_time = ""
         response_body = None
 
+        if response is None:
+            end_time = timestamp()
+            self.logger.info(f"No response was received, status code: {code_response}.")
+            return end_time, code_response, error_message, response_body
+
         try:
-            json_response = response.json()
+            json_response = json_backend.loads(response.content)
             end_time = timestamp()
             code_response = response.status_code
             response_body = json_response
-            error_message = json_response.get('reason') or ""
-        except requests.exceptions.JSONDecodeError:
+            if isinstance(json_response, dict):
+                error_message = json_response.get('reason') or ""
+            else:
+                error_message = ""
+        except json_backend.JSONDecodeError:
             error_text = response.text
             end_time = timestamp()
             response_body = error_text
@@ -156,3 +182,40 @@ class WeatherAPI:
         self.logger.info(f"Response was received with status code: {code_response}.")
 
         return end_time, code_response, error_message, response_body
+
+    def split_response(self, response_body, count, code_response=200, error_message=""):
+        """
+        Splits the response of a batched request into one response per
+        location. For several coordinates, the API returns a list of results
+        in the order of the coordinates. An error object, on the other hand,
+        applies to the entire batch and is thus repeated. A successful response
+        that does not hold one result per location cannot be attributed to the
+        locations, hence every location gets a 502 status code instead, so that
+        it is logged as failed and requested again by the next extract.
+
+        Args:
+            response_body (str, dict or list): The response body, as returned by
+                get_response.
+            count (int): The number of locations in the request.
+            code_response (int): The status code of the response.
+            error_message (str): The error message of the response.
+
+        Returns:
+            responses (list of tuple): For each location, a 3-element tuple containing:
+                code_response (int): The status code.
+                error_message (str): The error message if applicable.
+                response_body: The response body.
+        """
+
+        if isinstance(response_body, list):
+            received = len(response_body)
+        elif code_response == 200 and count > 1:
+            received = 1
+        else:
+            return [(code_response, error_message, response_body)] * count
+
+        if received != count:
+            error_message = f"Expected {count} locations in the response, received {received}."
+            self.logger.warning(error_message)
+            return [(502, error_message, {"error": True, "reason": error_message})] * count
+        return [(code_response, error_message, body) for body in response_body]
@@ -1,11 +1,99 @@
 from common.database_connector import DatabaseConnector
 class DataLoader(DatabaseConnector):
-    def merge_dim_country(self):
+    def claim_staging_batches(self, stale_after=3600):
+        """
+        Claims the staging batches the transform has completed and the load has
+        not consumed yet, marking them as loading. The batches claimed by a load
+        that is still running, e.g. the one of the streaming pipeline, are skipped,
+        so that two loads never merge the same batches at the same time. Batches
+        left loading by an interrupted load are only claimed again once their
+        claim is older than stale_after seconds, since the merges are idempotent.
+
+        Args:
+            stale_after (float): The number of seconds after which a claim
+                is considered abandoned.
+
+        Returns:
+            batch_ids (list): The IDs of the claimed batches.
+        """
+
+        query = """
+            UPDATE transform.staging_batch
+            SET status = 'loading', claimed_at = CURRENT_TIMESTAMP
+            WHERE id IN (
+                SELECT id FROM transform.staging_batch
+                WHERE status = 'pending'
+                   OR (status = 'loading'
+                       AND claimed_at < CURRENT_TIMESTAMP - make_interval(secs => %s))
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id;
+        """
+        rows = self.fetch_rows(query, (stale_after,))
+        self.commit()
+        return sorted(row[0] for row in rows or [])
+
+    def release_staging_batches(self, batch_ids:list):
+        """
+        Hands claimed staging batches back, e.g. after a failed merge, so
+        that the next load claims them again at once.
+
+        Args:
+            batch_ids (list): The IDs of the claimed batches.
+        """
+
+        query = """
+            UPDATE transform.staging_batch
+            SET status = 'pending', claimed_at = NULL
+            WHERE id = ANY(%s) AND status = 'loading';
+        """
+        self.execute_query(query, (batch_ids,))
+
+    def consume_staging_batches(self, batch_ids:list):
+        """
+        Marks staging batches as consumed, once their rows have been merged.
+
+        Args:
+            batch_ids (list): The IDs of the merged batches.
+        """
+
+        query = """
+            UPDATE transform.staging_batch
+            SET status = 'consumed', consumed_at = CURRENT_TIMESTAMP
+            WHERE id = ANY(%s);
+        """
+        self.execute_query(query, (batch_ids,))
+
+    def prune_staging_batches(self):
+        """
+        Deletes the staged rows of the consumed batches, in a single transaction,
+        and marks the batches as pruned.
+        """
+
+        with self.transaction():
+            for table_name in ("transform.weather_data_import", "transform.covid_data_import"):
+                self.execute_query(f"""
+                    DELETE FROM {table_name}
+                    WHERE batch_id IN (
+                        SELECT id FROM transform.staging_batch WHERE status = 'consumed'
+                    );
+                """)
+            self.execute_query("""
+                UPDATE transform.staging_batch
+                SET status = 'pruned'
+                WHERE status = 'consumed';
+            """)
+        self.logger.info("The consumed staging batches have been pruned.")
+
+    def merge_dim_country(self, batch_ids:list):
         """
         Merges (UPSERTs) country details from extract.country into load.dim_country
         based on the countries actually used in the transform tables. A MD5 hash value
         created from the concatenation of all values of a given record is used to
         check whether a record in the load.dim_country table must be updated or not.
+
+        Args:
+            batch_ids (list): The IDs of the staging batches to be merged.
         """
 
         query = """
@@ -26,9 +114,9 @@ class DataLoader(DatabaseConnector):
                     ) AS hash_value
                 FROM extract.country ec
                 INNER JOIN (
-                    SELECT country_id FROM transform.covid_data_import
+                    SELECT country_id FROM transform.covid_data_import WHERE batch_id = ANY(%(batch_ids)s)
                     UNION
-                    SELECT country_id FROM transform.weather_data_import
+                    SELECT country_id FROM transform.weather_data_import WHERE batch_id = ANY(%(batch_ids)s)
                 ) AS used_ids
                 ON ec.id = used_ids.country_id
             ) AS source
@@ -45,15 +133,18 @@ class DataLoader(DatabaseConnector):
                 VALUES (source.id, source.code, source.name,
                   source.latitude, source.longitude, source.hash_value);
         """
-        self.execute_query(query)
+        self.execute_query(query, {"batch_ids": batch_ids})
 
-    def merge_dim_date(self):
+    def merge_dim_date(self, batch_ids:list):
         """
         Merges (aka. UPSERTs) the date details from the staging tables in the
         transform schema (weather_data_import, covid_data_import) with the load.dim_date
         dimension table. A MD5 hash value created from the concatenation of all values
         of a given record is used to check whether a record in the load.dim_date table
         must be updated or not.
+
+        Args:
+            batch_ids (list): The IDs of the staging batches to be merged.
         """
 
         query = """
@@ -76,9 +167,9 @@ class DataLoader(DatabaseConnector):
                         CASE WHEN EXTRACT(DOW FROM date) IN (0, 6) THEN 'TRUE' ELSE 'FALSE' END
                     ) AS hash_value
                 FROM (
-                    SELECT date FROM transform.covid_data_import
+                    SELECT date FROM transform.covid_data_import WHERE batch_id = ANY(%(batch_ids)s)
                     UNION
-                    SELECT date FROM transform.weather_data_import
+                    SELECT date FROM transform.weather_data_import WHERE batch_id = ANY(%(batch_ids)s)
                 ) AS combined_dates
             ) AS source
             ON target.date_id = source.date_id
@@ -96,25 +187,30 @@ class DataLoader(DatabaseConnector):
                 VALUES (source.date_id, source.date, source.year, source.month, source.day, source.day_of_week,
                 source.is_weekend, source.hash_value);
         """
-        self.execute_query(query)
+        self.execute_query(query, {"batch_ids": batch_ids})
 
-    def merge_dim_weather_description(self):
+    def merge_dim_weather_description(self, batch_ids:list):
         """
         Merges (aka. UPSERTs) the weather description details from the staging tables in the
         transform schema (weather_data_import, covid_data_import) with the
         load.dim_weather_description dimension table. A MD5 hash value created from the
         concatenation of all values of a given record is used to check whether a record in
         the load.dim_weather_description table must be updated or not.
+
+        Args:
+            batch_ids (list): The IDs of the staging batches to be merged.
         """
 
         query = """
             MERGE INTO load.dim_weather_code AS target
             USING (
-                SELECT DISTINCT
+                SELECT DISTINCT ON (weather_code)
                     weather_code,
                     weather_description,
                     md5(weather_code || '|' || weather_description) AS hash_value
                 FROM transform.weather_data_import
+                WHERE batch_id = ANY(%(batch_ids)s)
+                ORDER BY weather_code, batch_id DESC
             ) AS source
             ON target.weather_code = source.weather_code
             WHEN MATCHED AND target.hash_value != source.hash_value THEN
@@ -125,21 +221,24 @@ class DataLoader(DatabaseConnector):
                 INSERT (weather_code, description, hash_value)
                 VALUES (source.weather_code, source.weather_description, source.hash_value);
         """
-        self.execute_query(query)
+        self.execute_query(query, {"batch_ids": batch_ids})
 
-    def merge_fact_covid(self):
+    def merge_fact_covid(self, batch_ids:list):
         """
         Merges (aka. UPSERTs) the covid details from the staging tables in the
         transform schema (weather_data_import, covid_data_import) with the load.fact_covid_data
         fact table. A MD5 hash value created from the concatenation of all values
         of a given record is used to check whether a record in the load.fact_covid_data table
         must be updated or not.
+
+        Args:
+            batch_ids (list): The IDs of the staging batches to be merged.
         """
 
         query = """
             MERGE INTO load.fact_covid_data AS target
             USING (
-                SELECT
+                SELECT DISTINCT ON (c.country_id, d.date_id)
                     c.country_id,
                     d.date_id,
                     t.confirmed_cases,
@@ -155,6 +254,8 @@ class DataLoader(DatabaseConnector):
                 FROM transform.covid_data_import t
                 JOIN load.dim_country c ON t.country_id = c.country_id
                 JOIN load.dim_date d ON t.date = d.date
+                WHERE t.batch_id = ANY(%(batch_ids)s)
+                ORDER BY c.country_id, d.date_id, t.batch_id DESC, t.id DESC
             ) AS source
             ON target.country_id = source.country_id AND target.date_id = source.date_id
             WHEN MATCHED AND target.hash_value != source.hash_value THEN
@@ -169,21 +270,24 @@ class DataLoader(DatabaseConnector):
                 VALUES (source.country_id, source.date_id, source.confirmed_cases, source.deaths,
                 source.recovered, source.hash_value, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP);
         """
-        self.execute_query(query)
+        self.execute_query(query, {"batch_ids": batch_ids})
 
-    def merge_fact_weather(self):
+    def merge_fact_weather(self, batch_ids:list):
         """
         Merges (aka. UPSERTs) the weather details from the staging tables in the
         transform schema (weather_data_import, covid_data_import) with the load.fact_weather_data
         fact table. A MD5 hash value created from the concatenation of all values of a given
         record is used to check whether a record in the load.fact_weather_data table must be
         updated or not.
+
+        Args:
+            batch_ids (list): The IDs of the staging batches to be merged.
         """
 
         query = """
             MERGE INTO load.fact_weather_data AS target
             USING (
-                SELECT
+                SELECT DISTINCT ON (c.country_id, d.date_id)
                     c.country_id,
                     d.date_id,
                     t.weather_code,
@@ -205,6 +309,8 @@ class DataLoader(DatabaseConnector):
                 FROM transform.weather_data_import t
                 JOIN load.dim_country c ON t.country_id = c.country_id
                 JOIN load.dim_date d ON t.date = d.date
+                WHERE t.batch_id = ANY(%(batch_ids)s)
+                ORDER BY c.country_id, d.date_id, t.batch_id DESC, t.id DESC
             ) AS source
             ON target.country_id = source.country_id AND target.date_id = source.date_id
             WHEN MATCHED AND target.hash_value != source.hash_value THEN
@@ -224,4 +330,4 @@ class DataLoader(DatabaseConnector):
                 source.mean_surface_pressure, source.precipitation_sum, source.relative_humidity, source.wind_speed,
                 source.hash_value, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP);
         """
-        self.execute_query(query)
+        self.execute_query(query, {"batch_ids": batch_ids})
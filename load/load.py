@@ -1,21 +1,82 @@
+import threading
+from psycopg2 import Error
 from load.data_loader import DataLoader
 
-def l_routine(db: DataLoader):
+def prune_staging_batches(db_config):
+    """
+    Deletes the staged rows of the consumed batches, with a connection of its
+    own, so that it can run in the background.
+
+    Args:
+        db_config (dict): PostgreSQL database connection parameters.
+    """
+
+    db = DataLoader(**db_config)
+    try:
+        db.prune_staging_batches()
+    except Error:
+        db.logger.error("The consumed staging batches could not be pruned, "
+                        "they will be pruned by the next load.")
+    finally:
+        db.close_connection()
+
+def l_routine(db: DataLoader, prune=True, stale_after=3600):
     """
     Attempts to complete the load part of the ETL.
     The process follows the scheme:
-        1) The dimension tables are first merged.
-        2) The fact tables are then merged.
+        1) The staging batches completed by the transform, and neither loaded
+            yet nor claimed by another running load, are claimed.
+        2) The dimension tables are first merged.
+        3) The fact tables are then merged.
+        4) The claimed batches are marked as consumed.
+    The merges only read the rows of the claimed batches, so that every load
+    is proportional to the data transformed since the previous one. Steps 2 to
+    4 form a single transaction: should a merge fail, the batches are handed
+    back, and claimed again by the next load. The batches of a load that
+    was interrupted are claimed again once their claim is stale_after
+    seconds old. The rows of the consumed batches are then deleted
+    from the staging tables by a background thread.
 
     Args:
         db (DataLoader object)
+        prune (bool): Whether the consumed batches are pruned.
+        stale_after (float): The number of seconds after which the claim of
+            an interrupted load is considered abandoned.
+
+    Returns:
+        pruner (Thread object): The thread pruning the consumed batches,
+            or None if there is nothing to prune.
     """
 
-    db.merge_dim_country()
-    db.merge_dim_date()
-    db.merge_dim_weather_description()
+    batch_ids = db.claim_staging_batches(stale_after)
+    if not batch_ids:
+        db.logger.info("There are no staging batches to be loaded.")
+        db.close_connection()
+        return None
+
+    try:
+        with db.transaction():
+            db.merge_dim_country(batch_ids)
+            db.merge_dim_date(batch_ids)
+            db.merge_dim_weather_description(batch_ids)
+
+            db.merge_fact_covid(batch_ids)
+            db.merge_fact_weather(batch_ids)
+
+            db.consume_staging_batches(batch_ids)
+        db.logger.info(f"The staging batches {batch_ids} have been loaded.")
+    except Error:
+        db.logger.error(f"The staging batches {batch_ids} could not be loaded, "
+                        f"they will be claimed again by the next load.")
+        db.release_staging_batches(batch_ids)
+        prune = False
+    finally:
+        db.close_connection()
 
-    db.merge_fact_covid()
-    db.merge_fact_weather()
+    if not prune:
+        return None
 
-    db.close_connection()
+    pruner = threading.Thread(target=prune_staging_batches, args=(db.db_config,),
+                              name="staging-pruner")
+    pruner.start()
+    return pruner
@@ -0,0 +1,347 @@
+import queue
+import threading
+from concurrent.futures import Future
+from extract.extract import e_routine, W_IMP_DIRNAME, C_IMP_DIRNAME
+from extract.data_extractor import DataExtractor
+from extract.log_writer import ExtractLogWriter
+from extract.covid_api import CovidAPI
+from extract.weather_api import WeatherAPI
+from transform.transform import (
+    find_country_id, parse_response, process_weather_file, process_covid_file,
+    load_weather_codes, apply_moves
+)
+from transform.data_transformer import DataTransformer
+from transform.staging_writer import StagingWriter
+from load.data_loader import DataLoader
+from load.load import l_routine
+from common.manifest import ManifestWriter, claim_manifest, release_manifest
+
+def stream_persist(persists, db_config, log_batch_size, logger):
+    """
+    Saves and records the raw files of the streamed responses, off the path of
+    the extract and of the transform, until it receives None. Every file gets
+    its import log record and its manifest entry, as in the extract, written
+    with a connection of its own, since the one of the extract is not shared
+    between threads. The future of every file is resolved once it is saved,
+    so that the transform only moves saved files.
+
+    Args:
+        persists (Queue object): The (file, persist, future) tuples of the
+            streamed responses, persist being the function handed over by
+            extract.extract.record_extraction.
+        db_config (dict): PostgreSQL database connection parameters.
+        log_batch_size (int): The number of import log records written per statement.
+        logger: The logger of the pipeline.
+    """
+
+    db = DataExtractor(**db_config)
+    manifest_writer = ManifestWriter()
+    log_writer = ExtractLogWriter(db, log_batch_size, manifest_writer)
+    try:
+        while True:
+            item = persists.get()
+            if item is None:
+                break
+            file, persist, future = item
+            try:
+                persist(log_writer, manifest_writer)
+            except Exception as e:
+                logger.error(f"{file} could not be saved: {e!r}")
+                future.set_exception(e)
+            else:
+                future.set_result(file)
+    finally:
+        log_writer.flush()
+        db.close_connection()
+
+def apply_saved_moves(db:DataTransformer, moves, saves):
+    """
+    Applies the deferred moves once the files are saved by stream_persist.
+    The files that could not be saved are not moved, and their transform log
+    records are left incomplete.
+
+    Args:
+        db (DataTransformer object)
+        moves (dict): The deferred moves, see transform.transform.route_file.
+            It is emptied.
+        saves (dict): The futures of the files being saved, by file.
+
+    Returns:
+        files (list): The files moved out of the raw directory.
+    """
+
+    for file in list(moves):
+        try:
+            saves.pop(file).result()
+        except Exception:
+            del moves[file]
+    return apply_moves(db, moves)
+
+def hand_over_batch(db:DataTransformer, staging_writer:StagingWriter, batches, moves, saves,
+                    processed_files):
+    """
+    Completes the staging batch the streaming transform is writing, hands it
+    to the load and opens a new one. The deferred moves of the files whose
+    rows are now written are applied first.
+
+    Args:
+        db (DataTransformer object)
+        staging_writer (StagingWriter object)
+        batches (Queue object): The completed staging batches, read by stream_load.
+        moves (dict): The deferred moves, see transform.transform.route_file.
+        saves (dict): The futures of the files being saved, by file.
+        processed_files (set): Collects the files moved out of the raw directories.
+    """
+
+    staging_writer.flush()
+    processed_files.update(apply_saved_moves(db, moves, saves))
+    db.complete_staging_batch(staging_writer.batch_id)
+    batches.put(staging_writer.batch_id)
+    staging_writer.batch_id = db.create_staging_batch()
+
+def stream_transform(responses, batches, countries, db:DataTransformer, staging_writer:StagingWriter,
+                     processed_files, extract_done, batch_files=500, flush_interval=5.0):
+    """
+    Transforms the responses of the extract as they come in, from the bodies
+    held in memory, while their raw files are saved by stream_persist.
+    Every file is processed by process_weather_file or process_covid_file, as
+    by the transform, including the log records and the move of the file, which
+    are deferred until the rows of the file are written and the file is saved.
+    The staging batch is
+    handed to the load every batch_files files, or once no file came in for
+    flush_interval seconds, so that the load runs while the extract is still
+    sending requests. The last batch is handed to the load even if the
+    transform fails.
+
+    Args:
+        responses (Queue object): The (file, api_type, data, future) tuples of the
+            extract, followed by None once the extract is done. The future is
+            resolved by stream_persist once the file is saved.
+        batches (Queue object): The completed staging batches, read by stream_load.
+        countries (CountryIndex object): The countries of the extract.country table.
+        db (DataTransformer object)
+        staging_writer (StagingWriter object)
+        processed_files (set): Collects the files moved out of the raw directories.
+        extract_done (Event object): Set once None is taken off the responses.
+        batch_files (int): The number of files per staging batch.
+        flush_interval (float): The number of seconds without any file after
+            which the staging batch is handed over anyway.
+    """
+
+    moves = {}
+    saves = {}
+    batch_count = 0
+    try:
+        while True:
+            try:
+                item = responses.get(timeout=flush_interval if batch_count else None)
+            except queue.Empty:
+                hand_over_batch(db, staging_writer, batches, moves, saves, processed_files)
+                batch_count = 0
+                continue
+            if item is None:
+                extract_done.set()
+                break
+
+            file, api_type, data, saves[file] = item
+            process_file = process_weather_file if api_type == "w" else process_covid_file
+            rows = parse_response(data, api_type, find_country_id(file, countries))
+            try:
+                process_file(file, countries, db, staging_writer, rows, moves)
+            except Exception:
+                moves.pop(file, None)
+                saves.pop(file, None)
+                staging_writer.discard(file)
+                db.logger.error(f"{file} could not be transformed and is left in the raw directory.")
+            if staging_writer.is_empty():
+                processed_files.update(apply_saved_moves(db, moves, saves))
+
+            batch_count += 1
+            if batch_count >= batch_files:
+                hand_over_batch(db, staging_writer, batches, moves, saves, processed_files)
+                batch_count = 0
+    finally:
+        try:
+            staging_writer.flush()
+            processed_files.update(apply_saved_moves(db, moves, saves))
+            db.complete_staging_batch(staging_writer.batch_id)
+        finally:
+            # The load is woken up either way, so that it does not wait forever.
+            batches.put(staging_writer.batch_id)
+
+def run_stream_transform(responses, batches, countries, db:DataTransformer,
+                         staging_writer:StagingWriter, processed_files, batch_files=500,
+                         flush_interval=5.0):
+    """
+    Runs stream_transform in its own thread. Should the transform fail before
+    the extract is done, the remaining responses are drained, so that the
+    extract is not held back by a full queue, and their files are left in the
+    raw directories.
+
+    Args:
+        As in stream_transform, except for extract_done.
+    """
+
+    extract_done = threading.Event()
+    try:
+        stream_transform(responses, batches, countries, db, staging_writer,
+                         processed_files, extract_done, batch_files, flush_interval)
+    except Exception:
+        db.logger.error("The streaming transform failed, the remaining files are left "
+                        "in the raw directories for the next transform.")
+        if not extract_done.is_set():
+            while responses.get() is not None:
+                pass
+    finally:
+        db.close_connection()
+
+def stream_load(batches, db_config, logger):
+    """
+    Runs the load with l_routine every time the streaming transform hands over
+    a staging batch, until it receives None. The batches handed over in the
+    meantime are loaded together, since l_routine claims every completed batch.
+    A single DataLoader is reused by every load, each of them checking out a
+    connection from the pool again. Every load waits for the consumed batches
+    of the previous one to be pruned. Should a load fail, its batches are left
+    to the next one, and the queue is still drained until None, so that the
+    transform is never held back by a full queue.
+
+    Args:
+        batches (Queue object): The completed staging batches.
+        db_config (dict): PostgreSQL database connection parameters.
+        logger: The logger of the pipeline.
+    """
+
+    db = DataLoader(**db_config)
+    pruner = None
+    done = False
+    while not done:
+        if batches.get() is None:
+            break
+        while True:
+            try:
+                if batches.get_nowait() is None:
+                    done = True
+                    break
+            except queue.Empty:
+                break
+
+        if pruner is not None:
+            pruner.join()
+        try:
+            pruner = l_routine(db)
+        except Exception as e:
+            pruner = None
+            logger.error(f"The load failed, the staging batches are left to the next load: {e!r}")
+
+    if pruner is not None:
+        pruner.join()
+
+def release_streamed_files(processed_files):
+    """
+    Removes the streamed files from the manifests of the raw directories, so
+    that the transform does not look for them, and keeps the other ones.
+
+    Args:
+        processed_files (set): The files moved out of the raw directories.
+    """
+
+    for dir_name in (W_IMP_DIRNAME, C_IMP_DIRNAME):
+        files = claim_manifest(dir_name)
+        if files is not None:
+            release_manifest(dir_name, [file for file in files if file not in processed_files])
+
+def s_routine(w_api:WeatherAPI, c_api:CovidAPI, e_db:DataExtractor, t_db:DataTransformer, countries,
+              date, end_date=None, weather_workers=1, covid_workers=1, weather_batch_size=1,
+              force=False, log_batch_size=100, raw_format="json", queue_size=100, batch_files=500,
+              flush_interval=5.0, staging_chunk_size=1000, staging_method="copy",
+              staging_mode="truncate", seed_weather_codes=False):
+    """
+    Attempts to complete the entire ETL as a streaming pipeline, in which the
+    extract, the transform and the load overlap, instead of running one after
+    the other. The process follows the scheme:
+        1) The extract runs as in e_routine, in the calling thread, with the files
+            layout. Every response body is put on a queue, holding at most
+            queue_size files, before its raw file is saved.
+        2) A writer thread saves and logs the raw files, with stream_persist,
+            while a transform thread processes the responses as they come in,
+            with stream_transform, writing their rows under a staging batch.
+        3) Every completed staging batch is put on a second queue, from which a
+            load thread runs l_routine, while the extract and the transform go on.
+        4) Once done, the streamed files are removed from the manifests, whereas
+            the files left in the raw directories stay listed for the next transform.
+    The raw files are still saved, moved and logged as by the transform, so that
+    they can be audited and reprocessed. Should the extract outpace the transform,
+    the extract waits for room on the queue, so that the responses held in memory
+    stay bounded.
+
+    Args:
+        w_api (WeatherAPI object)
+        c_api (CovidAPI object)
+        e_db (DataExtractor object)
+        t_db (DataTransformer object)
+        countries (CountryIndex object): The countries of the extract.country table.
+        date (str): A given date for extraction, or the first date of a range.
+        end_date (str): The last date of a range, if applicable.
+        weather_workers (int): The maximum number of Weather API requests in flight.
+        covid_workers (int): The maximum number of COVID API requests in flight.
+        weather_batch_size (int): The number of countries per Weather API request.
+        force (bool): Whether files that were already extracted should be
+            extracted again.
+        log_batch_size (int): The number of extract log records written per statement.
+        raw_format (str): The storage format of the raw files, one of the
+            keys of common.utils.RAW_FORMATS.
+        queue_size (int): The maximum number of files, and of staging batches,
+            waiting on either queue.
+        batch_files (int): The number of files per staging batch.
+        flush_interval (float): The number of seconds without any file after
+            which the staging batch is handed to the load anyway.
+        staging_chunk_size (int): The number of rows written per statement.
+        staging_method (str): Either "copy" (COPY FROM STDIN) or "values"
+            (multi-row insert).
+        staging_mode (str): Either "truncate", which empties the staging tables
+            first, or "incremental", which adds batches to the ones already staged.
+        seed_weather_codes (bool): Whether the weather codes of the
+            load.dim_weather_code table should complete the ones of the .csv file.
+    """
+
+    if staging_mode == "truncate":
+        t_db.discard_staging_batches()
+    load_weather_codes(t_db, seed_weather_codes)
+    staging_writer = StagingWriter(t_db, staging_chunk_size, staging_method, t_db.create_staging_batch())
+
+    responses = queue.Queue(maxsize=queue_size)
+    persists = queue.Queue(maxsize=queue_size)
+    batches = queue.Queue(maxsize=queue_size)
+    processed_files = set()
+
+    writer = threading.Thread(target=stream_persist, name="stream-persist",
+                              args=(persists, e_db.db_config, log_batch_size, e_db.logger))
+
+    transformer = threading.Thread(target=run_stream_transform, name="stream-transform",
+                                   args=(responses, batches, countries, t_db, staging_writer,
+                                         processed_files, batch_files, flush_interval))
+    loader = threading.Thread(target=stream_load, name="stream-load",
+                              args=(batches, t_db.db_config, t_db.logger))
+    writer.start()
+    transformer.start()
+    loader.start()
+
+    def stream(file, api_type, data, persist):
+        future = Future()
+        responses.put((file, api_type, data, future))
+        persists.put((file, persist, future))
+
+    try:
+        e_routine(w_api, c_api, e_db, countries, date, end_date=end_date,
+                  weather_workers=weather_workers, covid_workers=covid_workers,
+                  weather_batch_size=weather_batch_size, force=force,
+                  log_batch_size=log_batch_size, raw_format=raw_format, stream=stream)
+    finally:
+        responses.put(None)
+        persists.put(None)
+        transformer.join()
+        batches.put(None)
+        writer.join()
+        loader.join()
+        release_streamed_files(processed_files)
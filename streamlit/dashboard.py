@@ -9,7 +9,9 @@ import streamlit as st
 
 def connect_to_database(**db_config):
     """
-    Initialize the DatabaseConnector object.
+    Initialize the DatabaseConnector object. Its connection is checked out
+    from the connection pool of the Streamlit process, which is shared by
+    every session and kept across the runs of the script.
 
     Args:
         **db_config (dict): PostgreSQL database connection parameters.
@@ -280,8 +282,12 @@ if __name__ == '__main__':
     # Configurating the pages.
     page = page_config()
 
-    # Selecting the pages.
-    if page == "API and Logs":
-        api_and_logs(db)
-    elif page == "Weather and COVID data":
-        covid_and_weather(db)
+    # Selecting the pages. The connection is put back into the pool once the
+    # page is rendered.
+    try:
+        if page == "API and Logs":
+            api_and_logs(db)
+        elif page == "Weather and COVID data":
+            covid_and_weather(db)
+    finally:
+        db.close_connection()
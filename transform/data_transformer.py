@@ -1,4 +1,16 @@
+import io
+import csv
+from psycopg2 import Error
+from psycopg2.extras import execute_values
 from common.database_connector import DatabaseConnector
+
+WEATHER_DATA_COLUMNS = (
+    "country_id", "date", "weather_code", "weather_description",
+    "mean_temperature", "mean_surface_pressure", "precipitation_sum",
+    "relative_humidity", "wind_speed", "batch_id"
+)
+COVID_DATA_COLUMNS = ("country_id", "date", "confirmed_cases", "deaths", "recovered", "batch_id")
+
 class DataTransformer(DatabaseConnector):
     def insert_initial_transform_log(self, values:tuple):
         """
@@ -50,7 +62,7 @@ class DataTransformer(DatabaseConnector):
         Inserts the weather data extracted from a processed file.
 
         Args:
-            values (tuple): A 9-element tuple containing:
+            values (tuple): A 10-element tuple containing:
                 country_id (int): The country ID.
                 date (str): The given date for which the weather was extracted.
                 weather_code (str): The weather for that date.
@@ -60,15 +72,16 @@ class DataTransformer(DatabaseConnector):
                 precipitation_sum (float): The precipitation sum.
                 relative_humidity (float): The relative humidity.
                 wind_speed (float): The wind speed.
+                batch_id (int): The ID of the staging batch.
         """
 
         query = """
         INSERT INTO transform.weather_data_import (
             country_id, date, weather_code, weather_description,
             mean_temperature, mean_surface_pressure, precipitation_sum,
-            relative_humidity, wind_speed
+            relative_humidity, wind_speed, batch_id
         )
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s);
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
         """
         self.execute_query(query, values)
 
@@ -77,19 +90,155 @@ class DataTransformer(DatabaseConnector):
         Inserts the COVID-19 data extracted from a processed file.
 
         Args:
-            values (tuple): A 5-element tuple containing:
+            values (tuple): A 6-element tuple containing:
                 country_id (int): The country ID.
                 date (str): The given date for which the weather was extracted.
                 confirmed_cases (int): The number of confirmed cases.
                 deaths (int): The number of deaths.
                 recovered (int): The number of recovered patients.
+                batch_id (int): The ID of the staging batch.
         """
 
         query = """
             INSERT INTO transform.covid_data_import (
                 country_id, date, confirmed_cases,
-                deaths, recovered
+                deaths, recovered, batch_id
             )
-            VALUES (%s, %s, %s, %s, %s);
+            VALUES (%s, %s, %s, %s, %s, %s);
         """
         self.execute_query(query, values)
+
+    def create_staging_batch(self):
+        """
+        Opens a new batch in the transform.staging_batch table, under which the
+        rows of the current transform are staged. It is only handed to the load
+        once complete_staging_batch is called.
+
+        Returns:
+            batch_id (int): The ID of the batch.
+        """
+
+        query = """
+            INSERT INTO transform.staging_batch (status)
+            VALUES ('ongoing')
+            RETURNING id;
+        """
+        return self.execute_query_and_return_id(query, ())
+
+    def complete_staging_batch(self, batch_id):
+        """
+        Marks a batch as pending, i.e. ready to be consumed by the load.
+
+        Args:
+            batch_id (int): The ID of the batch.
+        """
+
+        query = """
+            UPDATE transform.staging_batch
+            SET status = 'pending'
+            WHERE id = %s AND status = 'ongoing';
+        """
+        self.execute_query(query, (batch_id,))
+
+    def discard_staging_batches(self):
+        """
+        Empties the staging tables, as the transform used to do on every run,
+        and marks the batches whose rows are gone as discarded.
+        """
+
+        self.truncate_table("transform.weather_data_import")
+        self.truncate_table("transform.covid_data_import")
+
+        query = """
+            UPDATE transform.staging_batch
+            SET status = 'discarded'
+            WHERE status IN ('ongoing', 'pending', 'consumed');
+        """
+        self.execute_query(query)
+
+    def fetch_weather_codes(self):
+        """
+        Fetches the weather codes known to the load.dim_weather_code table.
+
+        Returns:
+            rows (list of tuple): (weather_code, description) tuples.
+        """
+
+        query = """
+            SELECT weather_code, description FROM load.dim_weather_code;
+        """
+        return self.fetch_rows(query) or []
+
+    def bulk_insert(self, table_name, columns, rows:list, method="copy"):
+        """
+        Inserts several rows in a staging table of the transform schema with a
+        single statement, and commits them at once. Within a transaction, the
+        statement is isolated by a savepoint, so that a rejected statement
+        leaves the transaction usable.
+
+        Args:
+            table_name (str): Either transform.weather_data_import or
+                transform.covid_data_import.
+            columns (tuple): The names of the columns, in the order of the rows.
+            rows (list of tuple): The rows to be inserted.
+            method (str): Either "copy", which streams the rows as CSV with
+                COPY FROM STDIN, or "values", which sends a multi-row insert.
+
+        Returns:
+            bool: True if the rows have been written, False if the
+                transaction was rolled back.
+        """
+
+        if not rows:
+            return True
+
+        column_list = ", ".join(columns)
+        try:
+            with self.savepoint("bulk_insert"):
+                if method == "copy":
+                    buffer = io.StringIO()
+                    csv.writer(buffer).writerows(rows)
+                    buffer.seek(0)
+                    self.cursor.copy_expert(
+                        f"COPY {table_name} ({column_list}) FROM STDIN WITH (FORMAT csv);", buffer
+                    )
+                else:
+                    execute_values(self.cursor, f"INSERT INTO {table_name} ({column_list}) VALUES %s;",
+                                   rows, page_size=len(rows))
+            self.commit()
+            self.logger.info(f"{len(rows)} rows have been written to {table_name}.")
+            return True
+        except Error:
+            if not self.in_transaction:
+                self.rollback_transaction()
+            return False
+
+    def insert_weather_rows(self, rows:list, method="copy"):
+        """
+        Inserts the weather data of several processed files at once.
+
+        Args:
+            rows (list of tuple): 10-element tuples, as expected by insert_weather_data,
+                the last element being the staging batch.
+            method (str): Either "copy" or "values", see bulk_insert.
+
+        Returns:
+            bool: True if the rows have been written.
+        """
+
+        return self.bulk_insert("transform.weather_data_import", WEATHER_DATA_COLUMNS, rows, method)
+
+    def insert_covid_rows(self, rows:list, method="copy"):
+        """
+        Inserts the COVID-19 data of several processed files at once.
+
+        Args:
+            rows (list of tuple): 6-element tuples, as expected by insert_covid_data,
+                the last element being the staging batch.
+            method (str): Either "copy" or "values", see bulk_insert.
+
+        Returns:
+            bool: True if the rows have been written.
+        """
+
+        return self.bulk_insert("transform.covid_data_import", COVID_DATA_COLUMNS, rows, method)
@@ -0,0 +1,165 @@
+from transform.data_transformer import DataTransformer
+
+class StagingWriter:
+    def __init__(self, db:DataTransformer, chunk_size=1000, method="copy", batch_id=None):
+        """
+        Initializes the StagingWriter object, which buffers the rows parsed by
+        the transform and writes them to the staging tables chunk_size rows at a
+        time, instead of one statement and one commit per row.
+        Should a chunk be rejected, its rows are written one by one instead, so
+        that a single invalid row does not cost the entire chunk. Within a
+        transaction, the rows are only written when flushed, and a rejected chunk
+        is written source by source instead, each source being a raw file or a
+        bundled record, so that the rejected sources can be routed to the error
+        status as a whole.
+
+        Args:
+            db (DataTransformer object)
+            chunk_size (int): The number of buffered rows that triggers a flush.
+            method (str): Either "copy" (COPY FROM STDIN) or "values"
+                (multi-row insert).
+            batch_id (int): The staging batch the rows are written under,
+                as returned by create_staging_batch.
+
+        Attributes:
+            db (DataTransformer object)
+            chunk_size (int): The number of buffered rows that triggers a flush.
+            method (str): Either "copy" or "values".
+            batch_id (int): The staging batch the rows are written under.
+            weather_rows (list): The buffered (source, rows) pairs of the
+                weather_data_import table.
+            covid_rows (list): The buffered (source, rows) pairs of the
+                covid_data_import table.
+            weather_count (int): The number of buffered weather rows.
+            covid_count (int): The number of buffered COVID rows.
+            rejected (list): The sources whose rows were rejected since
+                the last call to pop_rejected.
+        """
+
+        self.db = db
+        self.chunk_size = chunk_size
+        self.method = method
+        self.batch_id = batch_id
+        self.weather_rows = []
+        self.covid_rows = []
+        self.weather_count = 0
+        self.covid_count = 0
+        self.rejected = []
+
+    def add_weather_rows(self, rows:list, source=None):
+        """
+        Buffers rows of the weather_data_import table.
+
+        Args:
+            rows (list of tuple): As returned by parse_weather_data.
+            source: The raw file or bundled record the rows come from.
+        """
+
+        self.weather_rows.append((source, rows))
+        self.weather_count += len(rows)
+        if self.weather_count >= self.chunk_size and not self.db.in_transaction:
+            self.flush_weather()
+
+    def add_covid_rows(self, rows:list, source=None):
+        """
+        Buffers rows of the covid_data_import table.
+
+        Args:
+            rows (list of tuple): As returned by parse_covid_data.
+            source: The raw file or bundled record the rows come from.
+        """
+
+        self.covid_rows.append((source, rows))
+        self.covid_count += len(rows)
+        if self.covid_count >= self.chunk_size and not self.db.in_transaction:
+            self.flush_covid()
+
+    def is_empty(self):
+        """
+        Returns:
+            empty (bool): Whether every buffered row has been written.
+        """
+
+        return not self.weather_rows and not self.covid_rows
+
+    def discard(self, *sources):
+        """
+        Drops the buffered rows of the given sources, e.g. the ones of a file
+        whose transform was rolled back.
+
+        Args:
+            *sources: The raw files or bundled records.
+        """
+
+        sources = set(sources)
+        self.weather_rows = [(source, rows) for source, rows in self.weather_rows if source not in sources]
+        self.covid_rows = [(source, rows) for source, rows in self.covid_rows if source not in sources]
+        self.weather_count = sum(len(rows) for _, rows in self.weather_rows)
+        self.covid_count = sum(len(rows) for _, rows in self.covid_rows)
+
+    def pop_rejected(self):
+        """
+        Hands over the sources whose rows were rejected.
+
+        Returns:
+            rejected (list): The raw files or bundled records.
+        """
+
+        rejected, self.rejected = self.rejected, []
+        return rejected
+
+    def _write(self, batches, insert_rows, insert_row, label):
+        """
+        Writes buffered (source, rows) pairs chunk_size rows at a time,
+        each row being tagged with the staging batch.
+
+        Args:
+            batches (list): The buffered (source, rows) pairs.
+            insert_rows: Writes several rows at once, e.g. insert_weather_rows.
+            insert_row: Writes a single row, e.g. insert_weather_data.
+            label (str): Designates the rows in the logs.
+        """
+
+        batch_tag = (self.batch_id,)
+        chunk, chunk_count = [], 0
+        for i, (source, rows) in enumerate(batches):
+            chunk.append((source, [row + batch_tag for row in rows]))
+            chunk_count += len(rows)
+            if chunk_count < self.chunk_size and i < len(batches) - 1:
+                continue
+
+            if not insert_rows([row for _, rows in chunk for row in rows], self.method):
+                if self.db.in_transaction:
+                    self.db.logger.warning(f"Writing {chunk_count} {label} rows source by source.")
+                    self.rejected.extend(source for source, rows in chunk
+                                         if not insert_rows(rows, self.method))
+                else:
+                    self.db.logger.warning(f"Writing {chunk_count} {label} rows one by one.")
+                    for _, rows in chunk:
+                        for insert_values in rows:
+                            insert_row(insert_values)
+            chunk, chunk_count = [], 0
+
+    def flush_weather(self):
+        """
+        Writes the buffered rows of the weather_data_import table.
+        """
+
+        batches, self.weather_rows, self.weather_count = self.weather_rows, [], 0
+        self._write(batches, self.db.insert_weather_rows, self.db.insert_weather_data, "weather")
+
+    def flush_covid(self):
+        """
+        Writes the buffered rows of the covid_data_import table.
+        """
+
+        batches, self.covid_rows, self.covid_count = self.covid_rows, [], 0
+        self._write(batches, self.db.insert_covid_rows, self.db.insert_covid_data, "COVID")
+
+    def flush(self):
+        """
+        Writes all buffered rows to the staging tables.
+        """
+
+        self.flush_weather()
+        self.flush_covid()
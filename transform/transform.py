@@ -1,10 +1,304 @@
+import os
+from collections import deque
+from itertools import islice, repeat
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from psycopg2 import Error
 from transform.data_transformer import DataTransformer
+from transform.staging_writer import StagingWriter
 from common.utils import (
     open_file, move_file, list_all_files_from_directory,
-    get_weather_description, check_expected_format
+    check_expected_format, WEATHER_DAILY_VARIABLES
 )
+from common.weather_codes import WeatherCodeRegistry, get_weather_code_registry
+from common.bundle import (
+    INDEX_EXTENSION, is_bundle_file, read_bundle_index, read_bundle_records, update_bundle_index
+)
+from common.manifest import claim_manifest, release_manifest
+
+# The columns of the weather_data_import table holding measurements,
+# in the order of the table.
+WEATHER_MEASUREMENT_COLUMNS = (
+    "mean_temperature", "mean_surface_pressure", "precipitation_sum",
+    "relative_humidity", "wind_speed"
+)
+
+# The registry of the weather codes used by the current process, either the
+# main process or a worker process, as set by use_weather_codes.
+_weather_codes = None
+
+def use_weather_codes(weather_codes:WeatherCodeRegistry):
+    """
+    Sets the registry of the weather codes used by parse_weather_data in the
+    current process. It is also the initializer of the worker processes.
+
+    Args:
+        weather_codes (WeatherCodeRegistry object)
+    """
+
+    global _weather_codes
+    _weather_codes = weather_codes
+
+def load_weather_codes(db:DataTransformer, seed=False):
+    """
+    Loads the registry of the weather codes from the .csv file, and sets it
+    as the one of the current process with use_weather_codes.
+
+    Args:
+        db (DataTransformer object)
+        seed (bool): Whether the weather codes of the load.dim_weather_code
+            table should complete the ones of the .csv file.
+
+    Returns:
+        weather_codes (WeatherCodeRegistry object)
+    """
+
+    weather_codes = WeatherCodeRegistry().load_csv()
+    if seed:
+        weather_codes.seed(db.fetch_weather_codes())
+    use_weather_codes(weather_codes)
+    return weather_codes
+
+def list_raw_files(dir_name, rescan=False):
+    """
+    Lists the raw files of a directory to be processed, by claiming the
+    manifest the extract keeps for the directory, instead of scanning it.
+    The directory is only scanned if it has no manifest yet, or on request,
+    e.g. to pick up files copied into it by hand.
+
+    Args:
+        dir_name (str): The raw directory.
+        rescan (bool): Whether the directory is scanned on top of the manifest.
+
+    Returns:
+        files (list): The complete names of the files.
+    """
+
+    files = claim_manifest(dir_name)
+    if files is None or rescan:
+        listed = set(files or [])
+        files = (files or []) + [file for file in list_all_files_from_directory(dir_name)
+                                 if file not in listed]
+    return files
+
+def parse_weather_data(data, country_id, weather_codes=None):
+    """
+    Parses the response of the Weather API into rows of the
+    weather_data_import table, one row per day contained in the response.
+    The daily arrays are handled as columns: the measurements are converted and
+    checked for missing values by NumPy in one go, and every distinct weather
+    code is described once, so that responses spanning many days are not
+    parsed value by value. The rows are built by zipping the columns, in the order
+    of the columns of the table, ready to be written by the staging writer.
+
+    Args:
+        data (dict): The response body.
+        country_id (int): The ID of the country the response is about.
+        weather_codes (WeatherCodeRegistry object): Describes the weather codes.
+            Defaults to the registry set by use_weather_codes, or else to
+            the one of the default .csv file.
+
+    Returns:
+        rows (list of tuple): The rows to be inserted.
+
+    Raises:
+        KeyError, TypeError, ValueError: If the response cannot be parsed,
+            e.g. if a daily array is missing, shorter than the time array,
+            or contains a missing value.
+    """
+
+    if weather_codes is None:
+        weather_codes = _weather_codes if _weather_codes is not None else get_weather_code_registry()
+
+    dates = data["daily"]["time"]
+    daily = {column: data["daily"][variable]
+             for variable, column in WEATHER_DAILY_VARIABLES.items()}
+    if any(len(values) != len(dates) for values in daily.values()):
+        raise ValueError("The daily arrays do not match the time array.")
+
+    measurements = np.array([daily[column] for column in WEATHER_MEASUREMENT_COLUMNS], dtype=float)
+    if np.isnan(measurements).any() or None in daily["weather_code"]:
+        raise ValueError("The daily arrays contain missing values.")
+
+    # A response only holds a handful of distinct weather codes, each described once.
+    distinct_codes = list(set(daily["weather_code"]))
+    code_names = {weather_code: str(weather_code) for weather_code in distinct_codes}
+    descriptions = {weather_code: str(weather_description) for weather_code, weather_description
+                    in zip(distinct_codes, weather_codes.describe_many(distinct_codes, "Unknown"))}
+    weather_codes_column = map(code_names.get, daily["weather_code"])
+    weather_descriptions = map(descriptions.get, daily["weather_code"])
+
+    return list(zip(repeat(int(country_id), len(dates)), dates, weather_codes_column,
+                    weather_descriptions, *measurements.tolist()))
+
+def parse_covid_data(data, country_id):
+    """
+    Parses the response of the COVID-19 API into a row of the covid_data_import table.
+
+    Args:
+        data (dict): The response body.
+        country_id (int): The ID of the country the response is about.
+
+    Returns:
+        rows (list of tuple): The single row to be inserted.
+
+    Raises:
+        KeyError, IndexError, TypeError: If the response cannot be parsed.
+    """
+
+    date = data["data"]["date"]
+    confirmed_cases = data["data"]["confirmed_diff"]
+    deaths = data["data"]["deaths_diff"]
+    recovered = data["data"]["recovered_diff"]
+
+    return [(int(country_id), date, int(confirmed_cases), int(deaths), int(recovered))]
+
+def find_country_id(file, countries):
+    """
+    Looks up the country of a raw file, based on the country code in its name.
+
+    Args:
+        file (str): The complete name of the file.
+        countries (CountryIndex object): The countries of the extract.country table.
+
+    Returns:
+        country_id (int): The ID of the country, or None if the file does not
+            follow the expected format or the country is unknown.
+    """
+
+    result = check_expected_format(file)
+    if not result:
+        return None
+
+    return countries.get_id(result[0])
+
+def parse_response(data, api_type, country_id):
+    """
+    Parses the data of a raw file, or of a response held in memory, into rows
+    of the staging table of its API.
+
+    Args:
+        data: The response body.
+        api_type (str): Either "c" (COVID) or "w" (weather).
+        country_id (int): The ID of the country of the data, as found by find_country_id.
+
+    Returns:
+        rows (list of tuple): The parsed rows, or None if the data cannot be
+            parsed or belongs to no known country.
+    """
+
+    if country_id is None:
+        return None
+
+    parse_data = parse_weather_data if api_type == "w" else parse_covid_data
+    try:
+        return parse_data(data, country_id)
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None
+
+def parse_file(file, api_type, country_id):
+    """
+    Opens a raw file and parses its data with parse_response.
+    It touches neither the database nor the directories, therefore it is safe
+    to run in a worker process.
+
+    Args:
+        file (str): The complete name of the file.
+        api_type (str): Either "c" (COVID) or "w" (weather).
+        country_id (int): The ID of the country of the file, as found by find_country_id.
+
+    Returns:
+        rows (list of tuple): As returned by parse_response.
+    """
+
+    if country_id is None:
+        return None
+
+    return parse_response(open_file(file), api_type, country_id)
 
-def process_weather_file(file, countries, db):
+def parse_files(files, api_type, countries, pool=None, window=256):
+    """
+    Parses raw files with parse_file, either one after the other or in the
+    worker processes of a pool. With a pool, at most window files are parsed
+    ahead of the caller, so that the parsed rows do not pile up in memory.
+
+    Args:
+        files (list): The complete names of the files.
+        api_type (str): Either "c" (COVID) or "w" (weather).
+        countries (CountryIndex object): The countries of the extract.country table.
+        pool (ProcessPoolExecutor object): The worker processes, if any.
+        window (int): The maximum number of files parsed ahead.
+
+    Yields:
+        file (str): The complete name of the file, in the order of files.
+        rows (list of tuple): As returned by parse_file.
+    """
+
+    if pool is None:
+        for file in files:
+            yield file, parse_file(file, api_type, find_country_id(file, countries))
+        return
+
+    pending = deque()
+    for file in files:
+        pending.append((file, pool.submit(parse_file, file, api_type,
+                                          find_country_id(file, countries))))
+        if len(pending) >= window:
+            file, future = pending.popleft()
+            yield file, future.result()
+
+    while pending:
+        file, future = pending.popleft()
+        yield file, future.result()
+
+def route_file(file, p_dir_name, file_name, log_id, row_count, status, db, moves=None):
+    """
+    Moves a raw file to the directory matching its status and completes its
+    transform.transform_log record, or defers both until the rows of the file
+    are written to the staging tables, or the transaction is committed, so that
+    a file is never logged as processed while its rows are only buffered.
+
+    Args:
+        file (str): The complete name of the file.
+        p_dir_name (str): The directory the file is moved to.
+        file_name (str): The name of the file.
+        log_id (int): The ID of the transform.transform_log record of the file.
+        row_count (int): The number of rows of the file.
+        status (str): Either "processed" or "error".
+        db (DataTransformer object)
+        moves (dict): The deferred moves, as (p_dir_name, file_name, log_id,
+            row_count, status) tuples by file, or None if the file is to be
+            moved at once.
+    """
+
+    if moves is None:
+        move_file(file, p_dir_name, file_name)
+        db.update_transform_log((p_dir_name, file_name, row_count, status, log_id))
+    else:
+        moves[file] = (p_dir_name, file_name, log_id, row_count, status)
+
+def apply_moves(db, moves):
+    """
+    Completes the transform.transform_log records of the deferred moves, once
+    the rows of their files are written, and moves the files.
+
+    Args:
+        db (DataTransformer object)
+        moves (dict): The deferred moves, as recorded by route_file.
+            It is emptied.
+
+    Returns:
+        files (list): The files moved out of the raw directory.
+    """
+
+    for file, (p_dir_name, file_name, log_id, row_count, status) in moves.items():
+        move_file(file, p_dir_name, file_name)
+        db.update_transform_log((p_dir_name, file_name, row_count, status, log_id))
+    files = list(moves)
+    moves.clear()
+    return files
+
+def process_weather_file(file, countries, db, staging_writer, rows, moves=None):
     """
     Processes a raw file containg the extracted data from the Weather API.
     For each given file containg weather data, the process follows the scheme:
@@ -15,15 +309,22 @@ def process_weather_file(file, countries, db):
             table, otherwise a record in the transform.transform_log table is added
             with the batch date but a NULL country ID. The file is moved to the error
             directory.
-        3) If the data from the file can be parsed properly, it is inserted in the
-            weather_data_import table. Otherwise, the data in the file is untouched.
-        4) The file is moved to its corresponding directory depending on its status.
+        3) If the data from the file could be parsed properly by parse_file, it is
+            handed to the staging writer of the weather_data_import table, with one
+            row per day contained in the file. Otherwise, the data in the file is
+            untouched.
+        4) The file is moved to its corresponding directory depending on its status,
+            and its log record is completed. With deferred moves, both wait until
+            the rows of the file are written, or the transaction is committed.
 
     Args:
         file (str): The complete name of the file to be processed.
-        countries (DataFrame): A DataFrame used for validating whether the file contains
+        countries (CountryIndex object): Used for validating whether the file contains
             a valid country code from the extract.country table.
         db (DataTransformer object)
+        staging_writer (StagingWriter object)
+        rows (list of tuple): The rows of the file, as returned by parse_file.
+        moves (dict): The deferred moves, see route_file.
     """
 
     file_name = file.split("/")[-1]
@@ -33,52 +334,32 @@ def process_weather_file(file, countries, db):
     result = check_expected_format(file)
     if result:
         country_code, batch_date = result
-        filtered = countries[countries["code"] == country_code]
+        country_id = countries.get_id(country_code)
 
-        if not filtered.empty:
-            country_id = filtered["id"].values[0]
+        if country_id is not None:
             try:
                 log_id = db.insert_initial_transform_log((batch_date, int(country_id), "ongoing"))
 
-                data = open_file(file)
-                try:
-                    date = data["daily"]["time"][0]
-                    weather_code = data["daily"]["weather_code"][0]
-                    mean_temperature = data["daily"]["temperature_2m_mean"][0]
-                    mean_surface_pressure = data["daily"]["surface_pressure_mean"][0]
-                    precipitation_sum = data["daily"]["precipitation_sum"][0]
-                    relative_humidity = data["daily"]["relative_humidity_2m_mean"][0]
-                    wind_speed = data["daily"]["wind_speed_10m_mean"][0]
-                    weather_description = get_weather_description(str(weather_code)) or "Unknown"
-
-                    insert_values = (
-                        int(country_id), date, str(weather_code), str(weather_description),
-                        float(mean_temperature), float(mean_surface_pressure),
-                        float(precipitation_sum), float(relative_humidity), float(wind_speed)
-                    )
-                    db.insert_weather_data(insert_values)
+                row_count = 0
+                if rows is not None:
+                    staging_writer.add_weather_rows(rows, file)
 
+                    row_count = len(rows)
                     status = "processed"
                     p_dir_name = "data/processed/weather_data/"
-                except KeyError:
-                    pass
 
-                move_file(file, p_dir_name, file_name)
-                db.update_transform_log((p_dir_name, file_name, 1, status, log_id))
+                route_file(file, p_dir_name, file_name, log_id, row_count, status, db, moves)
 
             except Exception:
-                move_file(file, p_dir_name, file_name)
-                db.update_transform_log((p_dir_name, file_name, 0, status, log_id))
+                route_file(file, p_dir_name, file_name, log_id, 0, status, db, moves)
         else:
             log_id = db.insert_initial_transform_log((batch_date, None, status))
-            move_file(file, p_dir_name, file_name)
-            db.update_transform_log((p_dir_name, file_name, 0, status, log_id))
+            route_file(file, p_dir_name, file_name, log_id, 0, status, db, moves)
     else:
         log_id = db.insert_initial_transform_log((None, None, status))
-        move_file(file, p_dir_name, file_name)
-        db.update_transform_log((p_dir_name, file_name, 0, status, log_id))
+        route_file(file, p_dir_name, file_name, log_id, 0, status, db, moves)
 
-def process_covid_file(file, countries, db):
+def process_covid_file(file, countries, db, staging_writer, rows, moves=None):
     """
     Processes a raw file containg the extracted data from the COVID-19 API.
     For each given file containg COVID-19 data, the process follows the scheme:
@@ -89,15 +370,21 @@ def process_covid_file(file, countries, db):
             table, otherwise a record in the transform.transform_log table is added
             with the batch date but a NULL country ID. The file is moved to the error
             directory.
-        3) If the data from the file can be parsed properly, it is inserted in the
-            covid_data_import table. Otherwise, the data in the file is untouched.
-        4) The file is moved to its corresponding directory depending on its status.
+        3) If the data from the file could be parsed properly by parse_file, it is
+            handed to the staging writer of the covid_data_import table. Otherwise,
+            the data in the file is untouched.
+        4) The file is moved to its corresponding directory depending on its status,
+            and its log record is completed. With deferred moves, both wait until
+            the rows of the file are written, or the transaction is committed.
 
     Args:
         file (str): The complete name of the file to be processed.
-        countries (DataFrame): A DataFrame used for validating whether the file contains
+        countries (CountryIndex object): Used for validating whether the file contains
             a valid country code from the extract.country table.
         db (DataTransformer object)
+        staging_writer (StagingWriter object)
+        rows (list of tuple): The rows of the file, as returned by parse_file.
+        moves (dict): The deferred moves, see route_file.
     """
 
     file_name = file.split("/")[-1]
@@ -107,70 +394,300 @@ def process_covid_file(file, countries, db):
     result = check_expected_format(file)
     if result:
         country_code, batch_date = result
-        filtered = countries[countries["code"] == country_code]
+        country_id = countries.get_id(country_code)
 
-        if not filtered.empty:
-            country_id = filtered["id"].values[0]
+        if country_id is not None:
             try:
                 log_id = db.insert_initial_transform_log((batch_date, int(country_id), "ongoing"))
 
-                data = open_file(file)
-                try:
-                    date = data["data"]["date"]
-                    confirmed_cases = data["data"]["confirmed_diff"]
-                    deaths = data["data"]["deaths_diff"]
-                    recovered = data["data"]["recovered_diff"]
-
-                    insert_values = (int(country_id), date, int(confirmed_cases),
-                                     int(deaths), int(recovered))
-                    db.insert_covid_data(insert_values)
+                row_count = 0
+                if rows is not None:
+                    staging_writer.add_covid_rows(rows, file)
 
+                    row_count = len(rows)
                     status = "processed"
                     p_dir_name = "data/processed/covid_data/"
-                except KeyError:
-                    pass
 
-                move_file(file, p_dir_name, file_name)
-                db.update_transform_log((p_dir_name, file_name, 1, status, log_id))
+                route_file(file, p_dir_name, file_name, log_id, row_count, status, db, moves)
 
             except Exception:
-                move_file(file, p_dir_name, file_name)
-                db.update_transform_log((p_dir_name, file_name, 0, status, log_id))
+                route_file(file, p_dir_name, file_name, log_id, 0, status, db, moves)
         else:
             log_id = db.insert_initial_transform_log((batch_date, None, status))
-            move_file(file, p_dir_name, file_name)
-            db.update_transform_log((p_dir_name, file_name, 0, status, log_id))
+            route_file(file, p_dir_name, file_name, log_id, 0, status, db, moves)
     else:
         log_id = db.insert_initial_transform_log((None, None, status))
+        route_file(file, p_dir_name, file_name, log_id, 0, status, db, moves)
+
+def process_bundle_record(entry, data, batch_date, dir_name, countries, db, api_type, add_rows):
+    """
+    Processes a single record of a bundle:
+        1) Checks whether the country code of the record is present in the
+            extract.country table, otherwise a record in the transform.transform_log
+            table is added with the batch date but a NULL country ID.
+        2) If the record can be parsed properly, its rows are handed to the staging
+            writer of the weather_data_import or covid_data_import table.
+
+    Args:
+        entry (dict): The entry of the record in the index of the bundle.
+        data: The data of the record, as returned by read_bundle_records.
+        batch_date (str): The batch date of the bundle.
+        dir_name (str): The directory of the bundle.
+        countries (CountryIndex object): The countries of the extract.country table.
+        db (DataTransformer object)
+        api_type (str): Either "c" (COVID) or "w" (weather).
+        add_rows: Either add_weather_rows or add_covid_rows of the staging writer.
+
+    Returns:
+        update (dict): The entry to be appended to the index of the bundle.
+        log_id (int): The ID of the transform.transform_log record.
+    """
+
+    parse_data = parse_weather_data if api_type == "w" else parse_covid_data
+    status, row_count = "error", 0
+    country_id = countries.get_id(entry["code"])
+
+    if country_id is None:
+        log_id = db.insert_initial_transform_log((batch_date, None, status))
+    else:
+        log_id = db.insert_initial_transform_log((batch_date, int(country_id), "ongoing"))
+        try:
+            rows = parse_data(data, country_id)
+            add_rows(rows, (entry["file"], entry["code"]))
+
+            status, row_count = "processed", len(rows)
+        except (KeyError, IndexError, TypeError, ValueError):
+            pass
+
+    db.update_transform_log((dir_name, entry["file"], row_count, status, log_id))
+    return {"code": entry["code"], "status": status, "row_count": row_count}, log_id
+
+def process_bundle(index_file, countries, db, staging_writer, transactional=False):
+    """
+    Processes a bundle of raw records, as written by the extract with the bundles
+    layout, by streaming the records that are still pending according to the
+    index of the bundle. Each record is processed by process_bundle_record, and
+    its status, processed or error, is appended to the index, instead of the
+    record being moved to another directory.
+    In transactional mode, the whole bundle is processed in a single transaction,
+    every record being isolated by a savepoint: a record that cannot be logged is
+    left pending, and a record whose rows are rejected by the staging tables is
+    routed to the error status. The index is only updated once committed.
+
+    Args:
+        index_file (str): The complete name of the index of the bundle.
+        countries (CountryIndex object): Used for validating whether the records
+            contain a valid country code from the extract.country table.
+        db (DataTransformer object)
+        staging_writer (StagingWriter object)
+        transactional (bool): Whether the bundle is processed in a single transaction.
+    """
+
+    dir_name = os.path.dirname(index_file)
+    stem = os.path.basename(index_file)[:-len(INDEX_EXTENSION) - 1]
+    api_type = stem.split("_")[0]
+    batch_date = stem.split("_")[1]
+    add_rows = staging_writer.add_weather_rows if api_type == "w" else staging_writer.add_covid_rows
+
+    pending = [entry for entry in read_bundle_index(index_file).values()
+               if entry.get("status") == "raw"]
+
+    if not transactional:
+        updates = []
+        try:
+            for entry, data in read_bundle_records(dir_name, pending):
+                update, _ = process_bundle_record(entry, data, batch_date, dir_name,
+                                                  countries, db, api_type, add_rows)
+                updates.append(update)
+        finally:
+            # The statuses are only recorded once the rows are written.
+            staging_writer.flush()
+            update_bundle_index(index_file, updates)
+        return
+
+    updates, log_ids = {}, {}
+    try:
+        with db.transaction():
+            for entry, data in read_bundle_records(dir_name, pending):
+                try:
+                    with db.savepoint():
+                        update, log_id = process_bundle_record(entry, data, batch_date, dir_name,
+                                                               countries, db, api_type, add_rows)
+                except Exception:
+                    staging_writer.discard((entry["file"], entry["code"]))
+                    db.logger.error(f"The record of {entry['code']} in {index_file} could not be "
+                                    f"transformed and is left pending.")
+                    continue
+                updates[entry["code"]] = update
+                log_ids[entry["code"]] = (entry["file"], log_id)
+
+            staging_writer.flush()
+            for _, code in staging_writer.pop_rejected():
+                file_name, log_id = log_ids[code]
+                db.update_transform_log((dir_name, file_name, 0, "error", log_id))
+                updates[code] = {"code": code, "status": "error", "row_count": 0}
+    except Error:
+        staging_writer.discard(*((entry["file"], entry["code"]) for entry in pending))
+        staging_writer.pop_rejected()
+        db.logger.error(f"The transaction of {index_file} was rolled back, its records are left pending.")
+        return
+
+    update_bundle_index(index_file, list(updates.values()))
+
+def process_chunk(chunk, process_file, countries, db, staging_writer, error_dir):
+    """
+    Processes a chunk of raw files in a single transaction, committed once,
+    instead of committing every log record and staging write on its own.
+    Every file is isolated by a savepoint: a file that cannot be logged is rolled
+    back and left in the raw directory for the next run, without aborting the
+    chunk. The parsed rows of the chunk are then written to the staging tables,
+    and a file whose rows are rejected is routed to the error directory.
+    The files are only moved once the transaction is committed, so that a
+    rolled back chunk leaves all of its files in the raw directory.
+
+    Args:
+        chunk (list of tuple): The (file, rows) pairs, as yielded by parse_files.
+        process_file: Either process_weather_file or process_covid_file.
+        countries (CountryIndex object): The countries of the extract.country table.
+        db (DataTransformer object)
+        staging_writer (StagingWriter object)
+        error_dir (str): The error directory of the files.
+
+    Returns:
+        files (list): The files moved out of the raw directory.
+    """
+
+    moves = {}
+    try:
+        with db.transaction():
+            for file, rows in chunk:
+                try:
+                    with db.savepoint():
+                        process_file(file, countries, db, staging_writer, rows, moves)
+                except Exception:
+                    staging_writer.discard(file)
+                    moves.pop(file, None)
+                    db.logger.error(f"{file} could not be transformed and is left in the raw directory.")
+
+            staging_writer.flush()
+            for file in staging_writer.pop_rejected():
+                _, file_name, log_id, _, _ = moves[file]
+                moves[file] = (error_dir, file_name, log_id, 0, "error")
+            for p_dir_name, file_name, log_id, row_count, status in moves.values():
+                db.update_transform_log((p_dir_name, file_name, row_count, status, log_id))
+    except Error:
+        staging_writer.discard(*(file for file, _ in chunk))
+        staging_writer.pop_rejected()
+        db.logger.error(f"The transaction of a chunk of {len(chunk)} files was rolled back, "
+                        f"its files are left in the raw directory.")
+        return []
+
+    for file, (p_dir_name, file_name, _, _, _) in moves.items():
         move_file(file, p_dir_name, file_name)
-        db.update_transform_log((p_dir_name, file_name, 0, status, log_id))
+    return list(moves)
 
-def t_routine(countries, db: DataTransformer):
+def t_routine(countries, db: DataTransformer, staging_chunk_size=1000, staging_method="copy",
+              transform_workers=1, seed_weather_codes=False, transform_chunk_size=0,
+              staging_mode="truncate", rescan_raw=False):
     """
     Attempts to complete the transform part of the ETL.
     The process follows the scheme:
-        1) The files are listed from the raw directories associated with
-            each both weather and COVID-19 data.
+        1) The files are listed from the manifests of the raw directories
+            associated with each both weather and COVID-19 data (see list_raw_files).
         2) The two tables weather_data_import and covid_data_import from
-            the transform schema are truncated.
+            the transform schema are truncated, unless the staging mode is
+            incremental, and a new staging batch is opened.
         3) For each kind of file, the file name is analysed, and processed
             according to the logic specified in the process functions above.
+            Bundles are processed record by record through their index.
+        4) The parsed rows are written to the staging tables staging_chunk_size
+            rows at a time, under the staging batch, which is then handed to the
+            load. In incremental mode, the batches of the previous runs that were
+            not loaded yet are kept, so that the transform can run repeatedly.
+        5) The files left in the raw directories, e.g. the bundles, are listed
+            in the manifests again, for the next run.
+    With more than one transform worker, the files are opened and parsed by a
+    pool of worker processes, since decoding the large weather payloads is CPU
+    bound. The database bookkeeping, the staging writes and the file moves are
+    still done by the calling process, in the order of the files.
+    The weather codes are loaded once, before the files are processed, and
+    handed to every worker process.
+    With a transform chunk size, the files are processed transform_chunk_size at
+    a time by process_chunk, in one transaction per chunk, and every bundle in
+    one transaction, instead of committing every statement. Otherwise, the log
+    record and the move of every file are deferred until its rows are written
+    by the staging writer (see route_file).
 
     Args:
-        countries (DataFrame): DataFrame created based on the extract.country table.
+        countries (CountryIndex object): The countries of the extract.country table.
         db (DataTransformer object)
+        staging_chunk_size (int): The number of rows written per statement.
+        staging_method (str): Either "copy" (COPY FROM STDIN) or "values"
+            (multi-row insert).
+        transform_workers (int): The number of processes parsing the files.
+        seed_weather_codes (bool): Whether the weather codes of the
+            load.dim_weather_code table should complete the ones of the .csv file.
+        transform_chunk_size (int): The number of files processed per transaction.
+            0 commits every statement on its own.
+        staging_mode (str): Either "truncate", which empties the staging tables
+            first, or "incremental", which adds a batch to the ones already staged.
+        rescan_raw (bool): Whether the raw directories are scanned for files
+            missing from their manifests.
     """
 
-    files_weather = list_all_files_from_directory("data/raw/weather_data")
-    files_covid = list_all_files_from_directory("data/raw/covid_data")
+    files_weather = list_raw_files("data/raw/weather_data", rescan_raw)
+    files_covid = list_raw_files("data/raw/covid_data", rescan_raw)
+    processed_files = set()
+    moves = {}
+
+    if staging_mode == "truncate":
+        db.discard_staging_batches()
+    batch_id = db.create_staging_batch()
+
+    weather_codes = load_weather_codes(db, seed_weather_codes)
+
+    staging_writer = StagingWriter(db, staging_chunk_size, staging_method, batch_id)
+    pool = None
+    if transform_workers > 1:
+        pool = ProcessPoolExecutor(max_workers=transform_workers, initializer=use_weather_codes,
+                                   initargs=(weather_codes,))
 
-    db.truncate_table("transform.weather_data_import")
-    db.truncate_table("transform.covid_data_import")
+    try:
+        for files, api_type, process_file, error_dir in (
+            (files_weather, "w", process_weather_file, "data/error/weather_data/"),
+            (files_covid, "c", process_covid_file, "data/error/covid_data/")
+        ):
+            for file in files:
+                if file.endswith("." + INDEX_EXTENSION):
+                    process_bundle(file, countries, db, staging_writer,
+                                   transactional=transform_chunk_size > 0)
 
-    for file in files_weather:
-        process_weather_file(file, countries, db)
+            raw_files = [file for file in files if not is_bundle_file(file)]
+            parsed_files = parse_files(raw_files, api_type, countries, pool)
+            if transform_chunk_size > 0:
+                while chunk := list(islice(parsed_files, transform_chunk_size)):
+                    processed_files.update(process_chunk(chunk, process_file, countries, db,
+                                                         staging_writer, error_dir))
+            else:
+                for file, rows in parsed_files:
+                    process_file(file, countries, db, staging_writer, rows, moves)
+                    if staging_writer.is_empty():
+                        processed_files.update(apply_moves(db, moves))
+                staging_writer.flush()
+                processed_files.update(apply_moves(db, moves))
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
 
-    for file in files_covid:
-        process_covid_file(file, countries, db)
+        try:
+            # The rows of the files processed so far are staged and handed to
+            # the load even if the transform is cut short.
+            staging_writer.flush()
+            processed_files.update(apply_moves(db, moves))
+        finally:
+            for dir_name, files in (("data/raw/weather_data", files_weather),
+                                    ("data/raw/covid_data", files_covid)):
+                release_manifest(dir_name, [file for file in files if file not in processed_files])
+            db.complete_staging_batch(batch_id)
 
     db.close_connection()